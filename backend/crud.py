@@ -0,0 +1,181 @@
+"""
+Shared write helpers for the CRUD routers
+
+Every write is a single INSERT/UPDATE/DELETE ... RETURNING statement: the
+returned row is the response, so there is no SELECT before an update to check
+the row exists and no refresh after the commit. A write that matches no row
+is answered with 404. Bulk calls validate the whole payload up front and
+write it with multi-row statements committed as one transaction.
+"""
+import os
+from typing import Any, Dict, List, Sequence, Tuple
+from uuid import UUID
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+from sqlalchemy import cast, column, delete, insert, select, update, values
+from sqlalchemy.orm import Session
+
+from models import Tombstone
+
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "5000"))
+
+
+def parse_id(value: Any, not_found: str) -> UUID:
+    """Path ids that are not UUIDs cannot match a row"""
+    try:
+        return value if isinstance(value, UUID) else UUID(str(value))
+    except ValueError:
+        raise HTTPException(status_code=404, detail=not_found)
+
+
+def create_one(db: Session, model, data: Dict[str, Any]) -> Dict[str, Any]:
+    """INSERT ... RETURNING and commit"""
+    table = model.__table__
+    row = db.execute(insert(table).values(data).returning(*table.c)).mappings().one()
+    db.commit()
+    return dict(row)
+
+
+def update_one(
+    db: Session,
+    model,
+    id_: Any,
+    changes: Dict[str, Any],
+    not_found: str,
+    previous: Sequence[str] = (),
+    commit: bool = True,
+) -> Dict[str, Any]:
+    """UPDATE ... RETURNING and commit; 404 when the row does not exist
+
+    Columns listed in ``previous`` are also returned as ``previous_<name>`` with
+    their value from before the update, read in the same statement. With
+    ``commit=False`` the caller finishes the transaction.
+    """
+    id_ = parse_id(id_, not_found)
+    table = model.__table__
+    if not changes:
+        row = db.execute(select(*table.c).where(table.c.id == id_)).mappings().first()
+    else:
+        stmt = update(table).where(table.c.id == id_).values(changes).returning(*table.c)
+        if previous:
+            # A CTE sees the snapshot from before the update
+            old = select(*[table.c[name] for name in previous]).where(table.c.id == id_).cte("previous")
+            stmt = stmt.returning(*[select(old.c[name]).scalar_subquery().label(f"previous_{name}") for name in previous])
+        row = db.execute(stmt).mappings().first()
+    if row is None:
+        db.rollback()
+        raise HTTPException(status_code=404, detail=not_found)
+    if commit:
+        db.commit()
+    return dict(row)
+
+
+def delete_one(db: Session, model, id_: Any, not_found: str, dependents: Sequence[Any] = ()) -> Dict[str, Any]:
+    """DELETE ... RETURNING and commit; 404 when the row does not exist"""
+    id_ = parse_id(id_, not_found)
+    for dependent in dependents:
+        db.execute(delete(dependent.class_).where(dependent == id_))
+    table = model.__table__
+    row = db.execute(delete(table).where(table.c.id == id_).returning(*table.c)).mappings().first()
+    if row is None:
+        db.rollback()
+        raise HTTPException(status_code=404, detail=not_found)
+    record_tombstones(db, table, [id_])
+    db.commit()
+    return dict(row)
+
+
+def record_tombstones(db: Session, table, ids: Sequence[UUID]):
+    """Remember deletions so /api/sync can report them"""
+    db.execute(insert(Tombstone), [{"resource": table.name, "record_id": i} for i in ids])
+
+
+def check_bulk_size(items: Sequence[Any]):
+    if not items:
+        raise HTTPException(status_code=422, detail="Bulk payload is empty")
+    if len(items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_ITEMS} items per bulk request")
+
+
+def check_unique_ids(ids: Sequence[UUID]):
+    if len(set(ids)) != len(ids):
+        raise HTTPException(status_code=422, detail="Duplicate ids in bulk payload")
+
+
+def reject_missing(db: Session, model, ids: Sequence[UUID], found):
+    """Roll back and answer 404 when a statement did not touch every id"""
+    found = set(found)
+    missing = [str(i) for i in ids if i not in found]
+    if missing:
+        db.rollback()
+        raise HTTPException(status_code=404, detail={"message": f"{model.__name__} not found", "ids": missing})
+
+
+def bulk_create(db: Session, model, items: Sequence[BaseModel]) -> List[Dict[str, Any]]:
+    """Insert all items with multi-row INSERT ... RETURNING in one transaction"""
+    check_bulk_size(items)
+    table = model.__table__
+    rows = db.execute(
+        # Rows come back in payload order - callers pair them with the items they sent
+        insert(table).returning(*table.c, sort_by_parameter_order=True),
+        [item.dict() for item in items],
+    ).mappings().all()
+    db.commit()
+    return [dict(r) for r in rows]
+
+
+def bulk_update(db: Session, model, items: Sequence[BaseModel]) -> List[Dict[str, Any]]:
+    """Apply partial updates keyed by ``id``; one UPDATE ... FROM (VALUES ...) per set of changed fields"""
+    check_bulk_size(items)
+    ids = [item.id for item in items]
+    check_unique_ids(ids)
+    table = model.__table__
+
+    groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+    unchanged: List[UUID] = []
+    for item in items:
+        changes = item.dict(exclude_unset=True)
+        changes.pop("id", None)
+        if not changes:
+            unchanged.append(item.id)
+            continue
+        groups.setdefault(tuple(sorted(changes)), []).append({"id": item.id, **changes})
+
+    updated: Dict[UUID, Dict[str, Any]] = {}
+    for fields, group in groups.items():
+        names = ("id",) + fields
+        data = values(*[column(name, table.c[name].type) for name in names], name="bulk_values").data(
+            [tuple(row[name] for name in names) for row in group]
+        )
+        # VALUES literals are untyped on the server - cast them to the column types. The extra
+        # IN list lets the planner use the primary key instead of hashing the whole table
+        stmt = (
+            update(table)
+            .where(table.c.id == cast(data.c.id, table.c.id.type), table.c.id.in_([row["id"] for row in group]))
+            .values({name: cast(data.c[name], table.c[name].type) for name in fields})
+            .returning(*table.c)
+        )
+        for row in db.execute(stmt).mappings():
+            updated[row["id"]] = dict(row)
+    if unchanged:
+        for row in db.execute(select(*table.c).where(table.c.id.in_(unchanged))).mappings():
+            updated[row["id"]] = dict(row)
+    # Existence is checked from RETURNING rather than with an extra lookup first
+    reject_missing(db, model, ids, updated)
+    db.commit()
+    return [updated[item.id] for item in items]
+
+
+def bulk_delete(db: Session, model, ids: Sequence[UUID], dependents: Sequence[Any] = ()) -> int:
+    """Delete all ``ids`` (and rows of ``dependents`` columns pointing at them) in one transaction"""
+    check_bulk_size(ids)
+    check_unique_ids(ids)
+    for dependent in dependents:
+        db.execute(delete(dependent.class_).where(dependent.in_(ids)))
+    table = model.__table__
+    deleted = db.execute(delete(table).where(table.c.id.in_(ids)).returning(table.c.id)).scalars().all()
+    reject_missing(db, model, ids, deleted)
+    record_tombstones(db, table, deleted)
+    db.commit()
+    return len(deleted)
@@ -2,9 +2,12 @@
 Database configuration and utilities
 """
 import os
+import time
+from functools import lru_cache
+from fastapi import Request, Response
 from sqlalchemy import create_engine, MetaData
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from dotenv import load_dotenv
 import logging
 
@@ -22,11 +25,52 @@ if not DATABASE_URL:
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Optional streaming replica for GET handlers and analytics
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+replica_engine = create_engine(DATABASE_REPLICA_URL, pool_pre_ping=True) if DATABASE_REPLICA_URL else None
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine) if replica_engine else None
+
+# After a write the client keeps reading from the primary until the replica has caught up.
+# The write time goes out as a response header the frontend echoes back (cross-origin
+# requests carry no cookies) and as a cookie for same-origin clients.
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+LAST_WRITE_HEADER = "X-Last-Write"
+LAST_WRITE_COOKIE = "pb_last_write"
+
 Base = declarative_base()
 
-def get_db():
-    """Get database session"""
-    db = SessionLocal()
+def _wrote_recently(request: Request) -> bool:
+    try:
+        last_write = request.headers.get(LAST_WRITE_HEADER) or request.cookies.get(LAST_WRITE_COOKIE) or 0
+        return time.time() - float(last_write) < READ_YOUR_WRITES_SECONDS
+    except ValueError:
+        return False
+
+def _session_for_read(request: Request) -> Session:
+    if ReplicaSessionLocal is None or _wrote_recently(request):
+        return SessionLocal()
+    return ReplicaSessionLocal()
+
+def get_db(request: Request, response: Response):
+    """Get database session - replica for GET/HEAD requests, primary for writes"""
+    if request.method in ("GET", "HEAD"):
+        db = _session_for_read(request)
+    else:
+        db = SessionLocal()
+        if replica_engine is not None:
+            written_at = f"{time.time():.3f}"
+            response.headers[LAST_WRITE_HEADER] = written_at
+            response.set_cookie(
+                LAST_WRITE_COOKIE, written_at, max_age=int(READ_YOUR_WRITES_SECONDS) + 1, httponly=True
+            )
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_read_db(request: Request):
+    """Get a read-only session for analytics that are not GET requests"""
+    db = _session_for_read(request)
     try:
         yield db
     finally:
@@ -55,12 +99,53 @@ def init_db():
     """Initialize database tables"""
     try:
         # Import all models to ensure they are registered
-        from models import Category, Income, Expense, Investment, SavingsGoal, SavingsTransaction
+        from models import Category, Income, Expense, Investment, SavingsGoal, SavingsTransaction, ExpenseAnomaly, JobWatermark, Tombstone, PriceHistory
         
         # Create all tables
         Base.metadata.create_all(bind=engine)
+        upgrade_schema()
         logger.info("Database tables created successfully")
         
     except Exception as e:
         logger.error(f"Failed to create database tables: {e}")
-        raise
\ No newline at end of file
+        raise
+
+# Columns added after the initial schema - create_all() does not alter existing tables
+SCHEMA_UPGRADES = [
+    "ALTER TABLE investments ADD COLUMN IF NOT EXISTS currency VARCHAR(3)",
+    "CREATE INDEX IF NOT EXISTS ix_expenses_created_at ON expenses (created_at)",
+    # Expense search: keyset order, full-text and trigram (needs the pg_trgm extension)
+    "CREATE INDEX IF NOT EXISTS ix_expenses_date_id ON expenses (date DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS ix_expenses_description_fts ON expenses USING gin (to_tsvector('simple', description))",
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_expenses_description_trgm ON expenses USING gin (description gin_trgm_ops)",
+    # Change tracking for /api/sync - a constant default keeps ADD COLUMN from rewriting the table
+] + [
+    statement
+    for table in ("categories", "incomes", "expenses", "investments", "savings_goals")
+    for statement in (
+        f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc')",
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_updated_at ON {table} (updated_at)",
+    )
+]
+
+def upgrade_schema():
+    """Apply additive schema changes to existing PostgreSQL databases"""
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as conn:
+        for statement in SCHEMA_UPGRADES:
+            try:
+                with conn.begin_nested():
+                    conn.exec_driver_sql(statement)
+            except Exception as e:
+                # e.g. an extension that is not installed on the server
+                logger.warning(f"Skipping schema upgrade '{statement}': {e}")
+
+@lru_cache(maxsize=None)
+def has_extension(name: str) -> bool:
+    """Check whether a PostgreSQL extension is installed in the database"""
+    if engine.dialect.name != "postgresql":
+        return False
+    with engine.connect() as conn:
+        return conn.exec_driver_sql("SELECT 1 FROM pg_extension WHERE extname = %(name)s", {"name": name}).first() is not None
@@ -2,48 +2,108 @@
 Personal Budget Management API - FastAPI Application
 Main application entry point
 """
-from fastapi import FastAPI
+import time
+
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, Header, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
+import asyncio
 import logging
+from typing import Optional
 
-from database import init_db, create_database_if_not_exists
-from services.price_service import PriceService
+import startup
+from profiler import ProfilerMiddleware, profiler
+from tracing import TracingMiddleware, instrument_sqlalchemy, tracer
+from database import LAST_WRITE_HEADER, init_db, create_database_if_not_exists
+from services.broadcaster import broadcaster
+from services.crypto_feed import crypto_feed
+from services import partitioning
+from services.anomaly_service import anomaly_service
+from services.categorizer import categorizer
+from services.price_service import price_service
+from services.symbol_index import symbol_index
+from routers import categories, incomes, expenses, investments, savings, ai, prices, crypto, stream, portfolio, forecast, sync
 
-# Make price_service globally available
-price_service = PriceService()
-from routers import categories, incomes, expenses, investments, savings, ai, prices, crypto
+startup.timings["import:app"] = round(time.perf_counter() - _import_started, 4)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
 
+async def _startup_price_refresh():
+    """First price refresh - only on the elected worker"""
+    if not price_service.leader.check():
+        logger.info("Another worker leads price refreshes, skipping startup update")
+        startup.state["first_price_refresh"] = "skipped"
+        return
+    with startup.phase("first_price_refresh"):
+        await price_service.update_investment_prices()
+    startup.state["first_price_refresh"] = "done"
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan management"""
     # Startup
     logger.info("Starting Personal Budget Management API...")
     
-    # Create database if it doesn't exist
-    create_database_if_not_exists()
+    with startup.phase("database"):
+        # Create database if it doesn't exist
+        create_database_if_not_exists()
+        
+        # Initialize database tables
+        init_db()
+        
+        # Monthly partitions of expenses (EXPENSE_PARTITIONING=1)
+        partitioning.setup()
     
-    # Initialize database tables
-    init_db()
+    with startup.phase("symbol_index"):
+        # Build the local symbol search index
+        symbol_index.load()
     
-    # Start price update scheduler
-    price_service.start_scheduler()
+    with startup.phase("background_services"):
+        tracer.start()
+        
+        # Price updates are pushed to streaming clients from scheduler threads
+        # and, through LISTEN/NOTIFY, from the worker leading the refresh
+        broadcaster.bind_loop(asyncio.get_running_loop())
+        broadcaster.start_relay()
+        
+        # Start price update scheduler
+        price_service.start_scheduler()
+        
+        # Flag unusual expenses added since the last scan
+        anomaly_service.start_scheduler()
+        
+        # Start streaming crypto quotes into the in-memory quote book
+        crypto_feed.start()
     
-    # Update prices on startup
-    await price_service.update_investment_prices()
+    if startup.FAST_STARTUP:
+        # Serve traffic right away, refresh prices (and import yfinance/pandas) in the background
+        refresh_task = asyncio.create_task(_startup_price_refresh())
+    else:
+        refresh_task = None
+        await _startup_price_refresh()
     
+    startup.state["ready"] = True
     logger.info("Application startup completed")
     
     yield
     
     # Shutdown
     logger.info("Shutting down application...")
+    startup.state["ready"] = False
+    if refresh_task and not refresh_task.done():
+        refresh_task.cancel()
+    await crypto_feed.stop()
     price_service.stop_scheduler()
+    anomaly_service.stop_scheduler()
+    broadcaster.stop_relay()
+    categorizer.save_if_dirty()
+    tracer.stop()
 
 # Create FastAPI application
 app = FastAPI(
@@ -60,8 +120,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Read by the frontend to route its next reads to the primary
+    expose_headers=[LAST_WRITE_HEADER],
 )
 
+# Opt-in per-request stack sampling (PROFILE_TOKEN header or PROFILE_SAMPLE_RATE)
+app.add_middleware(ProfilerMiddleware)
+
+# Request, SQL, upstream and job spans (TRACING_ENABLED=1)
+if tracer.enabled:
+    instrument_sqlalchemy()
+app.add_middleware(TracingMiddleware)
+
 # Include routers
 app.include_router(categories.router, prefix="/api", tags=["categories"])
 app.include_router(incomes.router, prefix="/api", tags=["incomes"])
@@ -71,6 +141,10 @@ app.include_router(savings.router, prefix="/api", tags=["savings"])
 app.include_router(ai.router, prefix="/api", tags=["ai"])
 app.include_router(prices.router, prefix="/api", tags=["prices"])
 app.include_router(crypto.router, prefix="/api", tags=["crypto"])
+app.include_router(stream.router, prefix="/api", tags=["stream"])
+app.include_router(portfolio.router, prefix="/api", tags=["portfolio"])
+app.include_router(forecast.router, prefix="/api", tags=["forecast"])
+app.include_router(sync.router, prefix="/api", tags=["sync"])
 
 # Health check endpoint
 @app.get("/", tags=["health"])
@@ -78,6 +152,48 @@ def health_check():
     """Health check endpoint"""
     return {"status": "ok", "message": "Personal Budget Management API"}
 
+@app.get("/livez", tags=["health"])
+def liveness():
+    """Liveness probe - the process is up"""
+    return {"status": "ok"}
+
+@app.get("/readyz", tags=["health"])
+def readiness():
+    """Readiness probe with startup phase and import timings"""
+    body = {
+        "status": "ready" if startup.state["ready"] else "starting",
+        "fast_startup": startup.FAST_STARTUP,
+        "first_price_refresh": startup.state["first_price_refresh"],
+        "timings": startup.timings,
+    }
+    return JSONResponse(status_code=200 if startup.state["ready"] else 503, content=body)
+
+@app.get("/debug/tracing", tags=["debug"])
+def tracing_status():
+    """Tracing exporter state"""
+    return tracer.status()
+
+@app.get("/debug/profiler", tags=["debug"])
+def profiler_status():
+    """Request profiler settings and the most recent profiles"""
+    return profiler.status()
+
+@app.put("/debug/profiler", tags=["debug"])
+def configure_profiler(
+    sample_rate: float = Query(..., ge=0, le=1, description="Fraction of requests to profile"),
+    x_profile: Optional[str] = Header(None, description="PROFILE_TOKEN"),
+):
+    """Change the request profiler sampling rate without a restart
+
+    Requires ``X-Profile: <PROFILE_TOKEN>``. The rate changes only in the
+    worker that serves the request (its ``pid`` is in the response); with
+    several workers set PROFILE_SAMPLE_RATE instead.
+    """
+    if not profiler.authorized(x_profile):
+        raise HTTPException(status_code=403, detail="Profiler control requires the X-Profile token")
+    profiler.configure(sample_rate=sample_rate)
+    return profiler.status()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -1,7 +1,7 @@
 """
 SQLAlchemy database models
 """
-from sqlalchemy import Column, String, DateTime, Boolean, Text, Integer, ForeignKey
+from sqlalchemy import Column, String, DateTime, Boolean, Text, Integer, Float, ForeignKey, UniqueConstraint
 from sqlalchemy.types import DECIMAL
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
@@ -17,6 +17,7 @@ class Category(Base):
     color = Column(String(7), nullable=False)  # Hex color code
     budget = Column(DECIMAL(10, 2), nullable=False, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
 class Income(Base):
     __tablename__ = "incomes"
@@ -27,6 +28,7 @@ class Income(Base):
     frequency = Column(String(50), nullable=False)  # monthly, weekly, one-time
     date = Column(String(10), nullable=False)  # YYYY-MM-DD format
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
 class Expense(Base):
     __tablename__ = "expenses"
@@ -37,6 +39,7 @@ class Expense(Base):
     category_id = Column(UUID(as_uuid=True), nullable=False)
     date = Column(String(10), nullable=False)  # YYYY-MM-DD format
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
 class Investment(Base):
     __tablename__ = "investments"
@@ -48,8 +51,10 @@ class Investment(Base):
     quantity = Column(DECIMAL(15, 8), nullable=False)
     purchase_price = Column(DECIMAL(10, 2), nullable=False)
     current_price = Column(DECIMAL(10, 2), nullable=True)
+    currency = Column(String(3), nullable=True)  # Quote currency, e.g. USD, PLN, GBp
     purchase_date = Column(String(10), nullable=False)  # YYYY-MM-DD format
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
 class SavingsGoal(Base):
     __tablename__ = "savings_goals"
@@ -63,6 +68,7 @@ class SavingsGoal(Base):
     color = Column(String(7), nullable=False)  # Hex color code
     is_completed = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
 
 class SavingsTransaction(Base):
@@ -75,3 +81,46 @@ class SavingsTransaction(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
     goal = relationship("SavingsGoal", backref="transactions")
+
+
+class ExpenseAnomaly(Base):
+    __tablename__ = "expense_anomalies"
+    __table_args__ = (UniqueConstraint("expense_id", "kind"),)
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    expense_id = Column(UUID(as_uuid=True), ForeignKey("expenses.id", ondelete="CASCADE"), nullable=False)
+    category_id = Column(UUID(as_uuid=True), nullable=False)
+    kind = Column(String(20), nullable=False, index=True)  # spike, duplicate, new_merchant
+    score = Column(Float, nullable=False)
+    detail = Column(String(255), nullable=False)
+    date = Column(String(10), nullable=False, index=True)  # YYYY-MM-DD format
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class JobWatermark(Base):
+    """Progress marker of incremental background jobs"""
+    __tablename__ = "job_watermarks"
+
+    name = Column(String(100), primary_key=True)
+    watermark = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class Tombstone(Base):
+    """Deleted rows, kept for a while so clients can sync deletions"""
+    __tablename__ = "tombstones"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    resource = Column(String(50), nullable=False)  # table name of the deleted row
+    record_id = Column(UUID(as_uuid=True), nullable=False)
+    deleted_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+class PriceHistory(Base):
+    """Daily closes per symbol, in the symbol's quote currency"""
+    __tablename__ = "price_history"
+
+    symbol = Column(String(20), primary_key=True)
+    date = Column(String(10), primary_key=True)  # YYYY-MM-DD format
+    close = Column(Float, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,240 @@
+"""
+Opt-in sampling profiler for individual requests
+
+A profiled request gets a sampler thread that snapshots every thread's Python
+stack every PROFILE_INTERVAL_MS and counts the folded stacks. Idle threads
+(event loop waiting in select, pool workers waiting for work) are dropped, so
+what remains is the request's handler, its SQL (psycopg2 calls under
+SQLAlchemy's execute) and upstream HTTP calls, plus anything running
+concurrently. The result is written in the collapsed-stack format read by
+flamegraph.pl and speedscope.
+
+Requests are profiled when they carry ``X-Profile: <PROFILE_TOKEN>`` or are
+picked at PROFILE_SAMPLE_RATE; with neither configured the middleware is a
+couple of attribute checks per request. The sampling rate set at runtime
+applies to the worker process that handled the change only. Sampling ends
+after PROFILE_MAX_SECONDS even if the request goes on (price streams): the
+profile is written and its concurrency slot freed right then.
+"""
+import asyncio
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", str(Path(__file__).resolve().parent / "data" / "profiles"))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Requests with this value in the X-Profile header are always profiled; empty disables the header
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "30"))
+PROFILE_MAX_CONCURRENT = int(os.getenv("PROFILE_MAX_CONCURRENT", "2"))
+# Oldest profiles are deleted once the directory grows past this
+PROFILE_MAX_BYTES = int(os.getenv("PROFILE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+_APP_ROOT = str(Path(__file__).resolve().parent)
+_IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+}
+_PATH_RE = re.compile(r"[^A-Za-z0-9]+")
+
+
+def _frame_label(code) -> str:
+    filename = code.co_filename
+    if filename.startswith(_APP_ROOT):
+        filename = filename[len(_APP_ROOT) + 1:]
+    else:
+        # Library frames: keep the package-relative part of the path
+        marker = filename.rfind("site-packages/")
+        filename = filename[marker + 14:] if marker >= 0 else os.path.basename(filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Counts folded stacks of all other threads until stopped or out of time
+
+    ``on_done`` is called with the counts from the sampler thread when sampling ends.
+    """
+
+    def __init__(self, interval: float, max_seconds: float, on_done: Optional[Callable[[Counter], None]] = None):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.on_done = on_done
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.counts
+
+    def _run(self):
+        try:
+            self._sample()
+        finally:
+            if self.on_done is not None:
+                self.on_done(self.counts)
+
+    def _sample(self):
+        own = threading.get_ident()
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                leaf = frame.f_code
+                stack = []
+                in_app = False
+                while frame is not None:
+                    code = frame.f_code
+                    in_app = in_app or code.co_filename.startswith(_APP_ROOT)
+                    stack.append(_frame_label(code))
+                    frame = frame.f_back
+                # Threads parked outside application code are idle, not part of the request
+                if not in_app and (os.path.basename(leaf.co_filename), leaf.co_name) in _IDLE_LEAVES:
+                    continue
+                stack.append(names.get(ident, str(ident)))
+                self.counts[";".join(reversed(stack))] += 1
+
+
+class RequestProfiler:
+    def __init__(self):
+        self.directory = Path(PROFILE_DIR)
+        self.sample_rate = PROFILE_SAMPLE_RATE
+        self.token = PROFILE_TOKEN
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def authorized(self, token: Optional[str]) -> bool:
+        """Whether ``token`` may change the profiler - never without PROFILE_TOKEN"""
+        return bool(self.token) and token == self.token
+
+    def configure(self, sample_rate: Optional[float] = None):
+        """Change this worker's sampling rate at runtime (0 turns random sampling off)"""
+        if sample_rate is not None:
+            self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+            logger.info(f"Request profiler sample rate set to {self.sample_rate}")
+
+    def should_profile(self, scope) -> bool:
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == b"x-profile":
+                    return value.decode("latin-1") == self.token
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def begin(self, profile_id: str) -> Optional[StackSampler]:
+        with self._lock:
+            if self._active >= PROFILE_MAX_CONCURRENT:
+                return None
+            self._active += 1
+        sampler = StackSampler(
+            PROFILE_INTERVAL_MS / 1000, PROFILE_MAX_SECONDS, on_done=lambda counts: self._write(counts, profile_id)
+        )
+        sampler.start()
+        return sampler
+
+    def finish(self, sampler: StackSampler):
+        """Stop sampling at the end of the request (the profile may already be written)"""
+        sampler.stop()
+
+    def _write(self, counts: Counter, profile_id: str):
+        # On the sampler thread: at the end of the request or at PROFILE_MAX_SECONDS, whichever is first
+        with self._lock:
+            self._active -= 1
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.directory / f"{profile_id}.folded"
+            with open(path, "w") as f:
+                for stack, count in counts.most_common():
+                    f.write(f"{stack} {count}\n")
+            self._enforce_size_cap()
+        except OSError as e:
+            logger.error(f"Failed to write profile {profile_id}: {e}")
+
+    @staticmethod
+    def profile_id(method: str, path: str) -> str:
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        return f"{stamp}_{method}_{_PATH_RE.sub('_', path).strip('_')[:80] or 'root'}"
+
+    def _files(self):
+        if not self.directory.is_dir():
+            return []
+        return sorted(self.directory.glob("*.folded"), key=lambda p: p.name)
+
+    def _enforce_size_cap(self):
+        files = self._files()
+        total = sum(f.stat().st_size for f in files)
+        for f in files:
+            if total <= PROFILE_MAX_BYTES:
+                break
+            total -= f.stat().st_size
+            f.unlink(missing_ok=True)
+
+    def status(self) -> Dict[str, Any]:
+        files = self._files()
+        return {
+            "pid": os.getpid(),
+            "sample_rate": self.sample_rate,
+            "header_enabled": bool(self.token),
+            "interval_ms": PROFILE_INTERVAL_MS,
+            "active": self._active,
+            "directory": str(self.directory),
+            "size_bytes": sum(f.stat().st_size for f in files),
+            "max_bytes": PROFILE_MAX_BYTES,
+            "recent": [f.name for f in files[-20:]],
+        }
+
+
+profiler = RequestProfiler()
+
+
+class ProfilerMiddleware:
+    """ASGI middleware that profiles the requests picked by ``profiler``"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (profiler.sample_rate or profiler.token) or not profiler.should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+        profile_id = profiler.profile_id(scope["method"], scope["path"])
+        sampler = profiler.begin(profile_id)
+        if sampler is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_header)
+        finally:
+            # Joins the sampler thread, which writes the file - keep it off the event loop
+            await asyncio.to_thread(profiler.finish, sampler)
+            logger.info(
+                f"Profiled {scope['method']} {scope['path']} in {(time.perf_counter() - started) * 1000:.1f} ms "
+                f"({sampler.samples} samples) -> {profile_id}.folded"
+            )
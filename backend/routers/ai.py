@@ -5,7 +5,7 @@ from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 from typing import Dict, Any
 
-from database import get_db
+from database import get_db, get_read_db
 from services.ai_service import AIService
 from schemas import RiskAnalysisResponse, AIAnalysisResponse, CustomQueryRequest
 
@@ -23,7 +23,7 @@ def get_budget_analysis(db: Session = Depends(get_db)):
     return ai_service.analyze_budget(db)
 
 @router.post("/ai/custom-query")
-def custom_ai_query(request: CustomQueryRequest, db: Session = Depends(get_db)):
+def custom_ai_query(request: CustomQueryRequest, db: Session = Depends(get_read_db)):
     """Process custom AI query"""
     response = ai_service.generate_custom_analysis(request.query, db)
     return {"response": response}
@@ -5,9 +5,10 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
 
+from crud import bulk_create, bulk_delete, bulk_update, create_one, delete_one, update_one
 from database import get_db
 from models import Category
-from schemas import CategoryCreate, CategoryUpdate, Category as CategorySchema
+from schemas import BulkDeleteRequest, CategoryCreate, CategoryUpdate, CategoryBulkUpdate, Category as CategorySchema
 
 router = APIRouter()
 
@@ -19,11 +20,23 @@ def get_categories(db: Session = Depends(get_db)):
 @router.post("/categories", response_model=CategorySchema)
 def create_category(category: CategoryCreate, db: Session = Depends(get_db)):
     """Create a new category"""
-    db_category = Category(**category.dict())
-    db.add(db_category)
-    db.commit()
-    db.refresh(db_category)
-    return db_category
+    return create_one(db, Category, category.dict())
+
+@router.post("/categories/bulk", response_model=List[CategorySchema])
+def create_categories_bulk(categories: List[CategoryCreate], db: Session = Depends(get_db)):
+    """Create many categories in one transaction"""
+    return bulk_create(db, Category, categories)
+
+@router.put("/categories/bulk", response_model=List[CategorySchema])
+def update_categories_bulk(categories: List[CategoryBulkUpdate], db: Session = Depends(get_db)):
+    """Update many categories in one transaction"""
+    return bulk_update(db, Category, categories)
+
+@router.delete("/categories/bulk")
+def delete_categories_bulk(request: BulkDeleteRequest, db: Session = Depends(get_db)):
+    """Delete many categories in one transaction"""
+    deleted = bulk_delete(db, Category, request.ids)
+    return {"message": f"Deleted {deleted} categories", "deleted": deleted}
 
 @router.get("/categories/{category_id}", response_model=CategorySchema)
 def get_category(category_id: str, db: Session = Depends(get_db)):
@@ -36,24 +49,10 @@ def get_category(category_id: str, db: Session = Depends(get_db)):
 @router.put("/categories/{category_id}", response_model=CategorySchema)
 def update_category(category_id: str, category: CategoryUpdate, db: Session = Depends(get_db)):
     """Update a category"""
-    db_category = db.query(Category).filter(Category.id == category_id).first()
-    if not db_category:
-        raise HTTPException(status_code=404, detail="Category not found")
-    
-    for field, value in category.dict(exclude_unset=True).items():
-        setattr(db_category, field, value)
-    
-    db.commit()
-    db.refresh(db_category)
-    return db_category
+    return update_one(db, Category, category_id, category.dict(exclude_unset=True), "Category not found")
 
 @router.delete("/categories/{category_id}")
 def delete_category(category_id: str, db: Session = Depends(get_db)):
     """Delete a category"""
-    db_category = db.query(Category).filter(Category.id == category_id).first()
-    if not db_category:
-        raise HTTPException(status_code=404, detail="Category not found")
-    
-    db.delete(db_category)
-    db.commit()
+    delete_one(db, Category, category_id, "Category not found")
     return {"message": "Category deleted successfully"}
\ No newline at end of file
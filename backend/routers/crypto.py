@@ -2,34 +2,66 @@ import os
 import time
 import hmac
 import hashlib
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 
 import requests
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
+
+from services.broadcaster import broadcaster
+from services.crypto_feed import crypto_feed, quote_book
+from services.downsampling import lttb, ohlc_buckets
+from services.fx_service import fx_service
+from services.upstream import UpstreamUnavailable, binance
 
 router = APIRouter()
 
 BINANCE_API_URL = "https://api.binance.com"
+# Balances are priced against this asset; it has no pair of its own
+QUOTE_ASSET = "USDT"
 
 
 def _sign_query(query: str, secret_key: str) -> str:
     return hmac.new(secret_key.encode(), query.encode(), hashlib.sha256).hexdigest()
 
 
+def _binance_get(path: str, params: Dict[str, Any], key: str, ttl: float = 0,
+                 headers: Optional[Dict[str, str]] = None) -> Tuple[int, Any]:
+    """GET a Binance endpoint through the shared upstream client.
+
+    Server errors and timeouts trip the circuit breaker, client errors
+    (e.g. an unknown symbol) are returned to the caller as they are.
+    """
+    def fetch():
+        res = requests.get(f"{BINANCE_API_URL}{path}", params=params, headers=headers, timeout=10)
+        if res.status_code >= 500:
+            res.raise_for_status()
+        return res.status_code, res.json()
+
+    return binance.call(key, fetch, ttl=ttl)
+
+
 def _get_usdt_to_pln_rate() -> float:
-    """Fetch current USDT to PLN conversion rate."""
+    """Current USDT to PLN conversion rate from the shared FX cache."""
     try:
-        res = requests.get(
-            f"{BINANCE_API_URL}/api/v3/ticker/price",
-            params={"symbol": "USDTPLN"},
-            timeout=10,
-        )
-        res.raise_for_status()
-        return float(res.json().get("price", 0))
+        return fx_service.get_rate("USDT", "PLN")
     except Exception:
         return 0.0
 
 
+def _get_ticker_24h(symbol: str) -> Tuple[float, float]:
+    """Fetch last price and 24h change over REST when the quote book has no fresh quote."""
+    try:
+        status, tdata = _binance_get("/api/v3/ticker/24hr", {"symbol": symbol}, f"ticker24h:{symbol}", ttl=10)
+    except UpstreamUnavailable:
+        return 0.0, 0.0
+    if status != 200:
+        return 0.0, 0.0
+    price = float(tdata.get("lastPrice", 0))
+    change = float(tdata.get("priceChange", 0))
+    broadcaster.publish(symbol, price, source="binance", change_24h=change)
+    return price, change
+
+
 @router.get("/crypto/binance")
 def get_binance_balances() -> Dict[str, Any]:
     """Return spot balances from Binance with 24h profit/loss in USDT and PLN."""
@@ -43,36 +75,41 @@ def get_binance_balances() -> Dict[str, Any]:
     signature = _sign_query(query, secret_key)
 
     headers = {"X-MBX-APIKEY": api_key}
-    account_res = requests.get(
-        f"{BINANCE_API_URL}/api/v3/account",
-        params={"timestamp": timestamp, "signature": signature},
-        headers=headers,
-        timeout=10,
-    )
-    account_res.raise_for_status()
-    account = account_res.json()
+    try:
+        status, account = _binance_get(
+            "/api/v3/account",
+            {"timestamp": timestamp, "signature": signature},
+            # Per account without putting the key itself into caches, logs or traces
+            f"account:{hashlib.sha256(api_key.encode()).hexdigest()[:16]}",
+            ttl=5,
+            headers=headers,
+        )
+    except UpstreamUnavailable as exc:
+        raise HTTPException(status_code=503, detail=str(exc))
+    if status != 200:
+        raise HTTPException(status_code=502, detail=account.get("msg", "Binance account request failed"))
 
     usdt_pln = _get_usdt_to_pln_rate()
 
-    balances: List[Dict[str, Any]] = []
+    held = []
     for bal in account.get("balances", []):
         total = float(bal.get("free", 0)) + float(bal.get("locked", 0))
-        if total <= 0:
-            continue
-        asset = bal["asset"]
-        symbol = f"{asset}USDT"
-        ticker_res = requests.get(
-            f"{BINANCE_API_URL}/api/v3/ticker/24hr",
-            params={"symbol": symbol},
-            timeout=10,
-        )
-        if ticker_res.status_code != 200:
-            price = 0.0
-            change = 0.0
+        if total > 0:
+            held.append((bal["asset"], total))
+    # Stream the held assets from now on
+    crypto_feed.watch(f"{asset}{QUOTE_ASSET}" for asset, _ in held if asset != QUOTE_ASSET)
+
+    balances: List[Dict[str, Any]] = []
+    for asset, total in held:
+        symbol = f"{asset}{QUOTE_ASSET}"
+        quote = quote_book.get(symbol)
+        if asset == QUOTE_ASSET:
+            price, change = 1.0, 0.0
+        elif quote is not None:
+            price = quote.price
+            change = quote.change_24h
         else:
-            tdata = ticker_res.json()
-            price = float(tdata.get("lastPrice", 0))
-            change = float(tdata.get("priceChange", 0))
+            price, change = _get_ticker_24h(symbol)
         value = total * price
         pnl_24h = change * total
         balances.append(
@@ -91,20 +128,32 @@ def get_binance_balances() -> Dict[str, Any]:
     return {"balances": balances, "usdt_pln": usdt_pln}
 
 
+@router.get("/crypto/quotes")
+def get_crypto_quotes() -> Dict[str, Any]:
+    """Return the streaming quote book and feed status."""
+    return {"feed": crypto_feed.status(), "quotes": quote_book.snapshot()}
+
+
 @router.get("/crypto/binance/klines/{symbol}")
-def get_binance_klines(symbol: str, interval: str = "1h", limit: int = 168) -> Dict[str, Any]:
-    """Return candlestick data for a symbol."""
+def get_binance_klines(
+    symbol: str,
+    interval: str = "1h",
+    limit: int = 168,
+    max_points: Optional[int] = Query(None, ge=3, le=5000, description="Downsample to at most this many points"),
+    method: str = Query("ohlc", pattern="^(ohlc|lttb)$", description="ohlc merges candles, lttb keeps shape-defining candles"),
+) -> Dict[str, Any]:
+    """Return candlestick data for a symbol, optionally downsampled for charting."""
     try:
-        res = requests.get(
-            f"{BINANCE_API_URL}/api/v3/klines",
-            params={"symbol": symbol, "interval": interval, "limit": limit},
-            timeout=10,
+        status, data = _binance_get(
+            "/api/v3/klines",
+            {"symbol": symbol, "interval": interval, "limit": limit},
+            f"klines:{symbol}:{interval}:{limit}",
+            ttl=30,
         )
-        res.raise_for_status()
-    except Exception as exc:
-        raise HTTPException(status_code=502, detail=str(exc))
-
-    data = res.json()
+    except UpstreamUnavailable as exc:
+        raise HTTPException(status_code=503, detail=str(exc))
+    if status != 200:
+        raise HTTPException(status_code=502, detail=data.get("msg", "Binance klines request failed"))
     klines = [
         {
             "open_time": k[0],
@@ -115,4 +164,9 @@ def get_binance_klines(symbol: str, interval: str = "1h", limit: int = 168) -> D
         }
         for k in data
     ]
+    if max_points and len(klines) > max_points:
+        if method == "lttb":
+            klines = lttb(klines, "open_time", "close", max_points)
+        else:
+            klines = ohlc_buckets(klines, max_points)
     return {"klines": klines}
\ No newline at end of file
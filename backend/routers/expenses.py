@@ -1,13 +1,32 @@
 """
 Expenses API router
 """
+import base64
+import csv
+import io
+import re
+from datetime import date
+from decimal import Decimal
+from uuid import UUID
+
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, or_, tuple_
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
-from database import get_db
-from models import Expense
-from schemas import ExpenseCreate, ExpenseUpdate, Expense as ExpenseSchema
+from crud import bulk_create, bulk_delete, bulk_update, create_one, delete_one, update_one
+from database import get_db, has_extension
+from models import Expense, ExpenseAnomaly
+from projection import fields_response, parse_fields, select_fields
+from schemas import (
+    BulkDeleteRequest, ExpenseCreate, ExpenseUpdate, ExpenseBulkUpdate, Expense as ExpenseSchema, ExpenseAnomaly as ExpenseAnomalySchema,
+    CategorizeRequest, CategoryPrediction, ExpenseSearchPage
+)
+from services import partitioning
+from services.anomaly_service import anomaly_service
+from services.archive import archive_service
+from services.categorizer import categorizer
 
 router = APIRouter()
 
@@ -15,30 +34,242 @@ router = APIRouter()
 def get_expenses(
     year: Optional[int] = Query(None, description="Filter by year"),
     month: Optional[int] = Query(None, description="Filter by month"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. date,amount,categoryId"),
     db: Session = Depends(get_db)
 ):
-    """Get all expenses with optional year/month filtering"""
-    query = db.query(Expense)
+    """Get all expenses with optional year/month filtering, archived months included"""
+    criteria = []
+    date_from = date_to = None
     
+    # Half-open date ranges (rather than LIKE) let PostgreSQL prune monthly partitions
     if year and month:
-        # Filter by YYYY-MM format in date string
-        date_prefix = f"{year:04d}-{month:02d}"
-        query = query.filter(Expense.date.like(f"{date_prefix}%"))
+        next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+        criteria = [
+            Expense.date >= f"{year:04d}-{month:02d}-01",
+            Expense.date < f"{next_year:04d}-{next_month:02d}-01",
+        ]
+        date_from, date_to = f"{year:04d}-{month:02d}-01", f"{year:04d}-{month:02d}-31"
     elif year:
-        # Filter by year only
-        date_prefix = f"{year:04d}"
-        query = query.filter(Expense.date.like(f"{date_prefix}%"))
+        criteria = [Expense.date >= f"{year:04d}-01-01", Expense.date < f"{year + 1:04d}-01-01"]
+        date_from, date_to = f"{year:04d}-01-01", f"{year:04d}-12-31"
+    
+    if archive_service.has_rows("expenses", date_from, date_to):
+        rows = list(archive_service.iter_rows(db, "expenses", date_from, date_to))
+        if fields:
+            return fields_response(ExpenseSchema, parse_fields(Expense, ExpenseSchema, fields), rows)
+        return rows
     
-    return query.all()
+    if fields:
+        return select_fields(db, Expense, ExpenseSchema, fields, *criteria)
+    return db.query(Expense).filter(*criteria).all()
 
 @router.post("/expenses", response_model=ExpenseSchema)
 def create_expense(expense: ExpenseCreate, db: Session = Depends(get_db)):
     """Create a new expense"""
-    db_expense = Expense(**expense.dict())
-    db.add(db_expense)
-    db.commit()
-    db.refresh(db_expense)
-    return db_expense
+    created = create_one(db, Expense, expense.dict())
+    categorizer.learn(created["description"], created["category_id"])
+    return created
+
+@router.post("/expenses/bulk", response_model=List[ExpenseSchema])
+def create_expenses_bulk(expenses: List[ExpenseCreate], db: Session = Depends(get_db)):
+    """Create many expenses in one transaction"""
+    created = bulk_create(db, Expense, expenses)
+    categorizer.learn_many([(e["description"], e["category_id"], None) for e in created])
+    return created
+
+@router.put("/expenses/bulk", response_model=List[ExpenseSchema])
+def update_expenses_bulk(expenses: List[ExpenseBulkUpdate], db: Session = Depends(get_db)):
+    """Update many expenses in one transaction"""
+    recategorized = [e.id for e in expenses if e.category_id is not None]
+    previous = dict(
+        db.query(Expense.id, Expense.category_id).filter(Expense.id.in_(recategorized)).all()
+    ) if recategorized else {}
+    updated = bulk_update(db, Expense, expenses)
+    # Learn from manual recategorization
+    categorizer.learn_many([
+        (e["description"], e["category_id"], previous[e["id"]])
+        for e in updated
+        if e["id"] in previous and e["category_id"] != previous[e["id"]]
+    ])
+    return updated
+
+@router.delete("/expenses/bulk")
+def delete_expenses_bulk(request: BulkDeleteRequest, db: Session = Depends(get_db)):
+    """Delete many expenses in one transaction"""
+    # Anomaly flags have no foreign key once expenses is partitioned
+    deleted = bulk_delete(db, Expense, request.ids, dependents=[ExpenseAnomaly.expense_id])
+    return {"message": f"Deleted {deleted} expenses", "deleted": deleted}
+
+def _encode_cursor(expense: Expense) -> str:
+    return base64.urlsafe_b64encode(f"{expense.date}|{expense.id}".encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        date, expense_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return date, UUID(expense_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get("/expenses/search", response_model=ExpenseSearchPage)
+def search_expenses(
+    q: Optional[str] = Query(None, description="Text to look for in the description"),
+    date_from: Optional[str] = Query(None, description="YYYY-MM-DD, inclusive"),
+    date_to: Optional[str] = Query(None, description="YYYY-MM-DD, inclusive"),
+    category_id: Optional[UUID] = Query(None),
+    min_amount: Optional[Decimal] = Query(None),
+    max_amount: Optional[Decimal] = Query(None),
+    cursor: Optional[str] = Query(None, description="nextCursor of the previous page"),
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db)
+):
+    """Search expenses, newest first, with keyset pagination"""
+    query = db.query(Expense)
+    
+    words = re.findall(r"\w+", q or "")
+    if words:
+        # Full-text prefix match on whole words; with pg_trgm also substrings and typos - all GIN indexed
+        conditions = [
+            func.to_tsvector("simple", Expense.description).op("@@")(
+                func.to_tsquery("simple", " & ".join(f"{word}:*" for word in words))
+            )
+        ]
+        if has_extension("pg_trgm"):
+            q = q.strip()
+            pattern = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            conditions += [Expense.description.ilike(pattern), Expense.description.op("%>")(q)]
+        query = query.filter(or_(*conditions))
+    if date_from:
+        query = query.filter(Expense.date >= date_from)
+    if date_to:
+        query = query.filter(Expense.date <= date_to)
+    if category_id:
+        query = query.filter(Expense.category_id == category_id)
+    if min_amount is not None:
+        query = query.filter(Expense.amount >= min_amount)
+    if max_amount is not None:
+        query = query.filter(Expense.amount <= max_amount)
+    if cursor:
+        query = query.filter(tuple_(Expense.date, Expense.id) < _decode_cursor(cursor))
+    
+    items = query.order_by(Expense.date.desc(), Expense.id.desc()).limit(limit + 1).all()
+    next_cursor = _encode_cursor(items[limit - 1]) if len(items) > limit else None
+    return {"items": items[:limit], "next_cursor": next_cursor}
+
+@router.post("/expenses/categorize", response_model=List[CategoryPrediction])
+def categorize_expenses(request: CategorizeRequest, db: Session = Depends(get_db)):
+    """Suggest categories for a batch of expense descriptions"""
+    categorizer.ensure_loaded(db)
+    predictions = categorizer.predict(request.descriptions)
+    for prediction in predictions:
+        if prediction["confidence"] < request.min_confidence:
+            prediction["category_id"] = None
+    return predictions
+
+@router.post("/expenses/categorizer/train")
+def train_categorizer(db: Session = Depends(get_db)):
+    """Retrain the categorizer from all expenses"""
+    return categorizer.train(db)
+
+@router.get("/expenses/anomalies", response_model=List[ExpenseAnomalySchema])
+def get_expense_anomalies(
+    kind: Optional[str] = Query(None, description="spike, duplicate or new_merchant"),
+    since: Optional[str] = Query(None, description="Only expenses dated on or after YYYY-MM-DD"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    """Get expenses flagged by the anomaly scan"""
+    query = db.query(
+        ExpenseAnomaly.id,
+        ExpenseAnomaly.expense_id,
+        ExpenseAnomaly.category_id,
+        ExpenseAnomaly.kind,
+        ExpenseAnomaly.score,
+        ExpenseAnomaly.detail,
+        ExpenseAnomaly.date,
+        Expense.description,
+        Expense.amount,
+    ).join(Expense, Expense.id == ExpenseAnomaly.expense_id)
+    
+    if kind:
+        query = query.filter(ExpenseAnomaly.kind == kind)
+    if since:
+        query = query.filter(ExpenseAnomaly.date >= since)
+    
+    return query.order_by(ExpenseAnomaly.date.desc()).limit(limit).all()
+
+@router.post("/expenses/anomalies/scan")
+def scan_expense_anomalies(full: bool = Query(False, description="Rescan all expenses")):
+    """Run the anomaly scan now"""
+    return anomaly_service.scan(full=full)
+
+@router.get("/expenses/partitions")
+def get_expense_partitions():
+    """List monthly partitions of the expenses table"""
+    return {"partitioned": partitioning.enabled(), "partitions": partitioning.list_partitions()}
+
+@router.post("/expenses/partitions/{name}/detach")
+def detach_expense_partition(name: str, drop: bool = Query(False, description="Drop the detached table")):
+    """Detach a past month from the live expenses table
+
+    A month that still holds expenses is moved into the Parquet archive
+    (only before the archive cutoff) and its emptied partition dropped.
+    """
+    try:
+        if partitioning.is_empty(name):
+            return {"detached": name, "table": partitioning.detach_partition(name, drop=drop), "archived": 0}
+        match = re.match(r"^expenses_y(\d{4})m(\d{2})$", name)
+        result = archive_service.archive("expenses", month=f"{match.group(1)}-{match.group(2)}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ImportError:
+        raise HTTPException(status_code=503, detail="pyarrow is not installed")
+    return {"detached": name, "table": None, "archived": result["rows"]}
+
+@router.get("/expenses/export")
+def export_expenses(
+    date_from: Optional[str] = Query(None, description="YYYY-MM-DD, inclusive"),
+    date_to: Optional[str] = Query(None, description="YYYY-MM-DD, inclusive"),
+    category_id: Optional[UUID] = Query(None),
+    db: Session = Depends(get_db)
+):
+    """Export archived and live expenses as CSV"""
+    columns = ["id", "date", "description", "amount", "category_id", "created_at", "source"]
+    
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        rows = archive_service.iter_rows(db, "expenses", date_from, date_to, category_id=category_id)
+        for i, row in enumerate(rows, 1):
+            writer.writerow(row)
+            if i % 1000 == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    return StreamingResponse(
+        generate(),
+        media_type="text/csv",
+        headers={"Content-Disposition": 'attachment; filename="expenses.csv"'},
+    )
+
+@router.get("/expenses/archive")
+def get_expense_archive():
+    """Describe the Parquet archive of old history"""
+    return archive_service.status()
+
+@router.post("/expenses/archive")
+def archive_expenses(cutoff: Optional[str] = Query(None, description="Archive rows dated before YYYY-MM-DD")):
+    """Move old expenses into the Parquet archive now (never past the configured cutoff)"""
+    try:
+        cutoff_date = date.fromisoformat(cutoff) if cutoff else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid cutoff date: {cutoff}")
+    try:
+        return archive_service.archive("expenses", cutoff_date)
+    except ImportError:
+        raise HTTPException(status_code=503, detail="pyarrow is not installed")
 
 @router.get("/expenses/{expense_id}", response_model=ExpenseSchema)
 def get_expense(expense_id: str, db: Session = Depends(get_db)):
@@ -51,24 +282,18 @@ def get_expense(expense_id: str, db: Session = Depends(get_db)):
 @router.put("/expenses/{expense_id}", response_model=ExpenseSchema)
 def update_expense(expense_id: str, expense: ExpenseUpdate, db: Session = Depends(get_db)):
     """Update an expense"""
-    db_expense = db.query(Expense).filter(Expense.id == expense_id).first()
-    if not db_expense:
-        raise HTTPException(status_code=404, detail="Expense not found")
-    
-    for field, value in expense.dict(exclude_unset=True).items():
-        setattr(db_expense, field, value)
-    
-    db.commit()
-    db.refresh(db_expense)
-    return db_expense
+    changes = expense.dict(exclude_unset=True)
+    previous = ("category_id",) if changes.get("category_id") is not None else ()
+    updated = update_one(db, Expense, expense_id, changes, "Expense not found", previous=previous)
+    previous_category_id = updated.pop("previous_category_id", None)
+    if previous_category_id is not None and updated["category_id"] != previous_category_id:
+        # Learn from manual recategorization
+        categorizer.learn(updated["description"], updated["category_id"], previous_category_id)
+    return updated
 
 @router.delete("/expenses/{expense_id}")
 def delete_expense(expense_id: str, db: Session = Depends(get_db)):
     """Delete an expense"""
-    db_expense = db.query(Expense).filter(Expense.id == expense_id).first()
-    if not db_expense:
-        raise HTTPException(status_code=404, detail="Expense not found")
-    
-    db.delete(db_expense)
-    db.commit()
+    # Anomaly flags have no foreign key once expenses is partitioned
+    delete_one(db, Expense, expense_id, "Expense not found", dependents=[ExpenseAnomaly.expense_id])
     return {"message": "Expense deleted successfully"}
\ No newline at end of file
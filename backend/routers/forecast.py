@@ -0,0 +1,31 @@
+"""
+Cash-flow forecast API router
+"""
+from typing import List
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from database import get_db
+from services.forecast_service import MAX_FORECAST_MONTHS, Scenario, build_forecast
+
+router = APIRouter()
+
+@router.get("/forecast")
+def get_forecast(
+    months: int = Query(12, ge=1, le=MAX_FORECAST_MONTHS),
+    start_balance: float = Query(0.0, description="Balance at the start of the forecast"),
+    income_change_pct: float = Query(0.0, description="Scenario: change all incomes by this percentage"),
+    spending_change_pct: float = Query(0.0, description="Scenario: change all spending by this percentage"),
+    drop_recurring: List[str] = Query([], description="Scenario: cancel recurring expenses by description"),
+    extra_monthly_income: float = Query(0.0, description="Scenario: additional income every month"),
+    db: Session = Depends(get_db)
+):
+    """Project balance, monthly surplus and savings capacity"""
+    scenario = Scenario(
+        income_change_pct=income_change_pct,
+        spending_change_pct=spending_change_pct,
+        drop_recurring=frozenset(d.strip().lower() for d in drop_recurring),
+        extra_monthly_income=extra_monthly_income,
+    )
+    return build_forecast(db, months=months, start_balance=start_balance, scenario=scenario)
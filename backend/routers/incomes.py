@@ -1,29 +1,48 @@
 """
 Incomes API router
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
+from crud import bulk_create, bulk_delete, bulk_update, create_one, delete_one, update_one
 from database import get_db
 from models import Income
-from schemas import IncomeCreate, IncomeUpdate, Income as IncomeSchema
+from projection import select_fields
+from schemas import BulkDeleteRequest, IncomeCreate, IncomeUpdate, IncomeBulkUpdate, Income as IncomeSchema
 
 router = APIRouter()
 
 @router.get("/incomes", response_model=List[IncomeSchema])
-def get_incomes(db: Session = Depends(get_db)):
+def get_incomes(
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    db: Session = Depends(get_db)
+):
     """Get all incomes"""
+    if fields:
+        return select_fields(db, Income, IncomeSchema, fields)
     return db.query(Income).all()
 
 @router.post("/incomes", response_model=IncomeSchema)
 def create_income(income: IncomeCreate, db: Session = Depends(get_db)):
     """Create a new income"""
-    db_income = Income(**income.dict())
-    db.add(db_income)
-    db.commit()
-    db.refresh(db_income)
-    return db_income
+    return create_one(db, Income, income.dict())
+
+@router.post("/incomes/bulk", response_model=List[IncomeSchema])
+def create_incomes_bulk(incomes: List[IncomeCreate], db: Session = Depends(get_db)):
+    """Create many incomes in one transaction"""
+    return bulk_create(db, Income, incomes)
+
+@router.put("/incomes/bulk", response_model=List[IncomeSchema])
+def update_incomes_bulk(incomes: List[IncomeBulkUpdate], db: Session = Depends(get_db)):
+    """Update many incomes in one transaction"""
+    return bulk_update(db, Income, incomes)
+
+@router.delete("/incomes/bulk")
+def delete_incomes_bulk(request: BulkDeleteRequest, db: Session = Depends(get_db)):
+    """Delete many incomes in one transaction"""
+    deleted = bulk_delete(db, Income, request.ids)
+    return {"message": f"Deleted {deleted} incomes", "deleted": deleted}
 
 @router.get("/incomes/{income_id}", response_model=IncomeSchema)
 def get_income(income_id: str, db: Session = Depends(get_db)):
@@ -36,24 +55,10 @@ def get_income(income_id: str, db: Session = Depends(get_db)):
 @router.put("/incomes/{income_id}", response_model=IncomeSchema)
 def update_income(income_id: str, income: IncomeUpdate, db: Session = Depends(get_db)):
     """Update an income"""
-    db_income = db.query(Income).filter(Income.id == income_id).first()
-    if not db_income:
-        raise HTTPException(status_code=404, detail="Income not found")
-    
-    for field, value in income.dict(exclude_unset=True).items():
-        setattr(db_income, field, value)
-    
-    db.commit()
-    db.refresh(db_income)
-    return db_income
+    return update_one(db, Income, income_id, income.dict(exclude_unset=True), "Income not found")
 
 @router.delete("/incomes/{income_id}")
 def delete_income(income_id: str, db: Session = Depends(get_db)):
     """Delete an income"""
-    db_income = db.query(Income).filter(Income.id == income_id).first()
-    if not db_income:
-        raise HTTPException(status_code=404, detail="Income not found")
-    
-    db.delete(db_income)
-    db.commit()
+    delete_one(db, Income, income_id, "Income not found")
     return {"message": "Income deleted successfully"}
\ No newline at end of file
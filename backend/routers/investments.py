@@ -1,30 +1,50 @@
 """
 Investments API router
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from typing import List
-from decimal import Decimal
+from typing import List, Optional
 
+from crud import bulk_create, bulk_delete, bulk_update, create_one, delete_one, update_one
 from database import get_db
 from models import Investment
-from schemas import InvestmentCreate, InvestmentUpdate, Investment as InvestmentSchema
+from projection import select_fields
+from schemas import BulkDeleteRequest, InvestmentCreate, InvestmentUpdate, InvestmentBulkUpdate, Investment as InvestmentSchema
+from services.fx_service import BASE_CURRENCIES
+from services.valuation import value_portfolio
 
 router = APIRouter()
 
 @router.get("/investments", response_model=List[InvestmentSchema])
-def get_investments(db: Session = Depends(get_db)):
+def get_investments(
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    db: Session = Depends(get_db)
+):
     """Get all investments"""
+    if fields:
+        return select_fields(db, Investment, InvestmentSchema, fields)
     return db.query(Investment).all()
 
 @router.post("/investments", response_model=InvestmentSchema)
 def create_investment(investment: InvestmentCreate, db: Session = Depends(get_db)):
     """Create a new investment"""
-    db_investment = Investment(**investment.dict())
-    db.add(db_investment)
-    db.commit()
-    db.refresh(db_investment)
-    return db_investment
+    return create_one(db, Investment, investment.dict())
+
+@router.post("/investments/bulk", response_model=List[InvestmentSchema])
+def create_investments_bulk(investments: List[InvestmentCreate], db: Session = Depends(get_db)):
+    """Create many investments in one transaction"""
+    return bulk_create(db, Investment, investments)
+
+@router.put("/investments/bulk", response_model=List[InvestmentSchema])
+def update_investments_bulk(investments: List[InvestmentBulkUpdate], db: Session = Depends(get_db)):
+    """Update many investments in one transaction"""
+    return bulk_update(db, Investment, investments)
+
+@router.delete("/investments/bulk")
+def delete_investments_bulk(request: BulkDeleteRequest, db: Session = Depends(get_db)):
+    """Delete many investments in one transaction"""
+    deleted = bulk_delete(db, Investment, request.ids)
+    return {"message": f"Deleted {deleted} investments", "deleted": deleted}
 
 @router.get("/investments/{investment_id}", response_model=InvestmentSchema)
 def get_investment(investment_id: str, db: Session = Depends(get_db)):
@@ -37,42 +57,40 @@ def get_investment(investment_id: str, db: Session = Depends(get_db)):
 @router.put("/investments/{investment_id}", response_model=InvestmentSchema)
 def update_investment(investment_id: str, investment: InvestmentUpdate, db: Session = Depends(get_db)):
     """Update an investment"""
-    db_investment = db.query(Investment).filter(Investment.id == investment_id).first()
-    if not db_investment:
-        raise HTTPException(status_code=404, detail="Investment not found")
-    
-    for field, value in investment.dict(exclude_unset=True).items():
-        setattr(db_investment, field, value)
-    
-    db.commit()
-    db.refresh(db_investment)
-    return db_investment
+    return update_one(db, Investment, investment_id, investment.dict(exclude_unset=True), "Investment not found")
 
 @router.delete("/investments/{investment_id}")
 def delete_investment(investment_id: str, db: Session = Depends(get_db)):
     """Delete an investment"""
-    db_investment = db.query(Investment).filter(Investment.id == investment_id).first()
-    if not db_investment:
-        raise HTTPException(status_code=404, detail="Investment not found")
-    
-    db.delete(db_investment)
-    db.commit()
+    delete_one(db, Investment, investment_id, "Investment not found")
     return {"message": "Investment deleted successfully"}
 
 @router.get("/portfolio/profit-loss")
-def get_portfolio_profit_loss(db: Session = Depends(get_db)):
-    """Calculate total portfolio profit/loss"""
-    investments = db.query(Investment).all()
-    total_profit_loss = Decimal('0.00')
-    
-    for investment in investments:
-        if investment.current_price and investment.purchase_price:
-            current_value = investment.current_price * investment.quantity
-            purchase_value = investment.purchase_price * investment.quantity
-            profit_loss = current_value - purchase_value
-            total_profit_loss += profit_loss
+def get_portfolio_profit_loss(
+    base: Optional[str] = Query(None, description="Convert the result to this currency"),
+    db: Session = Depends(get_db)
+):
+    """Calculate total portfolio profit/loss
+
+    Without ``base`` the profit/loss of each position is summed in its own
+    quote currency, as the investments page expects.
+    """
+    if base is None:
+        total_profit_loss = sum(
+            float((investment.current_price - investment.purchase_price) * investment.quantity)
+            for investment in db.query(Investment).all()
+            if investment.current_price and investment.purchase_price
+        )
+        return {"totalProfitLoss": total_profit_loss}
+
+    if base.upper() not in BASE_CURRENCIES:
+        raise HTTPException(status_code=400, detail=f"Unsupported base currency: {base}")
+    try:
+        valuation = value_portfolio(db, base)
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     
-    return {"totalProfitLoss": float(total_profit_loss)}
+    return {"totalProfitLoss": valuation["total_profit_loss"], "currency": valuation["base"]}
 
 @router.get("/investment-sales")
 def get_investment_sales(db: Session = Depends(get_db)):
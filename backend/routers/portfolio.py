@@ -0,0 +1,66 @@
+"""
+Portfolio valuation and FX rates API router
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from database import get_db
+from services.downsampling import lttb
+from services.fx_service import BASE_CURRENCIES, fx_service
+from services.optimizer import OptimizerError, portfolio_optimizer
+from services.upstream import UpstreamUnavailable
+from services.valuation import value_portfolio
+
+router = APIRouter()
+
+@router.get("/portfolio/valuation")
+def get_portfolio_valuation(
+    base: str = Query("PLN", description="Base currency: PLN, USD or EUR"),
+    db: Session = Depends(get_db)
+):
+    """Value all positions in a single base currency"""
+    if base.upper() not in BASE_CURRENCIES:
+        raise HTTPException(status_code=400, detail=f"Unsupported base currency: {base}")
+    try:
+        return value_portfolio(db, base)
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@router.get("/portfolio/optimize")
+def optimize_portfolio(
+    base: str = Query("PLN", description="Base currency of the current weights: PLN, USD or EUR"),
+    max_weight: float = Query(1.0, gt=0, le=1, description="Largest allowed weight of a single position"),
+    points: int = Query(30, ge=2, le=100, description="Number of efficient frontier points"),
+    risk_free_rate: Optional[float] = Query(None, ge=-0.1, le=1, description="Annual rate used for the Sharpe ratio"),
+    db: Session = Depends(get_db)
+):
+    """Efficient frontier and min-variance, max-Sharpe and risk-parity allocations of the holdings"""
+    if base.upper() not in BASE_CURRENCIES:
+        raise HTTPException(status_code=400, detail=f"Unsupported base currency: {base}")
+    try:
+        return portfolio_optimizer.optimize(db, base, max_weight, points, risk_free_rate)
+    except OptimizerError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except (ValueError, UpstreamUnavailable) as e:
+        # No FX rate for a position's currency
+        raise HTTPException(status_code=503, detail=str(e))
+    except SQLAlchemyError:
+        raise HTTPException(status_code=503, detail="Price history is unavailable")
+
+@router.get("/fx/rates")
+def get_fx_rates():
+    """Get cached FX rates (units per 1 USD)"""
+    return {"rates": fx_service.snapshot()}
+
+@router.get("/fx/history/{currency}")
+def get_fx_history(
+    currency: str,
+    max_points: Optional[int] = Query(None, ge=3, le=5000, description="Downsample to at most this many points (LTTB)"),
+):
+    """Get the rate history collected for a currency"""
+    history = fx_service.history(currency)
+    if max_points:
+        history = lttb(history, "ts", "per_usd", max_points)
+    return {"currency": currency.upper(), "history": history}
\ No newline at end of file
@@ -2,15 +2,20 @@
 Savings Goals API router
 """
 from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import insert, or_
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
 
+from crud import bulk_create, bulk_delete, bulk_update, create_one, delete_one, update_one
 from database import get_db
 from models import SavingsGoal, SavingsTransaction
+from projection import select_fields
 from schemas import (
     SavingsGoalCreate,
     SavingsGoalUpdate,
+    SavingsGoalBulkUpdate,
+    BulkDeleteRequest,
     SavingsGoal as SavingsGoalSchema,
     AddSavingsRequest,
     SavingsTransaction as SavingsTransactionSchema,
@@ -19,18 +24,35 @@ from schemas import (
 router = APIRouter()
 
 @router.get("/savings-goals", response_model=List[SavingsGoalSchema])
-def get_savings_goals(db: Session = Depends(get_db)):
+def get_savings_goals(
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    db: Session = Depends(get_db)
+):
     """Get all savings goals"""
+    if fields:
+        return select_fields(db, SavingsGoal, SavingsGoalSchema, fields)
     return db.query(SavingsGoal).all()
 
 @router.post("/savings-goals", response_model=SavingsGoalSchema)
 def create_savings_goal(goal: SavingsGoalCreate, db: Session = Depends(get_db)):
     """Create a new savings goal"""
-    db_goal = SavingsGoal(**goal.dict())
-    db.add(db_goal)
-    db.commit()
-    db.refresh(db_goal)
-    return db_goal
+    return create_one(db, SavingsGoal, goal.dict())
+
+@router.post("/savings-goals/bulk", response_model=List[SavingsGoalSchema])
+def create_savings_goals_bulk(goals: List[SavingsGoalCreate], db: Session = Depends(get_db)):
+    """Create many savings goals in one transaction"""
+    return bulk_create(db, SavingsGoal, goals)
+
+@router.put("/savings-goals/bulk", response_model=List[SavingsGoalSchema])
+def update_savings_goals_bulk(goals: List[SavingsGoalBulkUpdate], db: Session = Depends(get_db)):
+    """Update many savings goals in one transaction"""
+    return bulk_update(db, SavingsGoal, goals)
+
+@router.delete("/savings-goals/bulk")
+def delete_savings_goals_bulk(request: BulkDeleteRequest, db: Session = Depends(get_db)):
+    """Delete many savings goals in one transaction"""
+    deleted = bulk_delete(db, SavingsGoal, request.ids)
+    return {"message": f"Deleted {deleted} savings goals", "deleted": deleted}
 
 @router.get("/savings-goals/{goal_id}", response_model=SavingsGoalSchema)
 def get_savings_goal(goal_id: str, db: Session = Depends(get_db)):
@@ -43,52 +65,32 @@ def get_savings_goal(goal_id: str, db: Session = Depends(get_db)):
 @router.put("/savings-goals/{goal_id}", response_model=SavingsGoalSchema)
 def update_savings_goal(goal_id: str, goal: SavingsGoalUpdate, db: Session = Depends(get_db)):
     """Update a savings goal"""
-    db_goal = db.query(SavingsGoal).filter(SavingsGoal.id == goal_id).first()
-    if not db_goal:
-        raise HTTPException(status_code=404, detail="Savings goal not found")
-    
-    for field, value in goal.dict(exclude_unset=True).items():
-        setattr(db_goal, field, value)
-    
-    db.commit()
-    db.refresh(db_goal)
-    return db_goal
+    return update_one(db, SavingsGoal, goal_id, goal.dict(exclude_unset=True), "Savings goal not found")
 
 @router.delete("/savings-goals/{goal_id}")
 def delete_savings_goal(goal_id: str, db: Session = Depends(get_db)):
     """Delete a savings goal"""
-    db_goal = db.query(SavingsGoal).filter(SavingsGoal.id == goal_id).first()
-    if not db_goal:
-        raise HTTPException(status_code=404, detail="Savings goal not found")
-    
-    db.delete(db_goal)
-    db.commit()
+    delete_one(db, SavingsGoal, goal_id, "Savings goal not found")
     return {"message": "Savings goal deleted successfully"}
 
 @router.post("/savings-goals/{goal_id}/add", response_model=SavingsGoalSchema)
 def add_savings(goal_id: str, request: AddSavingsRequest, db: Session = Depends(get_db)):
     """Add money to a savings goal"""
-    db_goal = db.query(SavingsGoal).filter(SavingsGoal.id == goal_id).first()
-    if not db_goal:
-        raise HTTPException(status_code=404, detail="Savings goal not found")
-
-    db_goal.current_amount = float(db_goal.current_amount) + float(request.amount)
+    # Increment in the database so concurrent deposits are not lost
+    new_amount = SavingsGoal.current_amount + request.amount
+    goal = update_one(db, SavingsGoal, goal_id, {
+        "current_amount": new_amount,
+        "is_completed": or_(SavingsGoal.is_completed.is_(True), new_amount >= SavingsGoal.target_amount),
+    }, "Savings goal not found", commit=False)
 
     # Record savings transaction
-    transaction = SavingsTransaction(
-        savings_goal_id=goal_id,
+    db.execute(insert(SavingsTransaction).values(
+        savings_goal_id=goal["id"],
         amount=request.amount,
         date=datetime.utcnow().strftime("%Y-%m-%d"),
-    )
-    db.add(transaction)
-
-    # Check if goal is completed
-    if float(db_goal.current_amount) >= float(db_goal.target_amount):
-        db_goal.is_completed = True
-
+    ))
     db.commit()
-    db.refresh(db_goal)
-    return db_goal
+    return goal
 
 @router.get("/savings-transactions/{year}/{month}", response_model=List[SavingsTransactionSchema])
 def get_savings_transactions(year: int, month: int, db: Session = Depends(get_db)):
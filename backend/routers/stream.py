@@ -0,0 +1,46 @@
+"""
+Price streaming API router (Server-Sent Events)
+"""
+import asyncio
+import json
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import Optional
+
+from services.broadcaster import broadcaster
+
+router = APIRouter()
+
+KEEPALIVE_SECONDS = 15
+
+@router.get("/stream/prices")
+async def stream_prices(
+    request: Request,
+    symbols: Optional[str] = Query(None, description="Comma separated symbols, all when omitted"),
+):
+    """Stream price changes from the refresh job and the crypto feed"""
+    wanted = [s.strip() for s in symbols.split(",") if s.strip()] if symbols else None
+    subscription = broadcaster.subscribe(wanted)
+
+    async def events():
+        try:
+            yield "retry: 5000\n\n"
+            while not subscription.closed:
+                if await request.is_disconnected():
+                    break
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    break
+                yield f"event: price\ndata: {json.dumps(event)}\n\n"
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
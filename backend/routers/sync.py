@@ -0,0 +1,24 @@
+"""
+Delta sync API router
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from database import get_db
+from schemas import SyncResponse
+from services.sync_service import changes_since
+
+router = APIRouter()
+
+@router.get("/sync", response_model=SyncResponse)
+def sync(
+    since: Optional[str] = Query(None, description="Cursor from the previous sync; omit for a full snapshot"),
+    db: Session = Depends(get_db)
+):
+    """Rows changed and ids deleted across all resources since the cursor"""
+    try:
+        content = changes_since(db, since)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(content=content, media_type="application/json")
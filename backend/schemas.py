@@ -1,12 +1,14 @@
 """
 Pydantic schemas for request/response validation
 """
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Optional
 from decimal import Decimal
 from datetime import datetime
 from uuid import UUID
 
+from services.market_hours import normalize_currency
+
 def to_camel(string: str) -> str:
     """Convert snake_case strings to camelCase."""
     parts = string.split("_")
@@ -22,6 +24,10 @@ class CamelModel(BaseModel):
         alias_generator = to_camel
 
 
+class BulkDeleteRequest(CamelModel):
+    ids: List[UUID] = Field(..., min_length=1)
+
+
 # Category schemas
 class CategoryBase(CamelModel):
     name: str
@@ -36,9 +42,13 @@ class CategoryUpdate(CamelModel):
     color: Optional[str] = None
     budget: Optional[Decimal] = None
 
+class CategoryBulkUpdate(CategoryUpdate):
+    id: UUID
+
 class Category(CategoryBase):
     id: UUID
     created_at: datetime
+    updated_at: Optional[datetime] = None
 
 # Income schemas
 class IncomeBase(CamelModel):
@@ -56,9 +66,13 @@ class IncomeUpdate(CamelModel):
     frequency: Optional[str] = None
     date: Optional[str] = None
 
+class IncomeBulkUpdate(IncomeUpdate):
+    id: UUID
+
 class Income(IncomeBase):
     id: UUID
     created_at: datetime
+    updated_at: Optional[datetime] = None
 
 # Expense schemas
 class ExpenseBase(CamelModel):
@@ -76,9 +90,46 @@ class ExpenseUpdate(CamelModel):
     category_id: Optional[UUID] = None
     date: Optional[str] = None
 
+class ExpenseBulkUpdate(ExpenseUpdate):
+    id: UUID
+
 class Expense(ExpenseBase):
     id: UUID
     created_at: datetime
+    updated_at: Optional[datetime] = None
+
+class ExpenseSearchPage(CamelModel):
+    items: List[Expense]
+    next_cursor: Optional[str] = None
+
+class CategorizeRequest(CamelModel):
+    descriptions: List[str] = Field(..., max_length=10000)
+    min_confidence: float = 0.0
+
+class CategoryPrediction(CamelModel):
+    description: str
+    category_id: Optional[UUID] = None
+    confidence: float
+
+class ExpenseAnomaly(CamelModel):
+    id: UUID
+    expense_id: UUID
+    category_id: UUID
+    kind: str
+    score: float
+    detail: str
+    date: str
+    description: str
+    amount: Decimal
+
+def _currency_code(value: Optional[str]) -> Optional[str]:
+    """Investments store 3-letter codes - stablecoins become USD, anything else is rejected"""
+    if value is None:
+        return None
+    code = normalize_currency(value.strip().upper())
+    if code is None:
+        raise ValueError("currency must be a 3-letter code")
+    return code
 
 # Investment schemas
 class InvestmentBase(CamelModel):
@@ -88,9 +139,10 @@ class InvestmentBase(CamelModel):
     quantity: Decimal
     purchase_price: Decimal
     purchase_date: str
+    currency: Optional[str] = None
 
 class InvestmentCreate(InvestmentBase):
-    pass
+    _currency = field_validator("currency")(_currency_code)
 
 class InvestmentUpdate(CamelModel):
     symbol: Optional[str] = None
@@ -100,11 +152,18 @@ class InvestmentUpdate(CamelModel):
     purchase_price: Optional[Decimal] = None
     current_price: Optional[Decimal] = None
     purchase_date: Optional[str] = None
+    currency: Optional[str] = None
+
+    _currency = field_validator("currency")(_currency_code)
+
+class InvestmentBulkUpdate(InvestmentUpdate):
+    id: UUID
 
 class Investment(InvestmentBase):
     id: UUID
     current_price: Optional[Decimal]
     created_at: datetime
+    updated_at: Optional[datetime] = None
 
 # Savings Goal schemas
 class SavingsGoalBase(CamelModel):
@@ -126,11 +185,15 @@ class SavingsGoalUpdate(CamelModel):
     color: Optional[str] = None
     is_completed: Optional[bool] = None
 
+class SavingsGoalBulkUpdate(SavingsGoalUpdate):
+    id: UUID
+
 class SavingsGoal(SavingsGoalBase):
     id: UUID
     current_amount: Decimal
     is_completed: bool
     created_at: datetime
+    updated_at: Optional[datetime] = None
 
 class AddSavingsRequest(CamelModel):
     amount: Decimal = Field(..., gt=0, description="Amount to add to savings goal")
@@ -144,6 +207,27 @@ class SavingsTransaction(CamelModel):
     date: str
     created_at: datetime
 
+# Sync schemas
+class SyncChanges(CamelModel):
+    categories: List[Category] = []
+    incomes: List[Income] = []
+    expenses: List[Expense] = []
+    investments: List[Investment] = []
+    savings_goals: List[SavingsGoal] = []
+
+class SyncDeleted(CamelModel):
+    categories: List[UUID] = []
+    incomes: List[UUID] = []
+    expenses: List[UUID] = []
+    investments: List[UUID] = []
+    savings_goals: List[UUID] = []
+
+class SyncResponse(CamelModel):
+    cursor: str
+    reset: bool = False
+    changes: SyncChanges
+    deleted: SyncDeleted
+
 # AI and analysis schemas
 class RiskAnalysisResponse(CamelModel):
     var_95: float
@@ -2,11 +2,15 @@
 AI Service for financial analysis and recommendations
 """
 import logging
-import numpy as np
 from typing import Dict, Any, List
 from sqlalchemy.orm import Session
-from models import Investment, Category, Expense, Income, SavingsGoal
+from models import Investment, Category, Expense, Income
 from schemas import AIAnalysisResponse
+from services.archive import archive_service
+from services.forecast_service import build_forecast
+from services.portfolio_analytics import portfolio_analytics
+from services.query_engine import query_engine
+from startup import lazy_import
 
 logger = logging.getLogger(__name__)
 
@@ -61,17 +65,11 @@ class AIService:
             # Generate recommendations
             recommendations = []
             
-            if len(investments) < 5:
-                recommendations.append("Rozważ większą dywersyfikację - dodaj więcej pozycji")
-            
             if return_percentage < -10:
                 recommendations.append("Portfel generuje znaczne straty - przeanalizuj pozycje")
             elif return_percentage > 20:
                 recommendations.append("Portfel osiąga doskonałe wyniki - rozważ realizację zysków")
             
-            if len(types_count) == 1:
-                recommendations.append("Portfel nie jest zdywersyfikowany - dodaj różne typy aktywów")
-            
             key_metrics = {
                 "total_value": total_value,
                 "total_return": total_return,
@@ -80,6 +78,25 @@ class AIService:
                 "asset_types": len(types_count)
             }
             
+            try:
+                diversification = portfolio_analytics.analyze(db) or {}
+            except Exception as e:
+                # e.g. no FX rate for a position's currency - keep the basic analysis
+                logger.warning(f"Diversification metrics unavailable: {e}")
+                diversification = {}
+            if "effective_bets" in diversification:
+                analysis += self._diversification_summary(diversification)
+                recommendations.extend(self._diversification_recommendations(diversification))
+            else:
+                # Without enough price history fall back to counting positions and asset types
+                if len(investments) < 5:
+                    recommendations.append("Rozważ większą dywersyfikację - dodaj więcej pozycji")
+                if len(types_count) == 1:
+                    recommendations.append("Portfel nie jest zdywersyfikowany - dodaj różne typy aktywów")
+                if diversification.get("hhi", 0) > 0.25:
+                    recommendations.extend(self._diversification_recommendations(diversification))
+            key_metrics["diversification"] = diversification
+            
             return AIAnalysisResponse(
                 analysis=analysis.strip(),
                 recommendations=recommendations,
@@ -94,6 +111,54 @@ class AIService:
                 key_metrics={}
             )
     
+    @staticmethod
+    def _diversification_summary(metrics: Dict[str, Any]) -> str:
+        top_risk = sorted(metrics["risk_contribution"].items(), key=lambda item: -item[1])[:3]
+        return f"""
+            🔗 Dywersyfikacja (zwroty dzienne z {metrics['observations']} sesji):
+            • Efektywna liczba niezależnych zakładów: {metrics['effective_bets']:.1f}
+            • Efektywna liczba pozycji (1/HHI): {metrics['effective_positions']:.1f}
+            • Średnia korelacja pozycji: {metrics['avg_correlation']:.2f}
+            • Zmienność roczna portfela: {metrics['portfolio_volatility']:.1%}
+            • Największy udział w ryzyku: {", ".join(f"{s} {rc:.0%}" for s, rc in top_risk)}
+            """
+
+    @staticmethod
+    def _diversification_recommendations(metrics: Dict[str, Any]) -> List[str]:
+        recommendations = []
+        if metrics["hhi"] > 0.25:
+            recommendations.append(
+                f"Portfel jest skoncentrowany (HHI {metrics['hhi']:.2f}, efektywnie "
+                f"{metrics['effective_positions']:.1f} pozycji) - rozważ zmniejszenie największych pozycji"
+            )
+        if "effective_bets" not in metrics:
+            return recommendations
+
+        if metrics["effective_bets"] < 2:
+            recommendations.append(
+                f"Ryzyko portfela zależy w praktyce od {metrics['effective_bets']:.1f} niezależnych czynników - "
+                "dodaj aktywa słabo skorelowane z obecnymi"
+            )
+        for symbol, share in metrics["risk_contribution"].items():
+            weight = metrics["weights"][symbol]
+            if share > 0.35 and share > 1.5 * weight:
+                recommendations.append(
+                    f"{symbol} odpowiada za {share:.0%} ryzyka przy {weight:.0%} wartości portfela - "
+                    "rozważ zmniejszenie tej pozycji"
+                )
+        for pair in metrics["correlated_pairs"][:3]:
+            first, second = pair["symbols"]
+            recommendations.append(
+                f"{first} i {second} są silnie skorelowane ({pair['correlation']:.2f}) - w praktyce dublują ekspozycję"
+            )
+        if metrics["history_coverage"] < 0.8:
+            recommendations.append(
+                f"Brak historii cen dla {1 - metrics['history_coverage']:.0%} wartości portfela - metryki ryzyka są niepełne"
+            )
+        if metrics["effective_bets"] >= 3 and metrics["avg_correlation"] < 0.3 and metrics["hhi"] <= 0.25:
+            recommendations.append("Portfel jest dobrze zdywersyfikowany - utrzymuj obecną strukturę")
+        return recommendations
+
     def analyze_budget(self, db: Session) -> AIAnalysisResponse:
         """Analyze budget and spending patterns"""
         try:
@@ -123,6 +188,13 @@ class AIService:
                 cat_id = str(expense.category_id)
                 if cat_id in category_spending:
                     category_spending[cat_id] += amount
+            # Expenses moved to the Parquet archive still count
+            archived_count = 0
+            for cat_id, (amount, count) in archive_service.totals_by("expenses", "category_id").items():
+                total_expenses += amount
+                archived_count += count
+                if cat_id in category_spending:
+                    category_spending[cat_id] += amount
             
             # Calculate total income
             total_income = sum(float(income.amount) for income in incomes)
@@ -160,7 +232,7 @@ class AIService:
             elif total_income - total_expenses > total_income * 0.3:
                 recommendations.append("Doskonałe zarządzanie budżetem - rozważ zwiększenie oszczędności")
             
-            if len(expenses) < 10:
+            if len(expenses) + archived_count < 10:
                 recommendations.append("Śledź więcej wydatków dla lepszej analizy budżetu")
             
             key_metrics = {
@@ -168,7 +240,8 @@ class AIService:
                 "total_expenses": total_expenses,
                 "balance": total_income - total_expenses,
                 "categories_count": len(categories),
-                "expenses_count": len(expenses)
+                "expenses_count": len(expenses) + archived_count,
+                "forecast_monthly_surplus": build_forecast(db, months=3)["summary"]["avg_monthly_surplus"]
             }
             
             return AIAnalysisResponse(
@@ -188,34 +261,10 @@ class AIService:
     def generate_custom_analysis(self, query: str, db: Session) -> str:
         """Generate custom analysis based on user query"""
         try:
-            # Simple keyword-based responses
-            query_lower = query.lower()
-            
-            if "inwestycje" in query_lower or "portfel" in query_lower:
-                investments = db.query(Investment).all()
-                if investments:
-                    return f"Masz {len(investments)} pozycji inwestycyjnych w portfelu. Czy chcesz przeprowadzić szczegółową analizę?"
-                else:
-                    return "Nie masz jeszcze żadnych inwestycji. Rozważ rozpoczęcie inwestowania."
-            
-            elif "budżet" in query_lower or "wydatki" in query_lower:
-                expenses = db.query(Expense).all()
-                if expenses:
-                    total = sum(float(e.amount) for e in expenses)
-                    return f"Łącznie masz {len(expenses)} wydatków o wartości ${total:,.2f}. Mogę pomóc w analizie kategorii."
-                else:
-                    return "Nie masz jeszcze żadnych wydatków do analizy."
-            
-            elif "oszczędności" in query_lower or "cele" in query_lower:
-                goals = db.query(SavingsGoal).all()
-                if goals:
-                    completed = sum(1 for g in goals if g.is_completed)
-                    return f"Masz {len(goals)} celów oszczędnościowych, z czego {completed} zostało osiągniętych."
-                else:
-                    return "Nie masz jeszcze celów oszczędnościowych. Rozważ ich utworzenie."
-            
-            else:
-                return "Mogę pomóc w analizie Twojego portfela inwestycyjnego, budżetu i celów oszczędnościowych. O czym chciałbyś się dowiedzieć?"
+            answer = query_engine.answer(query, db)
+            if answer is not None:
+                return answer
+            return "Mogę pomóc w analizie Twojego portfela inwestycyjnego, budżetu i celów oszczędnościowych. O czym chciałbyś się dowiedzieć?"
             
         except Exception as e:
             logger.error(f"Error in custom analysis: {e}")
@@ -227,6 +276,7 @@ class AIService:
             if not returns:
                 return {"var": 0.0, "expected_shortfall": 0.0}
             
+            np = lazy_import("numpy")
             returns_array = np.array(returns)
             
             # Calculate VaR
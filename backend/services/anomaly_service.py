@@ -0,0 +1,300 @@
+"""
+Batch anomaly detection over expenses: amount spikes, duplicate charges and new merchants
+
+Each scan only flags expenses created since the stored watermark. Statistics
+are computed with NumPy over a trailing window of the whole category history,
+and the flags are stored in ``expense_anomalies`` so reading them is a plain
+indexed query. Expenses whose date is not a valid YYYY-MM-DD are skipped (and
+passed by the watermark). Merchants seen in the Parquet archive are not new.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, FrozenSet, List
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from sqlalchemy import Float, String, bindparam, cast, delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from database import SessionLocal
+from models import Expense, ExpenseAnomaly, JobWatermark
+from services.archive import archive_service
+from services.leader_election import LeaderElection, advisory_xact_lock
+from startup import lazy_import
+
+logger = logging.getLogger(__name__)
+
+ANOMALY_SCAN_MINUTES = int(os.getenv("ANOMALY_SCAN_MINUTES", "15"))
+# Months of category history behind the median/MAD of each month
+ANOMALY_WINDOW_MONTHS = int(os.getenv("ANOMALY_WINDOW_MONTHS", "6"))
+# Robust z-score above which an amount counts as a spike
+ANOMALY_SPIKE_THRESHOLD = float(os.getenv("ANOMALY_SPIKE_THRESHOLD", "3.5"))
+ANOMALY_MIN_HISTORY = 5
+DUPLICATE_WINDOW_DAYS = 3
+# No "new merchant" flags while the history is still being filled in
+NEW_MERCHANT_GRACE_DAYS = 30
+# Rows created just before the watermark may commit after it - rescan them
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+WATERMARK_NAME = "expense_anomalies"
+
+
+def _merchant_key(description: str) -> str:
+    # Same normalization as lower(trim(description)) in SQL
+    return description.strip().lower()
+
+
+# ``date`` is free-form text - only rows shaped like YYYY-MM-DD are scanned
+_ISO_DATE = Expense.date.op("~")(r"^\d{4}-(0[1-9]|1[0-2])-(0[1-9]|[12]\d|3[01])$")
+
+
+def _iso_days(values: List[str]):
+    """datetime64[D] array of ``values``, NaT where a value is not a real date (e.g. 2024-02-30)"""
+    np = lazy_import("numpy")
+    try:
+        return np.array(values, dtype="datetime64[D]")
+    except ValueError:
+        def parse(value: str) -> str:
+            try:
+                return date.fromisoformat(value).isoformat()
+            except ValueError:
+                return "NaT"
+        return np.array([parse(v) for v in values], dtype="datetime64[D]")
+
+
+def _archived_merchants() -> FrozenSet[str]:
+    try:
+        return frozenset(_merchant_key(d) for d in archive_service.distinct_values("expenses", "description"))
+    except ImportError:
+        return frozenset()
+
+
+class AnomalyService:
+    def __init__(self):
+        self.scheduler = BackgroundScheduler()
+        self.leader = LeaderElection("expense_anomalies")
+        self._scan_lock = threading.Lock()
+        self._stats: Dict[str, Any] = {
+            "last_scan_at": None,
+            "last_scan_full": None,
+            "last_scanned": 0,
+            "last_flagged": 0,
+            "last_duration_seconds": None,
+        }
+
+    def start_scheduler(self):
+        """Start the periodic incremental scan"""
+        self.scheduler.add_job(
+            func=self._scheduled_scan,
+            trigger="interval",
+            minutes=ANOMALY_SCAN_MINUTES,
+            next_run_time=datetime.now(),
+            coalesce=True,
+            max_instances=1,
+            id='expense_anomaly_scan',
+            replace_existing=True
+        )
+        self.scheduler.start()
+        logger.info("Expense anomaly scheduler started")
+
+    def stop_scheduler(self):
+        """Stop the periodic scan"""
+        if self.scheduler.running:
+            self.scheduler.shutdown()
+            logger.info("Expense anomaly scheduler stopped")
+        self.leader.release()
+
+    def _scheduled_scan(self):
+        if not self.leader.check():
+            return
+        try:
+            self.scan()
+        except Exception as e:
+            logger.error(f"Expense anomaly scan failed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self._stats)
+
+    def scan(self, full: bool = False) -> Dict[str, Any]:
+        """Flag expenses created since the watermark (or all of them when ``full``)"""
+        with self._scan_lock:
+            started = time.perf_counter()
+            db = SessionLocal()
+            try:
+                result = self._scan(db, full)
+            finally:
+                db.close()
+            self._stats.update(
+                last_scan_at=datetime.utcnow().isoformat(),
+                last_scan_full=full,
+                last_scanned=result["scanned"],
+                last_flagged=result["flagged"],
+                last_duration_seconds=round(time.perf_counter() - started, 3),
+            )
+            return {**result, "duration_seconds": self._stats["last_duration_seconds"]}
+
+    def _scan(self, db, full: bool) -> Dict[str, Any]:
+        np = lazy_import("numpy")
+        # Scans from other workers (manual POST /expenses/anomalies/scan) wait their turn
+        advisory_xact_lock(db, "expense_anomaly_scan")
+        watermark = db.get(JobWatermark, WATERMARK_NAME)
+        since = None if full or watermark is None or watermark.watermark is None else watermark.watermark - WATERMARK_OVERLAP
+
+        targets = select(Expense.id)
+        if since is not None:
+            targets = targets.where(Expense.created_at > since)
+        bounds = db.execute(
+            select(
+                func.count(),
+                func.min(Expense.date).filter(_ISO_DATE),
+                func.max(Expense.date).filter(_ISO_DATE),
+                func.max(Expense.created_at),
+            )
+            .where(Expense.id.in_(targets))
+        ).one()
+        scanned, first_target_date, last_target_date, newest_created = bounds
+        if not scanned:
+            return {"scanned": 0, "flagged": 0}
+        if first_target_date is None:
+            # Only malformed dates since the last scan - nothing to flag, but move past them
+            return self._store(db, since, targets, watermark, newest_created, [], scanned)
+
+        # Year and month only - the day may still be impossible (2024-02-30)
+        window_month = int(first_target_date[:4]) * 12 + int(first_target_date[5:7]) - 1 - ANOMALY_WINDOW_MONTHS
+        window_start = date(window_month // 12, window_month % 12 + 1, 1).isoformat()
+        # Plain columns on the raw connection - UUID and Decimal parsing would dominate the scan
+        rows = db.connection().execute(
+            select(
+                cast(Expense.id, String),
+                cast(Expense.category_id, String),
+                Expense.description,
+                cast(Expense.amount, Float),
+                Expense.date,
+                Expense.created_at,
+            ).where(Expense.date >= window_start, Expense.date <= last_target_date, _ISO_DATE)
+        ).all()
+
+        days = _iso_days([r[4] for r in rows])
+        valid = ~np.isnat(days)
+        if not valid.all():
+            rows = [r for r, ok in zip(rows, valid) if ok]
+            days = days[valid]
+        if not rows:
+            return self._store(db, since, targets, watermark, newest_created, [], scanned)
+
+        n = len(rows)
+        ids, category_ids, descriptions, amount_values, dates, created_at = zip(*rows)
+        amounts = np.array(amount_values, dtype=float)
+        if since is None:
+            is_target = np.ones(n, dtype=bool)
+        else:
+            created = np.array([c or datetime.min for c in created_at], dtype="datetime64[us]")
+            is_target = created > np.datetime64(since, "us")
+        _, category_codes = np.unique(np.array(category_ids), return_inverse=True)
+        merchant_keys, merchant_codes = np.unique(
+            np.array([_merchant_key(d) for d in descriptions]), return_inverse=True
+        )
+
+        flags: List[Dict[str, Any]] = []
+
+        def flag(i: int, kind: str, score: float, detail: str):
+            flags.append({
+                "expense_id": uuid.UUID(ids[i]),
+                "category_id": uuid.UUID(category_ids[i]),
+                "kind": kind,
+                "score": round(float(score), 4),
+                "detail": detail[:255],
+                "date": str(days[i]),
+            })
+
+        # Amount spikes: robust z-score against the trailing months of the same category
+        months = days.astype("datetime64[M]").astype(int)
+        order = np.lexsort((months, category_codes))
+        sorted_cats = category_codes[order]
+        sorted_months = months[order]
+        sorted_amounts = amounts[order]
+        cat_bounds = np.searchsorted(sorted_cats, np.arange(sorted_cats.max() + 2))
+        for cat in range(len(cat_bounds) - 1):
+            lo, hi = cat_bounds[cat], cat_bounds[cat + 1]
+            cat_months = sorted_months[lo:hi]
+            cat_targets = order[lo:hi][is_target[order[lo:hi]]]
+            for month in np.unique(months[cat_targets]):
+                h_lo = lo + np.searchsorted(cat_months, month - ANOMALY_WINDOW_MONTHS)
+                h_hi = lo + np.searchsorted(cat_months, month)
+                if h_hi - h_lo < ANOMALY_MIN_HISTORY:
+                    continue
+                history = sorted_amounts[h_lo:h_hi]
+                median = np.median(history)
+                deviation = np.abs(history - median)
+                # 1.4826 * MAD estimates the standard deviation; fall back to the mean deviation
+                scale = 1.4826 * np.median(deviation) or 1.2533 * deviation.mean()
+                if not scale:
+                    continue
+                candidates = cat_targets[months[cat_targets] == month]
+                z = (amounts[candidates] - median) / scale
+                for i, score in zip(candidates[z > ANOMALY_SPIKE_THRESHOLD], z[z > ANOMALY_SPIKE_THRESHOLD]):
+                    flag(i, "spike", score, f"Kwota {amounts[i]:.2f} zł przy medianie kategorii {median:.2f} zł")
+
+        # Duplicate charges: same merchant, category and amount within a few days
+        cents = np.round(amounts * 100).astype(np.int64)
+        order = np.lexsort((days, cents, category_codes, merchant_codes))
+        same = (
+            (merchant_codes[order][1:] == merchant_codes[order][:-1])
+            & (category_codes[order][1:] == category_codes[order][:-1])
+            & (cents[order][1:] == cents[order][:-1])
+        )
+        gap = (days[order][1:] - days[order][:-1]).astype(int)
+        duplicate = same & (gap <= DUPLICATE_WINDOW_DAYS) & is_target[order][1:]
+        for pos in np.flatnonzero(duplicate):
+            i, prev = order[pos + 1], order[pos]
+            flag(i, "duplicate", gap[pos], f"Możliwy duplikat wydatku z {days[prev]}")
+
+        # New merchants: first appearance of a description in the whole history
+        order = np.lexsort((days, merchant_codes))
+        _, first_idx = np.unique(merchant_codes[order], return_index=True)
+        first_seen = order[first_idx]
+        candidates = first_seen[is_target[first_seen]]
+        if len(candidates):
+            earliest = db.execute(select(func.min(Expense.date)).where(_ISO_DATE)).scalar()
+            grace_end = _iso_days([earliest])[0] + NEW_MERCHANT_GRACE_DAYS
+            candidates = candidates[~(days[candidates] < grace_end)]
+        if len(candidates):
+            # ... nor are merchants whose only history has been archived
+            archived = _archived_merchants()
+            candidates = [i for i in candidates if merchant_keys[merchant_codes[i]] not in archived]
+        if len(candidates) and since is not None:
+            # Merchants already seen before the history window are not new
+            key_expr = func.lower(func.trim(Expense.description))
+            seen = set(db.execute(
+                select(key_expr).distinct()
+                .where(Expense.date < window_start, key_expr.in_(bindparam("keys", expanding=True))),
+                {"keys": [str(merchant_keys[merchant_codes[i]]) for i in candidates]},
+            ).scalars())
+            candidates = [i for i in candidates if merchant_keys[merchant_codes[i]] not in seen]
+        for i in candidates:
+            flag(i, "new_merchant", 1.0, f"Nowy sprzedawca: {descriptions[i]}")
+
+        return self._store(db, since, targets, watermark, newest_created, flags, scanned)
+
+    def _store(self, db, since, targets, watermark, newest_created, flags: List[Dict[str, Any]], scanned: int):
+        """Replace the flags of everything scanned and advance the watermark"""
+        stale = delete(ExpenseAnomaly)
+        if since is not None:
+            stale = stale.where(ExpenseAnomaly.expense_id.in_(targets))
+        db.execute(stale)
+        if flags:
+            db.execute(pg_insert(ExpenseAnomaly).on_conflict_do_nothing(index_elements=["expense_id", "kind"]), flags)
+        if watermark is None:
+            watermark = JobWatermark(name=WATERMARK_NAME)
+            db.add(watermark)
+        watermark.watermark = newest_created
+        db.commit()
+
+        logger.info(f"Anomaly scan checked {scanned} expenses, flagged {len(flags)}")
+        return {"scanned": scanned, "flagged": len(flags)}
+
+
+anomaly_service = AnomalyService()
@@ -0,0 +1,341 @@
+"""
+Archival of cold history to Parquet files with a merged read path
+
+Rows older than ARCHIVE_AFTER_YEARS full years are moved month by month into
+``<ARCHIVE_DIR>/<table>/<YYYY-MM>.parquet`` (zstd-compressed) and deleted from
+the live table, so hot tables and their indexes only hold recent history.
+Expense listings, exports and long-horizon aggregates read both sources
+through ``iter_rows``, ``aggregate`` and ``totals_by``. Readers of recent
+windows only (forecast, anomaly scan) stay on the live tables - at least the
+last full year is never archived, whatever cutoff a caller asks for. Archived
+rows leave tombstones, so sync clients drop them like any other deletion.
+"""
+import logging
+import os
+import re
+import threading
+import uuid
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+from typing import Any, Callable, Dict, FrozenSet, Iterator, List, Optional, Tuple
+
+from sqlalchemy import String, bindparam, cast, delete, func, select
+from sqlalchemy.orm import Session
+
+from crud import record_tombstones
+from database import SessionLocal
+from models import Expense, ExpenseAnomaly
+from services import partitioning
+from services.leader_election import LeaderElection, advisory_xact_lock
+from startup import lazy_import
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "0") == "1"
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", str(Path(__file__).resolve().parent.parent / "data" / "archive"))
+# Keep the current year and this many full years before it in the live tables (at least one)
+ARCHIVE_AFTER_YEARS = max(int(os.getenv("ARCHIVE_AFTER_YEARS", "3")), 1)
+# Live rows deleted per statement
+ARCHIVE_DELETE_BATCH = 5000
+# Held by every run (scheduled or manual, any worker) while it moves a month
+_MOVE_LOCK = "history_archive_move"
+
+_MONTH_RE = re.compile(r"^\d{4}-\d{2}$")
+
+
+@dataclass(frozen=True)
+class ArchiveSpec:
+    model: Any
+    columns: Tuple[str, ...]
+    schema: Callable[[Any], Any]  # pyarrow module -> pyarrow schema
+    on_archive: Optional[Callable[[Session, List[uuid.UUID]], None]] = None
+
+
+def _expense_schema(pa):
+    return pa.schema([
+        ("id", pa.string()),
+        ("description", pa.string()),
+        ("amount", pa.decimal128(10, 2)),
+        ("category_id", pa.string()),
+        ("date", pa.string()),
+        ("created_at", pa.timestamp("us")),
+    ])
+
+
+def _drop_expense_flags(db: Session, ids: List[uuid.UUID]):
+    db.execute(
+        delete(ExpenseAnomaly).where(ExpenseAnomaly.expense_id.in_(bindparam("ids", expanding=True))),
+        {"ids": ids},
+    )
+
+
+# Tables with a YYYY-MM-DD ``date`` column that can be archived
+ARCHIVES: Dict[str, ArchiveSpec] = {
+    "expenses": ArchiveSpec(
+        model=Expense,
+        columns=("id", "description", "amount", "category_id", "date", "created_at"),
+        schema=_expense_schema,
+        on_archive=_drop_expense_flags,
+    ),
+}
+
+
+def _next_month(month: str) -> str:
+    year, mon = int(month[:4]), int(month[5:7])
+    return f"{year + mon // 12:04d}-{mon % 12 + 1:02d}"
+
+
+class ArchiveService:
+    def __init__(self, root: str = ARCHIVE_DIR):
+        self.root = Path(root)
+        self.leader = LeaderElection("history_archive")
+        self._lock = threading.Lock()
+        # (table, column) -> (file names and mtimes, distinct values)
+        self._distinct: Dict[Tuple[str, str], Tuple[tuple, FrozenSet[Any]]] = {}
+
+    @staticmethod
+    def cutoff(today: Optional[date] = None) -> str:
+        """First date that stays in the live tables"""
+        today = today or date.today()
+        return f"{today.year - ARCHIVE_AFTER_YEARS:04d}-01-01"
+
+    def _files(self, name: str, date_from: Optional[str] = None, date_to: Optional[str] = None) -> List[Path]:
+        directory = self.root / name
+        if not directory.is_dir():
+            return []
+        files = []
+        for path in sorted(directory.glob("*.parquet")):
+            month = path.stem
+            # Month files outside the requested range are never opened
+            if date_from and month < date_from[:7]:
+                continue
+            if date_to and month > date_to[:7]:
+                continue
+            files.append(path)
+        return files
+
+    def status(self) -> Dict[str, Any]:
+        tables = {}
+        for name in ARCHIVES:
+            files = self._files(name)
+            tables[name] = {
+                "files": len(files),
+                "size_bytes": sum(f.stat().st_size for f in files),
+                "first_month": files[0].stem if files else None,
+                "last_month": files[-1].stem if files else None,
+            }
+        return {"enabled": ARCHIVE_ENABLED, "cutoff": self.cutoff(), "directory": str(self.root), "tables": tables}
+
+    def scheduled_archive(self):
+        """Daily job - only the elected worker moves data"""
+        if not self.leader.check():
+            return
+        try:
+            for name in ARCHIVES:
+                self.archive(name)
+        except Exception as e:
+            logger.error(f"History archival failed: {e}")
+
+    def archive(self, name: str, cutoff: Optional[date] = None, month: Optional[str] = None) -> Dict[str, Any]:
+        """Move rows dated before ``cutoff`` (or only those of ``month``, YYYY-MM) into monthly Parquet files
+
+        The cutoff is capped at ``cutoff()``, so recent history always stays live.
+        """
+        spec = ARCHIVES[name]
+        cutoff = min(cutoff.isoformat(), self.cutoff()) if cutoff else self.cutoff()
+        since = None
+        if month is not None:
+            if not _MONTH_RE.match(month) or f"{_next_month(month)}-01" > cutoff:
+                raise ValueError(f"Only months before {cutoff} can be archived")
+            since, cutoff = f"{month}-01", f"{_next_month(month)}-01"
+        model = spec.model
+        archived_rows = 0
+        months_done = []
+        with self._lock:
+            db = SessionLocal()
+            try:
+                advisory_xact_lock(db, _MOVE_LOCK)
+                query = select(func.substr(model.date, 1, 7)).where(model.date < cutoff)
+                if since:
+                    query = query.where(model.date >= since)
+                months = db.execute(query.distinct()).scalars().all()
+                db.commit()
+                for month in sorted(m for m in months if _MONTH_RE.match(m)):
+                    # Another worker may be moving months too; after it, this month's rows are gone
+                    advisory_xact_lock(db, _MOVE_LOCK)
+                    start, end = f"{month}-01", f"{_next_month(month)}-01"
+                    columns = [cast(getattr(model, c), String) if c.endswith("id") else getattr(model, c) for c in spec.columns]
+                    # Locked until commit, so no archived row is changed before it is deleted
+                    rows = db.connection().execute(
+                        select(*columns).where(model.date >= start, model.date < end).with_for_update()
+                    ).all()
+                    if not rows:
+                        db.commit()
+                        continue
+                    # The file is durable before the live rows go away; a rerun merges by id
+                    self._write_month(name, month, [dict(zip(spec.columns, r)) for r in rows])
+                    # Only the rows that were written - anything inserted or backdated
+                    # into the month since the SELECT stays live for the next run
+                    ids = [uuid.UUID(r[spec.columns.index("id")]) for r in rows]
+                    for i in range(0, len(ids), ARCHIVE_DELETE_BATCH):
+                        batch = ids[i:i + ARCHIVE_DELETE_BATCH]
+                        if spec.on_archive:
+                            spec.on_archive(db, batch)
+                        db.execute(delete(model).where(model.id.in_(bindparam("ids", expanding=True))), {"ids": batch})
+                        record_tombstones(db, model.__table__, batch)
+                    db.commit()
+                    archived_rows += len(rows)
+                    months_done.append(month)
+            finally:
+                db.close()
+
+        if name == "expenses" and partitioning.enabled():
+            # Partitions emptied by this or an interrupted earlier run are dropped rather than left behind
+            for partition in partitioning.list_partitions():
+                match = re.match(r"^expenses_y(\d{4})m(\d{2})$", partition["name"])
+                if not match or f"{match.group(1)}-{match.group(2)}-01" >= cutoff:
+                    continue
+                try:
+                    if partitioning.is_empty(partition["name"]):
+                        partitioning.detach_partition(partition["name"], drop=True)
+                except Exception as e:
+                    logger.warning(f"Could not drop partition {partition['name']}: {e}")
+
+        logger.info(f"Archived {archived_rows} {name} rows from {len(months_done)} months before {cutoff}")
+        return {"table": name, "cutoff": cutoff, "rows": archived_rows, "months": months_done}
+
+    def _write_month(self, name: str, month: str, rows: List[Dict[str, Any]]):
+        pa = lazy_import("pyarrow")
+        pq = lazy_import("pyarrow.parquet")
+        schema = ARCHIVES[name].schema(pa)
+        directory = self.root / name
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{month}.parquet"
+
+        table = pa.Table.from_pylist(rows, schema=schema)
+        if path.exists():
+            existing = pq.read_table(path, schema=schema)
+            new_ids = set(table.column("id").to_pylist())
+            keep = [i for i, id_ in enumerate(existing.column("id").to_pylist()) if id_ not in new_ids]
+            table = pa.concat_tables([existing.take(keep), table])
+        table = table.sort_by([("date", "ascending"), ("id", "ascending")])
+
+        tmp_path = path.with_suffix(".parquet.tmp")
+        pq.write_table(table, tmp_path, compression="zstd")
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        # Make the rename itself durable before the live rows are deleted
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def _read(self, name: str, date_from: Optional[str], date_to: Optional[str], filters: Dict[str, Any]):
+        files = self._files(name, date_from, date_to)
+        if not files:
+            return None
+        ds = lazy_import("pyarrow.dataset")
+        dataset = ds.dataset([str(f) for f in files], format="parquet", schema=ARCHIVES[name].schema(lazy_import("pyarrow")))
+        expression = None
+        conditions = []
+        if date_from:
+            conditions.append(ds.field("date") >= date_from)
+        if date_to:
+            conditions.append(ds.field("date") <= date_to)
+        conditions.extend(ds.field(column) == value for column, value in filters.items() if value is not None)
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return dataset.to_table(filter=expression)
+
+    def has_rows(self, name: str, date_from: Optional[str] = None, date_to: Optional[str] = None) -> bool:
+        """Whether archive files may hold rows in the date range"""
+        return bool(self._files(name, date_from, date_to))
+
+    def distinct_values(self, name: str, column: str) -> FrozenSet[Any]:
+        """Distinct values of ``column`` over the archived part of a table, cached until a file changes"""
+        files = self._files(name)
+        if not files:
+            return frozenset()
+        stamp = tuple((f.name, f.stat().st_mtime_ns) for f in files)
+        cached = self._distinct.get((name, column))
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        ds = lazy_import("pyarrow.dataset")
+        dataset = ds.dataset([str(f) for f in files], format="parquet", schema=ARCHIVES[name].schema(lazy_import("pyarrow")))
+        values = lazy_import("pyarrow.compute").unique(dataset.to_table(columns=[column]).column(column))
+        result = frozenset(v for v in values.to_pylist() if v is not None)
+        self._distinct[(name, column)] = (stamp, result)
+        return result
+
+    def iter_rows(
+        self,
+        db: Session,
+        name: str,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        **filters: Any,
+    ) -> Iterator[Dict[str, Any]]:
+        """Archived rows followed by live rows, oldest first, as plain dicts"""
+        spec = ARCHIVES[name]
+        filters = {k: v for k, v in filters.items() if v is not None}
+        try:
+            archived = self._read(name, date_from, date_to, {k: str(v) for k, v in filters.items()})
+        except ImportError:
+            logger.warning("pyarrow is not installed - archived rows are skipped")
+            archived = None
+        if archived is not None:
+            for batch in archived.to_batches():
+                for row in batch.to_pylist():
+                    yield {**row, "source": "archive"}
+
+        model = spec.model
+        query = db.query(*[getattr(model, c) for c in spec.columns])
+        if date_from:
+            query = query.filter(model.date >= date_from)
+        if date_to:
+            query = query.filter(model.date <= date_to)
+        for column, value in filters.items():
+            query = query.filter(getattr(model, column) == value)
+        for row in query.order_by(model.date, model.id).yield_per(1000):
+            yield {**{c: (str(v) if c.endswith("id") else v) for c, v in zip(spec.columns, row)}, "source": "live"}
+
+    def aggregate(
+        self,
+        name: str,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        **filters: Any,
+    ) -> Tuple[float, int]:
+        """(sum of amount, row count) over the archived part of a table"""
+        try:
+            table = self._read(name, date_from, date_to, {k: str(v) for k, v in filters.items() if v is not None})
+        except ImportError:
+            return 0.0, 0
+        if table is None or table.num_rows == 0:
+            return 0.0, 0
+        total = lazy_import("pyarrow.compute").sum(table.column("amount")).as_py()
+        return float(total or 0), table.num_rows
+
+    def totals_by(self, name: str, column: str) -> Dict[str, Tuple[float, int]]:
+        """(sum of amount, row count) per value of ``column`` over the archived part of a table"""
+        try:
+            table = self._read(name, None, None, {})
+        except ImportError:
+            return {}
+        if table is None or table.num_rows == 0:
+            return {}
+        grouped = table.group_by(column).aggregate([("amount", "sum"), ("amount", "count")])
+        return {
+            key: (float(total or 0), count)
+            for key, total, count in zip(
+                grouped.column(column).to_pylist(),
+                grouped.column("amount_sum").to_pylist(),
+                grouped.column("amount_count").to_pylist(),
+            )
+        }
+
+
+archive_service = ArchiveService()
@@ -0,0 +1,200 @@
+"""
+Fan-out of price updates to streaming clients
+
+Subscribers live in the worker serving their stream, while prices are
+produced by whichever worker leads the refresh job. Shared events therefore
+go through PostgreSQL NOTIFY on PRICE_CHANNEL, and a relay thread in every
+worker LISTENs and hands them to its local subscribers.
+"""
+import asyncio
+import json
+import logging
+import queue
+import select
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Set
+
+from database import engine
+
+logger = logging.getLogger(__name__)
+
+PRICE_CHANNEL = "price_updates"
+RELAY_QUEUE_SIZE = 10000
+
+
+class Subscription:
+    """A single client's bounded queue of price events"""
+
+    def __init__(self, symbols: Optional[Set[str]], queue_size: int):
+        self.symbols = symbols
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        # Events dropped since the client last emptied its queue
+        self.dropped = 0
+        self.closed = False
+
+    def wants(self, symbol: str) -> bool:
+        return self.symbols is None or symbol in self.symbols
+
+
+class PriceBroadcaster:
+    """Publish price changes once and fan them out to every subscriber
+
+    Producers may run in scheduler threads - events are handed over to the
+    event loop with ``call_soon_threadsafe``. Each subscriber has a bounded
+    queue; when a slow client falls behind its oldest events are dropped, and
+    a client that drops ``max_dropped`` events without ever catching up is
+    disconnected.
+    """
+
+    def __init__(self, queue_size: int = 256, max_dropped: int = 1024):
+        self.queue_size = queue_size
+        self.max_dropped = max_dropped
+        self._subscribers: Set[Subscription] = set()
+        self._latest: Dict[str, Dict[str, Any]] = {}
+        self._latest_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._outgoing: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=RELAY_QUEUE_SIZE)
+        self._relay: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        """Attach the event loop that serves the streaming clients"""
+        self._loop = loop
+
+    def subscribe(self, symbols: Optional[Iterable[str]] = None) -> Subscription:
+        """Register a client, optionally limited to some symbols"""
+        wanted = {s.upper() for s in symbols} if symbols else None
+        subscription = Subscription(wanted, self.queue_size)
+        # Start with the last known quotes so clients don't wait for the next change
+        with self._latest_lock:
+            latest = list(self._latest.items())
+        for symbol, event in latest:
+            if subscription.wants(symbol) and not subscription.queue.full():
+                subscription.queue.put_nowait(event)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def share(self, symbol: str, price: float, source: str, **extra: Any):
+        """Publish a price to the subscribers of every worker
+
+        Call it only once the price is committed. Without the relay (no
+        PostgreSQL) this is a local ``publish``.
+        """
+        event = {"symbol": symbol.upper(), "price": price, "source": source, **extra}
+        if self._relay is None:
+            self.publish(**event)
+            return
+        try:
+            self._outgoing.put_nowait(event)
+        except queue.Full:
+            logger.warning(f"Price relay queue full, dropping update for {event['symbol']}")
+
+    def publish(self, symbol: str, price: float, source: str, **extra: Any):
+        """Broadcast a price to this worker's subscribers if it differs from the last one"""
+        symbol = symbol.upper()
+        event = {"symbol": symbol, "price": price, "source": source, "ts": time.time(), **extra}
+        with self._latest_lock:
+            previous = self._latest.get(symbol)
+            if previous is not None and previous["price"] == price:
+                return
+            self._latest[symbol] = event
+
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._dispatch(event)
+        else:
+            loop.call_soon_threadsafe(self._dispatch, event)
+
+    def _dispatch(self, event: Dict[str, Any]):
+        for subscription in list(self._subscribers):
+            if not subscription.wants(event["symbol"]):
+                continue
+            queue = subscription.queue
+            if queue.empty():
+                # Caught up - earlier bursts no longer count against it
+                subscription.dropped = 0
+            elif queue.full():
+                queue.get_nowait()
+                subscription.dropped += 1
+                if subscription.dropped > self.max_dropped:
+                    logger.warning("Disconnecting slow price stream client")
+                    subscription.closed = True
+                    self._subscribers.discard(subscription)
+                    # Wake the client up so it notices it was closed
+                    queue.put_nowait(None)
+                    continue
+            queue.put_nowait(event)
+
+    def start_relay(self):
+        """LISTEN for shared price events (PostgreSQL only)"""
+        if engine.dialect.name != "postgresql" or self._relay is not None:
+            return
+        self._stop.clear()
+        self._relay = threading.Thread(target=self._relay_loop, name="price-relay", daemon=True)
+        self._relay.start()
+
+    def stop_relay(self):
+        if self._relay is None:
+            return
+        self._stop.set()
+        self._relay.join(timeout=5)
+        self._relay = None
+
+    def _relay_loop(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                raw = engine.raw_connection()
+                try:
+                    conn = raw.driver_connection
+                    conn.autocommit = True
+                    with conn.cursor() as cursor:
+                        cursor.execute(f"LISTEN {PRICE_CHANNEL}")
+                    logger.info("Price relay listening")
+                    backoff = 1.0
+                    self._pump(conn)
+                finally:
+                    raw.invalidate()
+            except Exception as e:
+                logger.warning(f"Price relay connection failed: {e}, retrying in {backoff:.0f}s")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 60.0)
+
+    def _pump(self, conn):
+        """Send queued events and deliver notifications until stopped"""
+        while not self._stop.is_set():
+            pending = []
+            while True:
+                try:
+                    pending.append(self._outgoing.get_nowait())
+                except queue.Empty:
+                    break
+            if pending:
+                with conn.cursor() as cursor:
+                    for event in pending:
+                        cursor.execute("SELECT pg_notify(%s, %s)", (PRICE_CHANNEL, json.dumps(event)))
+            if select.select([conn], [], [], 0.2)[0]:
+                conn.poll()
+            while conn.notifies:
+                notification = conn.notifies.pop(0)
+                try:
+                    self.publish(**json.loads(notification.payload))
+                except (TypeError, ValueError) as e:
+                    logger.warning(f"Ignoring malformed price event: {e}")
+
+
+broadcaster = PriceBroadcaster()
@@ -0,0 +1,278 @@
+"""
+Local expense categorizer: hashed n-gram features with a multinomial naive Bayes model
+
+Descriptions are hashed into a fixed feature space (character 3-5 grams plus
+words), so the model is a dense (categories x features) count matrix. Scoring
+a batch is a single gather and segment sum over the log-probabilities, and
+learning from a recategorized expense is just moving counts between rows.
+The matrix is cached on disk as an ``.npz`` artifact. Workers learn
+independently and merge their pending updates into the artifact on disk
+when saving, so one worker does not overwrite what another learned.
+"""
+import fcntl
+import logging
+import os
+import re
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import String, cast, select
+from sqlalchemy.orm import Session
+
+from models import Expense
+from services.symbol_index import normalize
+from startup import lazy_import
+
+logger = logging.getLogger(__name__)
+
+CATEGORIZER_MODEL_FILE = os.getenv(
+    "CATEGORIZER_MODEL_FILE",
+    str(Path(__file__).resolve().parent.parent / "data" / "models" / "categorizer.npz"),
+)
+CATEGORIZER_FEATURES = int(os.getenv("CATEGORIZER_FEATURES", str(2 ** 16)))
+# Write the artifact after this many incremental updates
+CATEGORIZER_SAVE_EVERY = int(os.getenv("CATEGORIZER_SAVE_EVERY", "50"))
+SMOOTHING = 0.1
+
+_WORD_RE = re.compile(r"[a-z]+")
+_DIGITS_RE = re.compile(r"\d+")
+
+
+def features(description: str, n_features: int = CATEGORIZER_FEATURES) -> List[int]:
+    """Hashed feature indices of a description"""
+    # Card numbers, dates and amounts carry no category signal
+    text = _DIGITS_RE.sub("0", normalize(description))
+    padded = f" {text} "
+    grams = [padded[i:i + n] for n in (3, 4, 5) for i in range(len(padded) - n + 1)]
+    grams.extend(f"w:{word}" for word in _WORD_RE.findall(text))
+    # crc32 is stable across processes, unlike hash()
+    return [zlib.crc32(gram.encode()) % n_features for gram in grams]
+
+
+class Categorizer:
+    def __init__(self, path: str = CATEGORIZER_MODEL_FILE, n_features: int = CATEGORIZER_FEATURES):
+        self.path = path
+        self.n_features = n_features
+        self._classes: List[str] = []
+        self._counts = None  # (n_classes, n_features) float32
+        self._docs = None  # (n_classes,) expenses per class
+        self._log_prob = None
+        self._log_prior = None
+        self._trained_rows = 0
+        # Examples learned since the last save, replayed onto the artifact when saving
+        self._pending: List[Tuple[str, str, Optional[str]]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._counts is not None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.loaded,
+            "categories": len(self._classes),
+            "features": self.n_features,
+            "trained_rows": self._trained_rows,
+            "pending_updates": len(self._pending),
+            "artifact": self.path if os.path.exists(self.path) else None,
+        }
+
+    def ensure_loaded(self, db: Session):
+        """Load the cached artifact, or train from the database when there is none"""
+        if self.loaded:
+            return
+        with self._lock:
+            if self.loaded:
+                return
+            if os.path.exists(self.path):
+                try:
+                    self._load()
+                    return
+                except Exception as e:
+                    logger.error(f"Failed to load categorizer model, retraining: {e}")
+        self.train(db)
+
+    def train(self, db: Session) -> Dict[str, Any]:
+        """Rebuild the model from every categorized expense"""
+        np = lazy_import("numpy")
+        rows = db.connection().execute(
+            select(Expense.description, cast(Expense.category_id, String))
+        ).all()
+        classes = sorted({category for _, category in rows})
+        class_index = {category: i for i, category in enumerate(classes)}
+        flat: List[int] = []
+        for description, category in rows:
+            offset = class_index[category] * self.n_features
+            flat.extend(offset + f for f in features(description, self.n_features))
+        counts = np.bincount(
+            np.array(flat, dtype=np.int64), minlength=len(classes) * self.n_features
+        ).astype(np.float32).reshape(len(classes), self.n_features)
+        docs = np.bincount(
+            np.array([class_index[category] for _, category in rows], dtype=np.int64), minlength=len(classes)
+        ).astype(np.float64)
+
+        with self._lock:
+            self._classes = classes
+            self._counts = counts
+            self._docs = docs
+            self._trained_rows = len(rows)
+            # The database already reflects every recategorization
+            self._pending = []
+            self._recompute()
+            self._save()
+        logger.info(f"Categorizer trained on {len(rows)} expenses, {len(classes)} categories")
+        return self.status()
+
+    def learn(self, description: str, category_id: Any, previous_category_id: Optional[Any] = None):
+        """Incrementally move a description to ``category_id`` (e.g. after a manual recategorization)"""
+        self.learn_many([(description, category_id, previous_category_id)])
+
+    def learn_many(self, examples: Sequence[Tuple[str, Any, Optional[Any]]]):
+        """Apply several (description, category_id, previous_category_id) updates
+
+        Only the log-probabilities of the touched categories are recomputed.
+        """
+        if not self.loaded or not examples:
+            return
+        examples = [
+            (description, str(category_id), None if previous is None else str(previous))
+            for description, category_id, previous in examples
+        ]
+        with self._lock:
+            touched = self._apply(examples)
+            self._recompute(touched)
+            self._pending.extend(examples)
+            if len(self._pending) >= CATEGORIZER_SAVE_EVERY:
+                self._save()
+
+    def _apply(self, examples: Sequence[Tuple[str, str, Optional[str]]]) -> List[int]:
+        """Move the counts of ``examples`` between rows, return the rows touched"""
+        np = lazy_import("numpy")
+        touched = set()
+        for description, category, previous in examples:
+            feats = np.array(features(description, self.n_features))
+            if previous is not None and previous in self._classes:
+                row = self._classes.index(previous)
+                np.subtract.at(self._counts[row], feats, 1.0)
+                np.maximum(self._counts[row], 0, out=self._counts[row])
+                self._docs[row] = max(self._docs[row] - 1, 0)
+                touched.add(row)
+            else:
+                self._trained_rows += 1
+            if category not in self._classes:
+                self._classes.append(category)
+                self._counts = np.vstack([self._counts, np.zeros((1, self.n_features), dtype=np.float32)])
+                self._docs = np.append(self._docs, 0.0)
+            row = self._classes.index(category)
+            np.add.at(self._counts[row], feats, 1.0)
+            self._docs[row] += 1
+            touched.add(row)
+        return sorted(touched)
+
+    def predict(self, descriptions: Sequence[str]) -> List[Dict[str, Any]]:
+        """Most likely category and its probability for each description"""
+        np = lazy_import("numpy")
+        if not descriptions:
+            return []
+        lengths = []
+        feats: List[int] = []
+        for description in descriptions:
+            f = features(description, self.n_features)
+            feats.extend(f)
+            lengths.append(len(f))
+        lengths = np.array(lengths)
+        # learn() updates rows in place - gather the columns under the lock
+        with self._lock:
+            classes, log_prior = list(self._classes), self._log_prior
+            if not classes:
+                return [{"description": d, "category_id": None, "confidence": 0.0} for d in descriptions]
+            gathered = (
+                self._log_prob[:, np.array(feats, dtype=np.int64)] if feats else np.zeros((len(classes), 0))
+            )
+        # Segment sums over the gathered columns; empty descriptions fall back to the prior
+        scores = np.zeros((len(classes), len(descriptions)), dtype=np.float64)
+        nonempty = lengths > 0
+        if nonempty.any():
+            starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))[nonempty]
+            scores[:, nonempty] = np.add.reduceat(gathered, starts, axis=1)
+        scores += log_prior[:, None]
+
+        scores -= scores.max(axis=0)
+        probs = np.exp(scores)
+        probs /= probs.sum(axis=0)
+        best = probs.argmax(axis=0)
+        return [
+            {"description": d, "category_id": classes[best[i]], "confidence": round(float(probs[best[i], i]), 4)}
+            for i, d in enumerate(descriptions)
+        ]
+
+    def save_if_dirty(self):
+        with self._lock:
+            if self._pending:
+                self._save()
+
+    def _recompute(self, rows: Optional[Sequence[int]] = None):
+        """Refresh the log-probabilities of ``rows`` (all when None) and the class priors"""
+        np = lazy_import("numpy")
+        n_classes = len(self._counts)
+        if rows is None or self._log_prob is None:
+            self._log_prob = np.empty(self._counts.shape, dtype=np.float32)
+            rows = range(n_classes)
+        elif len(self._log_prob) < n_classes:
+            # Rows for new categories
+            known = len(self._log_prob)
+            self._log_prob = np.vstack([self._log_prob, np.empty((n_classes - known, self.n_features), dtype=np.float32)])
+            rows = sorted(set(rows) | set(range(known, n_classes)))
+        rows = np.asarray(list(rows), dtype=np.int64)
+        if len(rows):
+            smoothed = self._counts[rows] + SMOOTHING
+            self._log_prob[rows] = np.log(smoothed) - np.log(smoothed.sum(axis=1, keepdims=True))
+        # Class priors from the number of expenses per category, not their n-gram counts
+        docs = self._docs + 1.0
+        self._log_prior = np.log(docs / docs.sum())
+
+    def _save(self):
+        """Write the model, merging this worker's pending updates into the artifact on disk"""
+        np = lazy_import("numpy")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(f"{self.path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if self._pending and os.path.exists(self.path):
+                # Other workers may have saved what they learned - replay ours on top of it
+                pending = self._pending
+                try:
+                    self._load()
+                except Exception as e:
+                    logger.warning(f"Could not merge categorizer artifact, overwriting it: {e}")
+                else:
+                    self._recompute(self._apply(pending))
+            tmp_path = f"{self.path}.tmp.npz"
+            np.savez_compressed(
+                tmp_path,
+                counts=self._counts,
+                docs=self._docs,
+                classes=np.array(self._classes, dtype=str),
+                trained_rows=self._trained_rows,
+            )
+            os.replace(tmp_path, self.path)
+        self._pending = []
+
+    def _load(self):
+        np = lazy_import("numpy")
+        with np.load(self.path) as artifact:
+            counts = artifact["counts"]
+            if counts.shape[1] != self.n_features:
+                raise ValueError(f"artifact has {counts.shape[1]} features, expected {self.n_features}")
+            if "docs" not in artifact.files:
+                raise ValueError("artifact has no per-category document counts")
+            self._counts = counts.astype(np.float32)
+            self._docs = artifact["docs"].astype(np.float64)
+            self._classes = [str(c) for c in artifact["classes"]]
+            self._trained_rows = int(artifact["trained_rows"])
+        self._recompute()
+        logger.info(f"Categorizer loaded from {self.path}")
+
+
+categorizer = Categorizer()
@@ -0,0 +1,250 @@
+"""
+Streaming crypto ticker ingestion into an in-memory quote book
+
+The feed is opt-in (CRYPTO_FEED) and subscribes only to the watched pairs -
+the stablecoin PLN rates, held crypto investments and assets seen in the
+Binance balances - rather than the whole market. Every worker that runs it
+keeps its own small connection and quote book.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set
+
+from database import SessionLocal
+from models import Investment
+from services.broadcaster import broadcaster
+from services.market_hours import CRYPTO_QUOTES
+
+logger = logging.getLogger(__name__)
+
+CRYPTO_FEED = os.getenv("CRYPTO_FEED", "off")  # binance, replay, off
+CRYPTO_FEED_URL = os.getenv("CRYPTO_FEED_URL", "wss://stream.binance.com:9443/stream")
+# Pairs watched from the start besides held crypto investments
+CRYPTO_FEED_SYMBOLS = os.getenv("CRYPTO_FEED_SYMBOLS", "USDTPLN,USDCPLN,FDUSDPLN")
+CRYPTO_FEED_REPLAY_FILE = os.getenv(
+    "CRYPTO_FEED_REPLAY_FILE",
+    str(Path(__file__).resolve().parent.parent / "data" / "crypto_ticker_replay.jsonl"),
+)
+CRYPTO_FEED_REPLAY_INTERVAL = float(os.getenv("CRYPTO_FEED_REPLAY_INTERVAL", "1.0"))
+# Quotes older than this are not trusted for valuation
+CRYPTO_QUOTE_MAX_AGE_SECONDS = float(os.getenv("CRYPTO_QUOTE_MAX_AGE_SECONDS", "120"))
+
+
+@dataclass
+class Quote:
+    symbol: str
+    price: float
+    change_24h: float
+    change_pct_24h: float
+    updated_at: float
+
+
+class QuoteBook:
+    """Last price and 24h change per symbol"""
+
+    def __init__(self):
+        self._quotes: Dict[str, Quote] = {}
+        self._lock = threading.Lock()
+
+    def update(self, symbol: str, price: float, change_24h: float, change_pct_24h: float):
+        quote = Quote(symbol.upper(), price, change_24h, change_pct_24h, time.time())
+        with self._lock:
+            self._quotes[quote.symbol] = quote
+        broadcaster.publish(quote.symbol, price, source="binance", change_24h=change_24h)
+
+    def get(self, symbol: str, max_age: Optional[float] = CRYPTO_QUOTE_MAX_AGE_SECONDS) -> Optional[Quote]:
+        """Return a quote, or None when unknown or older than ``max_age`` seconds"""
+        quote = self._quotes.get(symbol.upper())
+        if quote is None:
+            return None
+        if max_age is not None and time.time() - quote.updated_at > max_age:
+            return None
+        return quote
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [asdict(q) for q in self._quotes.values()]
+
+    def __len__(self) -> int:
+        return len(self._quotes)
+
+
+def binance_pair(symbol: str) -> Optional[str]:
+    """Binance pair of a Yahoo crypto symbol (BTC-USD -> BTCUSDT), None for other symbols"""
+    symbol = symbol.upper()
+    if not symbol.endswith(CRYPTO_QUOTES):
+        return None
+    base, quote = symbol.rsplit("-", 1)
+    return base + ("USDT" if quote == "USD" else quote)
+
+
+class BinanceTickerSource:
+    """Binance 24h ticker websocket stream of the watched pairs
+
+    Reconnects with the new stream list whenever the watched set changes.
+    """
+
+    def __init__(self, url: str = CRYPTO_FEED_URL):
+        self.url = url
+        self.symbols: Set[str] = set()
+        # Set from request threads, so not an asyncio.Event
+        self._changed = threading.Event()
+
+    def watch(self, symbols: Set[str]):
+        self.symbols = set(symbols)
+        self._changed.set()
+
+    async def messages(self) -> AsyncIterator[Any]:
+        import websockets
+
+        self._changed.clear()
+        while not self.symbols:
+            await asyncio.sleep(1)
+        streams = "/".join(f"{s.lower()}@ticker" for s in sorted(self.symbols))
+        async with websockets.connect(f"{self.url}?streams={streams}", ping_interval=20) as ws:
+            async for raw in ws:
+                yield json.loads(raw)
+                if self._changed.is_set():
+                    return
+
+
+class ReplayTickerSource:
+    """Replay recorded ticker messages from a JSON lines file
+
+    Stand-in for the live stream in tests and offline runs. Each line holds one
+    message in the Binance ticker format (a ticker object or a list of them).
+    """
+
+    def __init__(self, path: str = CRYPTO_FEED_REPLAY_FILE, interval: float = CRYPTO_FEED_REPLAY_INTERVAL,
+                 loop: bool = True):
+        self.path = path
+        self.interval = interval
+        self.loop = loop
+
+    async def messages(self) -> AsyncIterator[Any]:
+        lines = [line for line in Path(self.path).read_text().splitlines() if line.strip()]
+        while True:
+            for line in lines:
+                yield json.loads(line)
+                await asyncio.sleep(self.interval)
+            if not self.loop:
+                return
+
+
+class CryptoFeed:
+    """Background task feeding a ticker source into the quote book"""
+
+    def __init__(self, book: QuoteBook, source=None):
+        self.book = book
+        self.source = source
+        self.messages_received = 0
+        self.last_message_at: Optional[float] = None
+        self.watched: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start ingesting on the running event loop"""
+        if self.source is None:
+            self.source = _source_from_config()
+        if self.source is None:
+            logger.info("Crypto feed disabled")
+            return
+        self.watch([s for s in CRYPTO_FEED_SYMBOLS.split(",") if s.strip()] + _held_pairs())
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Crypto feed started ({type(self.source).__name__})")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            logger.info("Crypto feed stopped")
+
+    def watch(self, symbols: Iterable[str]):
+        """Add Binance pairs to the quote book"""
+        new = {s.strip().upper() for s in symbols} - self.watched
+        if not new:
+            return
+        self.watched |= new
+        if hasattr(self.source, "watch"):
+            self.source.watch(self.watched)
+
+    def ingest(self, message: Any):
+        """Apply one ticker message of a watched pair to the quote book"""
+        if isinstance(message, dict) and "data" in message:
+            # Combined stream envelope
+            message = message["data"]
+        tickers = message if isinstance(message, list) else [message]
+        for ticker in tickers:
+            try:
+                if ticker["s"].upper() not in self.watched:
+                    continue
+                self.book.update(
+                    ticker["s"],
+                    float(ticker["c"]),
+                    float(ticker.get("p", 0)),
+                    float(ticker.get("P", 0)),
+                )
+            except (KeyError, TypeError, ValueError):
+                continue
+        self.messages_received += 1
+        self.last_message_at = time.time()
+
+    async def _run(self):
+        backoff = 1.0
+        while True:
+            try:
+                async for message in self.source.messages():
+                    self.ingest(message)
+                    backoff = 1.0
+                if isinstance(self.source, ReplayTickerSource) and not self.source.loop:
+                    return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Crypto feed disconnected: {e}, reconnecting in {backoff:.0f}s")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "source": type(self.source).__name__ if self.source else None,
+            "running": self._task is not None and not self._task.done(),
+            "symbols": len(self.book),
+            "watched": sorted(self.watched),
+            "messages_received": self.messages_received,
+            "last_message_at": self.last_message_at,
+        }
+
+
+def _held_pairs() -> List[str]:
+    db = SessionLocal()
+    try:
+        symbols = [s for (s,) in db.query(Investment.symbol).distinct()]
+    except Exception as e:
+        logger.warning(f"Could not read held crypto symbols: {e}")
+        return []
+    finally:
+        db.close()
+    return [pair for pair in map(binance_pair, symbols) if pair]
+
+
+def _source_from_config():
+    if CRYPTO_FEED == "binance":
+        return BinanceTickerSource()
+    if CRYPTO_FEED == "replay":
+        return ReplayTickerSource()
+    return None
+
+
+quote_book = QuoteBook()
+crypto_feed = CryptoFeed(quote_book)
@@ -0,0 +1,80 @@
+"""
+Server-side downsampling of chart series
+
+``lttb`` keeps the points of a line series that preserve its visual shape
+(Largest-Triangle-Three-Buckets); ``ohlc_buckets`` merges candles into wider
+candles so highs and lows are never lost. Both return at most ``max_points``
+points and leave shorter series untouched.
+"""
+from typing import Any, Dict, List, Sequence
+
+from startup import lazy_import
+
+MIN_POINTS = 3
+
+
+def lttb_indices(x, y, max_points: int):
+    """Indices of the points LTTB keeps, first and last always included"""
+    np = lazy_import("numpy")
+    n = len(x)
+    if max_points >= n or max_points < MIN_POINTS:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # Interior points split into max_points - 2 buckets
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    # Averages of every bucket up front - the "next bucket" point C of each step
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    avg_x = np.append(sums_x / counts, x[-1])
+    avg_y = np.append(sums_y / counts, y[-1])
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for bucket in range(max_points - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        cx, cy = avg_x[bucket + 1], avg_y[bucket + 1]
+        # Twice the triangle area for every candidate in the bucket at once
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(area.argmax())
+        selected[bucket + 1] = a
+    return selected
+
+
+def lttb(points: Sequence[Dict[str, Any]], x_key: str, y_key: str, max_points: int) -> List[Dict[str, Any]]:
+    """Downsample a list of point dicts on ``x_key``/``y_key``"""
+    if max_points >= len(points) or max_points < MIN_POINTS:
+        return list(points)
+    x = [p[x_key] for p in points]
+    y = [p[y_key] for p in points]
+    return [points[i] for i in lttb_indices(x, y, max_points)]
+
+
+def ohlc_buckets(candles: Sequence[Dict[str, Any]], max_points: int, time_key: str = "open_time") -> List[Dict[str, Any]]:
+    """Merge consecutive candles into at most ``max_points`` candles"""
+    np = lazy_import("numpy")
+    n = len(candles)
+    if max_points >= n or max_points < 1:
+        return list(candles)
+
+    starts = np.unique(np.linspace(0, n, max_points, endpoint=False).astype(np.int64))
+    ends = np.append(starts[1:], n) - 1
+    times = np.array([c[time_key] for c in candles])
+    opens = np.array([c["open"] for c in candles], dtype=float)
+    highs = np.maximum.reduceat(np.array([c["high"] for c in candles], dtype=float), starts)
+    lows = np.minimum.reduceat(np.array([c["low"] for c in candles], dtype=float), starts)
+    closes = np.array([c["close"] for c in candles], dtype=float)
+    merged = [
+        {time_key: t, "open": o, "high": h, "low": l, "close": c}
+        for t, o, h, l, c in zip(
+            times[starts].tolist(), opens[starts].tolist(), highs.tolist(), lows.tolist(), closes[ends].tolist()
+        )
+    ]
+    if "volume" in candles[0]:
+        volumes = np.add.reduceat(np.array([c["volume"] for c in candles], dtype=float), starts)
+        for candle, volume in zip(merged, volumes.tolist()):
+            candle["volume"] = volume
+    return merged
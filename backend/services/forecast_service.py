@@ -0,0 +1,228 @@
+"""
+Cash-flow forecasting from recurring incomes and detected recurring expenses
+
+Everything is expanded onto a daily NumPy calendar: incomes by their
+frequency, recurring expenses on their usual day of month and the remaining
+(discretionary) spend as a flat daily rate. Balances and monthly totals are
+then cumulative sums and bincounts over that calendar.
+
+Only the live expenses table is read: the lookback window is recent, and the
+archive always keeps at least the last full year live.
+"""
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Dict, FrozenSet, List, Optional
+
+from sqlalchemy import distinct, func
+from sqlalchemy.orm import Session
+
+from models import Expense, Income, SavingsGoal
+from startup import lazy_import
+
+FORECAST_LOOKBACK_MONTHS = int(os.getenv("FORECAST_LOOKBACK_MONTHS", "6"))
+# An expense is recurring when the same description shows up in this many distinct months
+RECURRING_MIN_MONTHS = int(os.getenv("FORECAST_RECURRING_MIN_MONTHS", "3"))
+MAX_FORECAST_MONTHS = 36
+
+
+@dataclass(frozen=True)
+class Scenario:
+    income_change_pct: float = 0.0
+    spending_change_pct: float = 0.0
+    drop_recurring: FrozenSet[str] = field(default_factory=frozenset)
+    extra_monthly_income: float = 0.0
+
+
+def _add_months(day: date, months: int) -> date:
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def _monthly_events(np, anchors, months):
+    """Day index arrays for events on a fixed day of every month (clamped to month end)"""
+    month_starts = months.astype("datetime64[D]")
+    month_lengths = ((months + 1).astype("datetime64[D]") - month_starts).astype(int)
+    # (n_items, n_months) grid of event dates
+    day_offsets = np.minimum(anchors[:, None] - 1, month_lengths[None, :] - 1)
+    return month_starts[None, :] + day_offsets
+
+
+def detect_recurring_expenses(db: Session, today: Optional[date] = None) -> List[Dict[str, Any]]:
+    """Expenses with the same description in at least RECURRING_MIN_MONTHS of the lookback window"""
+    today = today or date.today()
+    since = _add_months(today, -FORECAST_LOOKBACK_MONTHS).isoformat()
+    key = func.lower(func.trim(Expense.description))
+    rows = (
+        db.query(
+            key.label("key"),
+            func.min(Expense.description).label("description"),
+            func.count(Expense.id).label("count"),
+            func.count(distinct(func.substr(Expense.date, 1, 7))).label("months"),
+            func.avg(Expense.amount).label("amount"),
+            func.max(Expense.date).label("last_date"),
+        )
+        .filter(Expense.date >= since, Expense.date <= today.isoformat())
+        .group_by(key)
+        .having(func.count(distinct(func.substr(Expense.date, 1, 7))) >= RECURRING_MIN_MONTHS)
+        .all()
+    )
+    return [
+        {
+            "key": r.key,
+            "description": r.description,
+            "amount": float(r.amount),
+            "day_of_month": int(r.last_date[8:10]),
+            "months_seen": r.months,
+        }
+        # Roughly once a month - daily coffee is discretionary spend, not a bill
+        for r in rows
+        if r.count <= r.months * 1.5
+    ]
+
+
+def build_forecast(
+    db: Session,
+    months: int = 12,
+    start_balance: float = 0.0,
+    scenario: Optional[Scenario] = None,
+    today: Optional[date] = None,
+) -> Dict[str, Any]:
+    """Project daily balance and monthly surplus for the next ``months`` months"""
+    np = lazy_import("numpy")
+    started = time.perf_counter()
+    scenario = scenario or Scenario()
+    today = today or date.today()
+    months = max(1, min(months, MAX_FORECAST_MONTHS))
+
+    start = np.datetime64(today, "D")
+    end = np.datetime64(_add_months(today, months), "D")
+    days = np.arange(start, end)
+    n_days = len(days)
+    month_grid = np.arange(np.datetime64(today, "M"), np.datetime64(_add_months(today, months), "M"))
+
+    income = np.zeros(n_days)
+    expenses = np.zeros(n_days)
+
+    def add_events(target, event_days, amounts):
+        """Scatter amounts onto the calendar, ignoring events outside the horizon"""
+        idx = (event_days - start).astype(int)
+        mask = (idx >= 0) & (idx < n_days)
+        np.add.at(target, idx[mask], np.broadcast_to(amounts, idx.shape)[mask])
+
+    # Incomes by frequency
+    incomes = db.query(Income.amount, Income.frequency, Income.date).all()
+    by_frequency: Dict[str, List] = {}
+    for r in incomes:
+        by_frequency.setdefault(r.frequency, []).append((float(r.amount), np.datetime64(r.date, "D")))
+
+    for frequency, items in by_frequency.items():
+        amounts = np.array([a for a, _ in items]) * (1 + scenario.income_change_pct / 100)
+        anchors = np.array([d for _, d in items])
+        if frequency == "monthly":
+            anchor_days = (anchors - anchors.astype("datetime64[M]").astype("datetime64[D]")).astype(int) + 1
+            grid = _monthly_events(np, anchor_days, month_grid)
+            # Don't project a recurring income before it started
+            grid = np.where(grid >= anchors[:, None], grid, np.datetime64("NaT"))
+            valid = ~np.isnat(grid)
+            add_events(income, grid[valid], np.broadcast_to(amounts[:, None], grid.shape)[valid])
+        elif frequency == "weekly":
+            first = np.maximum(0, -(-(start - anchors).astype(int) // 7))
+            weeks = np.arange(n_days // 7 + 2)
+            grid = anchors[:, None] + (first[:, None] + weeks[None, :]) * 7
+            add_events(income, grid, np.broadcast_to(amounts[:, None], grid.shape))
+        elif frequency == "yearly":
+            years = np.arange(today.year, today.year + months // 12 + 2)
+            offsets = anchors - anchors.astype("datetime64[Y]").astype("datetime64[D]")
+            grid = (years - 1970).astype("datetime64[Y]").astype("datetime64[D]")[None, :] + offsets[:, None]
+            grid = np.where(grid >= anchors[:, None], grid, np.datetime64("NaT"))
+            valid = ~np.isnat(grid)
+            add_events(income, grid[valid], np.broadcast_to(amounts[:, None], grid.shape)[valid])
+        else:  # one-time
+            add_events(income, anchors, amounts)
+
+    if scenario.extra_monthly_income:
+        first_days = month_grid.astype("datetime64[D]")
+        add_events(income, first_days, np.full(len(first_days), scenario.extra_monthly_income))
+
+    # Recurring expenses on their usual day of month
+    spending_factor = 1 + scenario.spending_change_pct / 100
+    recurring = detect_recurring_expenses(db, today)
+    kept = [r for r in recurring if r["key"] not in scenario.drop_recurring]
+    if kept:
+        grid = _monthly_events(np, np.array([r["day_of_month"] for r in kept]), month_grid)
+        amounts = np.array([r["amount"] for r in kept]) * spending_factor
+        add_events(expenses, grid, np.broadcast_to(amounts[:, None], grid.shape))
+
+    # Everything else is spread evenly as a daily discretionary rate
+    lookback_start = _add_months(today, -FORECAST_LOOKBACK_MONTHS)
+    total_spent = float(
+        db.query(func.coalesce(func.sum(Expense.amount), 0))
+        .filter(Expense.date >= lookback_start.isoformat(), Expense.date < today.isoformat())
+        .scalar()
+    )
+    lookback_days = max((today - lookback_start).days, 1)
+    recurring_monthly = sum(r["amount"] for r in recurring)
+    discretionary_daily = max(total_spent / lookback_days - recurring_monthly * 12 / 365, 0.0)
+    expenses += discretionary_daily * spending_factor
+
+    net = income - expenses
+    balance = start_balance + np.cumsum(net)
+
+    month_index = (days.astype("datetime64[M]") - month_grid[0]).astype(int)
+    monthly_income = np.bincount(month_index, weights=income, minlength=len(month_grid))
+    monthly_expenses = np.bincount(month_index, weights=expenses, minlength=len(month_grid))
+    monthly_surplus = monthly_income - monthly_expenses
+    month_end_idx = np.searchsorted(month_index, np.arange(len(month_grid)), side="right") - 1
+    month_end_balance = balance[month_end_idx]
+    # The first month only runs from today - weigh months by the share of their days covered
+    month_days = np.bincount(month_index, minlength=len(month_grid))
+    month_lengths = ((month_grid + 1).astype("datetime64[D]") - month_grid.astype("datetime64[D]")).astype(int)
+    avg_monthly_surplus = float(monthly_surplus.sum() / (month_days / month_lengths).sum())
+
+    # Contributions needed to hit the open savings goals on time
+    goals = db.query(SavingsGoal).filter(SavingsGoal.is_completed.isnot(True)).all()
+    goals_monthly = 0.0
+    for goal in goals:
+        remaining = float(goal.target_amount) - float(goal.current_amount or 0)
+        months_left = max((date.fromisoformat(goal.target_date) - today).days / 30.44, 1.0)
+        if remaining > 0:
+            goals_monthly += remaining / months_left
+
+    low = int(np.argmin(balance))
+    return {
+        "start_date": today.isoformat(),
+        "months": months,
+        "start_balance": start_balance,
+        "scenario": {
+            "income_change_pct": scenario.income_change_pct,
+            "spending_change_pct": scenario.spending_change_pct,
+            "drop_recurring": sorted(scenario.drop_recurring),
+            "extra_monthly_income": scenario.extra_monthly_income,
+        },
+        "summary": {
+            "end_balance": round(float(balance[-1]), 2),
+            "min_balance": round(float(balance[low]), 2),
+            "min_balance_date": str(days[low]),
+            "avg_monthly_surplus": round(avg_monthly_surplus, 2),
+            "deficit_months": int((monthly_surplus < 0).sum()),
+            "savings_capacity": round(max(avg_monthly_surplus, 0.0), 2),
+            "goals_required_monthly": round(goals_monthly, 2),
+            "discretionary_daily": round(discretionary_daily, 2),
+        },
+        "recurring_expenses": recurring,
+        "monthly": [
+            {
+                "month": str(m),
+                "income": round(float(monthly_income[i]), 2),
+                "expenses": round(float(monthly_expenses[i]), 2),
+                "surplus": round(float(monthly_surplus[i]), 2),
+                "days": int(month_days[i]),
+                "end_balance": round(float(month_end_balance[i]), 2),
+            }
+            for i, m in enumerate(month_grid)
+        ],
+        "daily_balance": [float(b) for b in np.round(balance, 2)],
+        "computed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
@@ -0,0 +1,124 @@
+"""
+FX rate service with cached rates and vectorized currency conversion
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+from services.crypto_feed import quote_book
+from services.upstream import binance, yahoo
+from startup import lazy_import
+
+logger = logging.getLogger(__name__)
+
+FX_RATE_TTL_SECONDS = float(os.getenv("FX_RATE_TTL_SECONDS", "300"))
+FX_HISTORY_SIZE = 500
+BASE_CURRENCIES = ("PLN", "USD", "EUR")
+
+# Yahoo quotes some markets in minor units (pence, cents)
+MINOR_UNITS = {"GBp": ("GBP", 0.01), "GBX": ("GBP", 0.01), "ZAc": ("ZAR", 0.01), "ILA": ("ILS", 0.01)}
+# Stablecoins are valued through their Binance PLN pair
+STABLECOINS = ("USDT", "USDC", "FDUSD")
+
+
+def split_minor_unit(currency: str) -> Tuple[str, float]:
+    """Map a quote currency to (ISO currency, multiplier), e.g. GBp -> (GBP, 0.01)"""
+    if currency in MINOR_UNITS:
+        return MINOR_UNITS[currency]
+    return currency.upper(), 1.0
+
+
+class FxService:
+    """Rates are kept as units of currency per 1 USD and crossed through USD"""
+
+    def __init__(self, ttl: float = FX_RATE_TTL_SECONDS):
+        self.ttl = ttl
+        self._rates: Dict[str, Tuple[float, float]] = {"USD": (1.0, float("inf"))}
+        self._history: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def per_usd(self, currency: str) -> float:
+        """Units of ``currency`` per 1 USD, refreshed after the TTL"""
+        currency = currency.upper()
+        with self._lock:
+            cached = self._rates.get(currency)
+        if cached and time.time() - cached[1] < self.ttl:
+            return cached[0]
+
+        rate = self._fetch_per_usd(currency)
+        if rate is None or rate <= 0:
+            if cached:
+                logger.warning(f"Using stale FX rate for {currency}")
+                return cached[0]
+            raise ValueError(f"No FX rate available for {currency}")
+
+        now = time.time()
+        with self._lock:
+            self._rates[currency] = (rate, now)
+            self._history.setdefault(currency, deque(maxlen=FX_HISTORY_SIZE)).append((now, rate))
+        return rate
+
+    def get_rate(self, from_currency: str, to_currency: str) -> float:
+        """How many ``to_currency`` units one ``from_currency`` unit is worth"""
+        from_ccy, from_mult = split_minor_unit(from_currency)
+        to_ccy, to_mult = split_minor_unit(to_currency)
+        if from_ccy == to_ccy:
+            return from_mult / to_mult
+        return self.per_usd(to_ccy) / self.per_usd(from_ccy) * from_mult / to_mult
+
+    def conversion_vector(self, currencies: Iterable[str], base: str):
+        """Conversion factors to ``base`` for each entry, one rate lookup per distinct currency"""
+        currencies = list(currencies)
+        distinct = {ccy: self.get_rate(ccy, base) for ccy in set(currencies)}
+        np = lazy_import("numpy")
+        return np.fromiter((distinct[ccy] for ccy in currencies), dtype=float, count=len(currencies))
+
+    def history(self, currency: str) -> List[Dict[str, float]]:
+        with self._lock:
+            points = list(self._history.get(currency.upper(), ()))
+        return [{"ts": ts, "per_usd": rate} for ts, rate in points]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                ccy: {"per_usd": rate, "age_seconds": None if ccy == "USD" else round(time.time() - ts, 1)}
+                for ccy, (rate, ts) in self._rates.items()
+            }
+
+    def _fetch_per_usd(self, currency: str) -> Optional[float]:
+        try:
+            if currency in STABLECOINS:
+                return self.per_usd("PLN") / self._stablecoin_pln(currency)
+            return yahoo.call(f"fx:USD{currency}", lambda: self._yahoo_close(f"USD{currency}=X"), ttl=self.ttl)
+        except Exception as e:
+            logger.error(f"Failed to fetch FX rate for {currency}: {e}")
+            return None
+
+    @staticmethod
+    def _yahoo_close(symbol: str) -> Optional[float]:
+        hist = lazy_import("yfinance").Ticker(symbol).history(period="5d")
+        return None if hist.empty else float(hist['Close'].iloc[-1])
+
+    def _stablecoin_pln(self, coin: str) -> float:
+        quote = quote_book.get(f"{coin}PLN")
+        if quote is not None:
+            return quote.price
+
+        def fetch():
+            res = requests.get(
+                "https://api.binance.com/api/v3/ticker/price",
+                params={"symbol": f"{coin}PLN"},
+                timeout=10,
+            )
+            res.raise_for_status()
+            return float(res.json().get("price", 0))
+
+        return binance.call(f"price:{coin}PLN", fetch, ttl=self.ttl)
+
+
+fx_service = FxService()
@@ -0,0 +1,102 @@
+"""
+Leader election based on PostgreSQL session-level advisory locks
+"""
+import hashlib
+import logging
+import os
+import threading
+from sqlalchemy import text
+from database import engine
+
+logger = logging.getLogger(__name__)
+
+LEADER_ELECTION_ENABLED = os.getenv("LEADER_ELECTION", "1") != "0"
+
+
+def _lock_key(name: str) -> int:
+    digest = hashlib.sha1(name.encode()).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+
+def advisory_xact_lock(conn, name: str):
+    """Wait for the transaction-scoped advisory lock ``name`` (PostgreSQL only)
+
+    ``conn`` is a Session or Connection; the lock is released when its
+    transaction ends.
+    """
+    bind = conn.get_bind() if hasattr(conn, "get_bind") else conn
+    if bind.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _lock_key(name)})
+
+
+class LeaderElection:
+    """Elect a single leader among workers and replicas sharing one database
+
+    The leader holds ``pg_try_advisory_lock`` on a dedicated connection for as
+    long as it lives. When the leader process or its connection dies,
+    PostgreSQL releases the lock and the next follower calling ``check`` takes
+    over. On other databases every process is its own leader.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.lock_key = _lock_key(name)
+        self.is_leader = False
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return LEADER_ELECTION_ENABLED and engine.dialect.name == "postgresql"
+
+    def check(self) -> bool:
+        """Confirm or try to acquire leadership, return whether this process leads"""
+        with self._lock:
+            if not self.enabled:
+                self.is_leader = True
+                return True
+
+            if self.is_leader:
+                try:
+                    self._conn.execute(text("SELECT 1"))
+                    return True
+                except Exception as e:
+                    logger.warning(f"Lost leadership of {self.name}: {e}")
+                    self._close()
+
+            try:
+                conn = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+                acquired = conn.execute(
+                    text("SELECT pg_try_advisory_lock(:key)"), {"key": self.lock_key}
+                ).scalar()
+            except Exception as e:
+                logger.error(f"Leader election for {self.name} failed: {e}")
+                return False
+
+            if acquired:
+                self._conn = conn
+                self.is_leader = True
+                logger.info(f"Acquired leadership of {self.name}")
+            else:
+                conn.close()
+            return self.is_leader
+
+    def release(self):
+        """Give up leadership"""
+        with self._lock:
+            if self.is_leader and self._conn is not None:
+                try:
+                    self._conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.lock_key})
+                    logger.info(f"Released leadership of {self.name}")
+                except Exception as e:
+                    logger.warning(f"Failed to release leadership of {self.name}: {e}")
+            self._close()
+
+    def _close(self):
+        self.is_leader = False
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
@@ -0,0 +1,114 @@
+"""
+Exchange trading hours used by the price scheduler
+"""
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta, timezone
+from typing import Optional, Tuple
+from zoneinfo import ZoneInfo
+
+
+@dataclass(frozen=True)
+class Exchange:
+    code: str
+    timezone: str
+    open: time
+    close: time
+    weekdays: Tuple[int, ...] = (0, 1, 2, 3, 4)
+    always_open: bool = False
+    currency: Optional[str] = None
+
+
+# Regular sessions only - exchange holidays are not modelled, a refresh on a
+# holiday simply returns the previous close.
+EXCHANGES = {
+    "US": Exchange("US", "America/New_York", time(9, 30), time(16, 0), currency="USD"),
+    "WSE": Exchange("WSE", "Europe/Warsaw", time(9, 0), time(17, 0), currency="PLN"),
+    "LSE": Exchange("LSE", "Europe/London", time(8, 0), time(16, 30), currency="GBp"),
+    "XETRA": Exchange("XETRA", "Europe/Berlin", time(9, 0), time(17, 30), currency="EUR"),
+    "EURONEXT": Exchange("EURONEXT", "Europe/Paris", time(9, 0), time(17, 30), currency="EUR"),
+    "SIX": Exchange("SIX", "Europe/Zurich", time(9, 0), time(17, 30), currency="CHF"),
+    "TSX": Exchange("TSX", "America/Toronto", time(9, 30), time(16, 0), currency="CAD"),
+    "TSE": Exchange("TSE", "Asia/Tokyo", time(9, 0), time(15, 0), currency="JPY"),
+    "HKEX": Exchange("HKEX", "Asia/Hong_Kong", time(9, 30), time(16, 0), currency="HKD"),
+    "FX": Exchange("FX", "UTC", time(0, 0), time(23, 59), weekdays=(0, 1, 2, 3, 4)),
+    "CRYPTO": Exchange("CRYPTO", "UTC", time(0, 0), time(23, 59), always_open=True),
+}
+
+# Yahoo Finance ticker suffixes
+SUFFIX_EXCHANGES = {
+    ".WA": "WSE",
+    ".L": "LSE",
+    ".DE": "XETRA",
+    ".F": "XETRA",
+    ".PA": "EURONEXT",
+    ".AS": "EURONEXT",
+    ".BR": "EURONEXT",
+    ".SW": "SIX",
+    ".TO": "TSX",
+    ".T": "TSE",
+    ".HK": "HKEX",
+}
+
+CRYPTO_QUOTES = ("-USD", "-USDT", "-EUR", "-PLN", "-BTC")
+# Dollar stablecoins are stored as USD - Investment.currency holds 3-letter codes
+STABLECOIN_CURRENCIES = {"USDT": "USD", "USDC": "USD", "FDUSD": "USD", "BUSD": "USD"}
+
+
+def exchange_for_symbol(symbol: str) -> Exchange:
+    """Infer the exchange of a Yahoo Finance symbol"""
+    symbol = symbol.upper()
+    if symbol.endswith("=X"):
+        return EXCHANGES["FX"]
+    if symbol.endswith(CRYPTO_QUOTES):
+        return EXCHANGES["CRYPTO"]
+    if "." in symbol:
+        suffix = symbol[symbol.rindex("."):]
+        if suffix in SUFFIX_EXCHANGES:
+            return EXCHANGES[SUFFIX_EXCHANGES[suffix]]
+    return EXCHANGES["US"]
+
+
+def normalize_currency(code: Optional[str]) -> Optional[str]:
+    """Currency code as stored on investments - stablecoins as USD, None if not 3 letters"""
+    if not code:
+        return None
+    code = STABLECOIN_CURRENCIES.get(code.upper(), code)
+    return code if len(code) == 3 else None
+
+
+def currency_for_symbol(symbol: str) -> Optional[str]:
+    """Best guess of the quote currency from the symbol alone"""
+    symbol = symbol.upper()
+    if symbol.endswith(CRYPTO_QUOTES):
+        return normalize_currency(symbol.rsplit("-", 1)[1])
+    if symbol.endswith("=X") and len(symbol) == 8:
+        return symbol[3:6]
+    return exchange_for_symbol(symbol).currency
+
+
+def is_market_open(exchange: Exchange, now: Optional[datetime] = None) -> bool:
+    """Check whether the exchange is in its regular session"""
+    if exchange.always_open:
+        return True
+    now = now or datetime.now(timezone.utc)
+    local = now.astimezone(ZoneInfo(exchange.timezone))
+    if local.weekday() not in exchange.weekdays:
+        return False
+    return exchange.open <= local.time() < exchange.close
+
+
+def last_session_close(exchange: Exchange, now: Optional[datetime] = None) -> Optional[datetime]:
+    """Return the most recent session close (UTC) at or before ``now``"""
+    if exchange.always_open:
+        return None
+    now = now or datetime.now(timezone.utc)
+    tz = ZoneInfo(exchange.timezone)
+    local_day = now.astimezone(tz).date()
+    for days_back in range(8):
+        day = local_day - timedelta(days=days_back)
+        if day.weekday() not in exchange.weekdays:
+            continue
+        close = datetime.combine(day, exchange.close, tzinfo=tz).astimezone(timezone.utc)
+        if close <= now:
+            return close
+    return None
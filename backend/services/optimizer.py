@@ -0,0 +1,384 @@
+"""
+Mean-variance portfolio optimizer over the current holdings
+
+Inputs come from the stored daily closes: a Ledoit-Wolf shrunk covariance
+and historical mean returns shrunk towards their cross-sectional average.
+Every frontier point solves
+
+    min  1/2 w'Σw - λ μ'w   s.t.  Σw = 1,  0 <= w <= max_weight
+
+All points run together through accelerated projected gradient (FISTA),
+one matrix product per iteration for the whole frontier, until it is clear
+which weights sit at a bound; a KKT solve per point on those active sets
+then gives the exact weights. Risk parity is a damped Newton solve of the
+Spinu formulation.
+
+Results are cached per (holdings, price date, parameters). The current
+allocation depends on live prices and FX rates, so it is left out of the
+cache and described per request. When a new close moves the inputs, the
+previous solution for the same holdings is tried as the active set first,
+so a re-solve mostly skips the gradient iterations.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy.orm import Session
+
+from services.portfolio_analytics import TRADING_DAYS, held_symbols, symbol_values
+from services.price_history import price_history
+from startup import lazy_import
+
+logger = logging.getLogger(__name__)
+
+OPTIMIZER_MIN_OBSERVATIONS = int(os.getenv("OPTIMIZER_MIN_OBSERVATIONS", "60"))
+OPTIMIZER_RISK_FREE_RATE = float(os.getenv("OPTIMIZER_RISK_FREE_RATE", "0.02"))
+# Weight of the cross-sectional average in the expected return of each asset
+OPTIMIZER_MEAN_SHRINKAGE = float(os.getenv("OPTIMIZER_MEAN_SHRINKAGE", "0.5"))
+OPTIMIZER_MAX_ITERATIONS = 5000
+# Largest weight change between iterations at convergence (weights are reported to 4 decimals)
+OPTIMIZER_TOLERANCE = 1e-6
+# Coarser tolerance of the first gradient pass, enough to find the active set
+OPTIMIZER_SCREEN_TOLERANCE = 1e-4
+OPTIMIZER_CACHE_SIZE = 16
+SHARPE_REFINE_POINTS = 16
+
+
+class OptimizerError(Exception):
+    """The holdings or their price history do not allow an optimization"""
+
+
+def shrunk_covariance(returns):
+    """Annualized Ledoit-Wolf covariance (scaled identity target) and the shrinkage intensity"""
+    np = lazy_import("numpy")
+    t, n = returns.shape
+    x = returns - returns.mean(axis=0)
+    sample = x.T @ x / t
+    target = np.trace(sample) / n
+    d2 = ((sample - target * np.eye(n)) ** 2).sum()
+    # Variance of the sample covariance entries, summed
+    b2 = min(((x ** 2).T @ (x ** 2) / t - sample ** 2).sum() / t, d2)
+    shrinkage = b2 / d2 if d2 > 0 else 1.0
+    cov = shrinkage * target * np.eye(n) + (1 - shrinkage) * sample
+    return cov * TRADING_DAYS, float(shrinkage)
+
+
+def expected_returns(returns, shrinkage: float = OPTIMIZER_MEAN_SHRINKAGE):
+    """Annualized mean returns pulled towards their cross-sectional average"""
+    mu = returns.mean(axis=0) * TRADING_DAYS
+    return (1 - shrinkage) * mu + shrinkage * mu.mean()
+
+
+def _capped_simplex_shift(v, cap: float, tau=None, iterations: int = 60):
+    """Per-row τ with Σ clip(v - τ, 0, cap) = 1
+
+    Newton steps on the piecewise linear sum, falling back to bisection
+    whenever a step leaves the bracket. Starting from the previous τ of an
+    iterative solver usually takes one or two steps.
+    """
+    np = lazy_import("numpy")
+    # With the k = ceil(1/cap) largest entries at the cap the sum is >= 1
+    k = min(int(np.ceil(1.0 / cap - 1e-9)), v.shape[1])
+    lo = -np.partition(-v, k - 1, axis=1)[:, k - 1] - cap
+    hi = v.max(axis=1)  # every entry clipped to 0: sum = 0
+    if tau is None:
+        tau = (v.sum(axis=1) - 1.0) / v.shape[1]
+    tau = np.where((tau > lo) & (tau < hi), tau, (lo + hi) / 2)
+    for _ in range(iterations):
+        shifted = v - tau[:, None]
+        excess = np.clip(shifted, 0.0, cap).sum(axis=1) - 1.0
+        if np.abs(excess).max() < 1e-12:
+            break
+        lo = np.where(excess > 0, tau, lo)
+        hi = np.where(excess < 0, tau, hi)
+        free = ((shifted > 0) & (shifted < cap)).sum(axis=1)
+        newton = tau + excess / np.maximum(free, 1)
+        inside = (free > 0) & (newton >= lo) & (newton <= hi)
+        tau = np.where(inside, newton, (lo + hi) / 2)
+    return tau
+
+
+def project_capped_simplex(v, cap: float):
+    """Row-wise Euclidean projection onto {w: Σw = 1, 0 <= w <= cap}"""
+    np = lazy_import("numpy")
+    v = np.atleast_2d(v)
+    return np.clip(v - _capped_simplex_shift(v, cap)[:, None], 0.0, cap)
+
+
+def _active_set_solve(cov, mu, lam: float, w, cap: float, rounds: int = 10):
+    """Exact solution starting from the free/capped sets of ``w``, or None if they do not settle
+
+    For fixed sets the problem is an equality-constrained QP, solved by one
+    KKT system. Entries that leave their bounds or whose multipliers have
+    the wrong sign switch sets (primal-dual active set method); a good guess
+    - the previous solution or a rough gradient solve - settles in a couple
+    of rounds.
+    """
+    np = lazy_import("numpy")
+    free = (w > 0) & (w < cap)
+    capped = w >= cap
+    for _ in range(rounds):
+        m = int(free.sum())
+        remaining = 1.0 - cap * capped.sum()
+        candidate = np.where(capped, cap, 0.0)
+        if m:
+            kkt = np.zeros((m + 1, m + 1))
+            kkt[:m, :m] = cov[np.ix_(free, free)]
+            kkt[:m, m] = kkt[m, :m] = 1.0
+            rhs = np.append(lam * mu[free] - cap * cov[np.ix_(free, capped)].sum(axis=1), remaining)
+            try:
+                solution = np.linalg.solve(kkt, rhs)
+            except np.linalg.LinAlgError:
+                return None
+            candidate[free] = solution[:m]
+            # Free entries share the gradient -ν
+            level = -solution[m]
+        elif abs(remaining) > 1e-12:
+            return None
+        gradient = cov @ candidate - lam * mu
+        if not m:
+            level = float(np.median(gradient))
+
+        # Zeros must not want to grow, capped entries must not want to shrink
+        slack = np.abs(gradient).max() * 1e-9 + 1e-15
+        zero = ~free & ~capped
+        to_zero = (free & (candidate <= 0)) | (zero & (gradient > level - slack))
+        to_cap = (free & (candidate >= cap)) | (capped & (gradient < level + slack))
+        if not (to_zero ^ zero).any() and not (to_cap ^ capped).any():
+            return candidate
+        capped, free = to_cap, ~to_zero & ~to_cap
+        if cap * capped.sum() > 1 + 1e-12:
+            return None
+    return None
+
+
+def _fista(cov, linear, cap: float, w, tolerance: float):
+    """Accelerated projected gradient from ``w`` until no weight moves by ``tolerance``"""
+    np = lazy_import("numpy")
+    step = 1.0 / np.linalg.eigvalsh(cov)[-1]
+    y, t, tau = w, np.ones(len(w)), None
+    for iteration in range(1, OPTIMIZER_MAX_ITERATIONS + 1):
+        v = y - step * (y @ cov - linear)
+        tau = _capped_simplex_shift(v, cap, tau)
+        w_next = np.clip(v - tau[:, None], 0.0, cap)
+        change = w_next - w
+        if np.abs(change).max() < tolerance:
+            return w_next, iteration
+        t_next = (1 + np.sqrt(1 + 4 * t ** 2)) / 2
+        # Adaptive restart: drop the momentum of rows that started going uphill
+        restart = ((y - w_next) * change).sum(axis=1) > 0
+        momentum = np.where(restart, 0.0, (t - 1) / t_next)
+        y = w_next + momentum[:, None] * change
+        w, t = w_next, np.where(restart, 1.0, t_next)
+    logger.warning(f"Mean-variance solver stopped after {OPTIMIZER_MAX_ITERATIONS} iterations")
+    return w, OPTIMIZER_MAX_ITERATIONS
+
+
+def solve_mean_variance(cov, mu, lambdas, cap: float, start=None):
+    """Weights (one row per λ) of the mean-variance problems and the gradient iterations used
+
+    Gradient steps only have to find which weights sit at a bound; the
+    active set solve then gives the exact weights. A ``start`` (typically the
+    previous solution) is tried as that guess first, so re-solves after a
+    small change in the inputs usually need no gradient iterations at all.
+    """
+    np = lazy_import("numpy")
+    k, n = len(lambdas), len(mu)
+    w = project_capped_simplex(np.full((k, n), 1.0 / n) if start is None else start, cap)
+    pending = np.ones(k, dtype=bool)
+    iterations = 0
+
+    def settle(rows, guesses):
+        for row, guess in zip(rows, guesses):
+            exact = _active_set_solve(cov, mu, lambdas[row], guess, cap)
+            if exact is not None:
+                w[row], pending[row] = exact, False
+
+    if start is not None:
+        settle(range(k), w.copy())
+    for tolerance in (OPTIMIZER_SCREEN_TOLERANCE, OPTIMIZER_TOLERANCE):
+        rows = np.flatnonzero(pending)
+        if not len(rows):
+            break
+        iterated, used = _fista(cov, np.outer(lambdas[rows], mu), cap, w[rows], tolerance)
+        iterations += used
+        w[rows] = iterated
+        settle(rows, iterated)
+    return w, iterations
+
+
+def risk_parity(cov, cap: float, start=None, iterations: int = 100):
+    """Equal risk contribution weights, projected onto the position limit if it binds"""
+    np = lazy_import("numpy")
+    n = len(cov)
+    budget = np.full(n, 1.0 / n)
+    y = 1.0 / np.sqrt(np.diag(cov)) if start is None else start.copy()
+    # Minimizes 1/2 y'Σy - b'log(y); y / Σy has risk contributions b
+    for iteration in range(1, iterations + 1):
+        gradient = cov @ y - budget / y
+        if np.abs(gradient * y).max() < 1e-12:
+            break
+        delta = np.linalg.solve(cov + np.diag(budget / y ** 2), gradient)
+        alpha = 1.0
+        while np.any(y - alpha * delta <= 0):
+            alpha /= 2
+        y = y - alpha * delta
+    weights = y / y.sum()
+    if weights.max() > cap:
+        weights = project_capped_simplex(weights, cap)[0]
+    return weights, y, iteration
+
+
+class PortfolioOptimizer:
+    def __init__(self, cache_size: int = OPTIMIZER_CACHE_SIZE):
+        self.cache_size = cache_size
+        # key -> (result without "current", covariance, expected returns)
+        self._results: "OrderedDict[tuple, tuple]" = OrderedDict()
+        # (symbols, max_weight, points) -> last solution, reused as the next warm start
+        self._warm: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "solves": 0, "warm_solves": 0}
+
+    def optimize(
+        self,
+        db: Session,
+        base: str = "PLN",
+        max_weight: float = 1.0,
+        points: int = 30,
+        risk_free_rate: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Efficient frontier, min-variance, max-Sharpe and risk-parity allocations of the holdings"""
+        risk_free_rate = OPTIMIZER_RISK_FREE_RATE if risk_free_rate is None else risk_free_rate
+        holdings = held_symbols(db)
+        if not holdings:
+            raise OptimizerError("No investments to optimize")
+        symbols = [symbol for symbol, _ in holdings]
+        # History is backfilled by the leader's price_history_backfill job, never here
+        key = (holdings, price_history.latest_date(db, symbols), max_weight, points, risk_free_rate)
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None:
+                self._results.move_to_end(key)
+                self.stats["hits"] += 1
+
+        if cached is None:
+            result, cov, mu = self._solve(db, symbols, max_weight, points, risk_free_rate)
+            result["price_date"] = key[1]
+            with self._lock:
+                self._results[key] = (result, cov, mu)
+                while len(self._results) > self.cache_size:
+                    self._results.popitem(last=False)
+        else:
+            result, cov, mu = cached
+            result = {**result, "solver": {**result["solver"], "cached": True}}
+
+        # Current weights move with every price and FX update - never cached
+        np = lazy_import("numpy")
+        covered = result["symbols"]
+        values = symbol_values(db, covered, base)
+        current = values / values.sum() if values.sum() > 0 else np.full(len(covered), 1.0 / len(covered))
+        return {
+            **result,
+            "base": base.upper(),
+            "current": self._describe(current, covered, cov, mu, risk_free_rate),
+        }
+
+    def _solve(self, db: Session, symbols: List[str], cap: float, points: int, rf: float):
+        """(result without the current allocation, covariance, expected returns)"""
+        np = lazy_import("numpy")
+        started = time.perf_counter()
+        covered, returns = price_history.daily_returns(db, symbols, OPTIMIZER_MIN_OBSERVATIONS)
+        if len(covered) < 2:
+            raise OptimizerError(
+                f"At least two holdings need {OPTIMIZER_MIN_OBSERVATIONS} days of price history"
+            )
+        n = len(covered)
+        if cap * n < 1:
+            raise OptimizerError(f"max_weight {cap} is infeasible for {n} assets (needs at least {1 / n:.4f})")
+
+        cov, shrinkage = shrunk_covariance(returns)
+        mu = expected_returns(returns)
+        # λ = 0 is the minimum-variance portfolio; the largest λ reaches the highest-return corner
+        spread = max(float(mu.max() - mu.min()), 1e-9)
+        top = 10 * float(np.linalg.eigvalsh(cov)[-1]) / spread
+        lambdas = np.concatenate([[0.0], np.geomspace(top * 1e-4, top, points - 1)])
+
+        warm_key = (tuple(covered), cap, points)
+        with self._lock:
+            warm = self._warm.get(warm_key)
+        frontier_weights, iterations = solve_mean_variance(
+            cov, mu, lambdas, cap, start=None if warm is None else warm["frontier"]
+        )
+
+        # Max-Sharpe: refine between the neighbours of the best frontier point
+        best = int(np.argmax(self._sharpe(frontier_weights, cov, mu, rf)))
+        low, high = lambdas[max(best - 1, 0)], lambdas[min(best + 1, points - 1)]
+        refine = np.linspace(low, high, SHARPE_REFINE_POINTS)
+        refined, refine_iterations = solve_mean_variance(
+            cov, mu, refine, cap, start=np.repeat(frontier_weights[best:best + 1], SHARPE_REFINE_POINTS, axis=0)
+        )
+        candidates = np.vstack([frontier_weights, refined])
+        max_sharpe = candidates[int(np.argmax(self._sharpe(candidates, cov, mu, rf)))]
+
+        parity, parity_state, parity_iterations = risk_parity(
+            cov, cap, start=None if warm is None else warm["parity"]
+        )
+
+        with self._lock:
+            self._warm[warm_key] = {"frontier": frontier_weights, "parity": parity_state}
+            self._warm.move_to_end(warm_key)
+            while len(self._warm) > self.cache_size:
+                self._warm.popitem(last=False)
+            self.stats["solves"] += 1
+            self.stats["warm_solves"] += int(warm is not None)
+
+        # Neighbouring λs often land on the same corner portfolio
+        distinct = np.concatenate([[True], np.abs(np.diff(frontier_weights, axis=0)).max(axis=1) > 1e-4])
+        elapsed = time.perf_counter() - started
+        logger.info(f"Optimized {n} assets, {points} frontier points in {elapsed * 1000:.0f} ms ({iterations} iterations)")
+        return {
+            "symbols": covered,
+            "excluded": [s for s in symbols if s not in covered],
+            "observations": len(returns),
+            "shrinkage": shrinkage,
+            "risk_free_rate": rf,
+            "max_weight": cap,
+            "min_variance": self._describe(frontier_weights[0], covered, cov, mu, rf),
+            "max_sharpe": self._describe(max_sharpe, covered, cov, mu, rf),
+            "risk_parity": self._describe(parity, covered, cov, mu, rf),
+            "frontier": [self._describe(w, covered, cov, mu, rf) for w in frontier_weights[distinct]],
+            "solver": {
+                "iterations": iterations,
+                "refine_iterations": refine_iterations,
+                "risk_parity_iterations": parity_iterations,
+                "warm_start": warm is not None,
+                "seconds": round(elapsed, 4),
+                "cached": False,
+            },
+        }, cov, mu
+
+    @staticmethod
+    def _sharpe(weights, cov, mu, rf: float):
+        np = lazy_import("numpy")
+        volatility = np.sqrt(np.einsum("ij,jk,ik->i", weights, cov, weights))
+        return (weights @ mu - rf) / np.maximum(volatility, 1e-12)
+
+    @staticmethod
+    def _describe(weights, symbols: Sequence[str], cov, mu, rf: float) -> Dict[str, Any]:
+        volatility = float(weights @ cov @ weights) ** 0.5
+        expected = float(weights @ mu)
+        return {
+            "expected_return": expected,
+            "volatility": volatility,
+            "sharpe": (expected - rf) / volatility if volatility > 0 else 0.0,
+            "weights": {s: round(float(w), 4) for s, w in zip(symbols, weights) if w >= 1e-4},
+        }
+
+    def status(self) -> Dict[str, Any]:
+        return {"cached": len(self._results), "warm_starts": len(self._warm), **self.stats}
+
+
+portfolio_optimizer = PortfolioOptimizer()
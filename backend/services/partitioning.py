@@ -0,0 +1,221 @@
+"""
+Optional monthly range partitioning of the expenses table (PostgreSQL only)
+
+With EXPENSE_PARTITIONING=1 the existing ``expenses`` heap is converted once
+into a table partitioned by ``date`` with one partition per month, plus a
+default partition catching malformed dates. Partitions for the coming months
+are created ahead of time (by the leader). Only empty months can be detached
+- rows of a past month leave the live table through the Parquet archive, which
+keeps them readable and records sync tombstones.
+"""
+import logging
+import os
+import re
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+
+from database import engine, upgrade_schema
+from services.leader_election import LeaderElection, advisory_xact_lock
+
+logger = logging.getLogger(__name__)
+
+EXPENSE_PARTITIONING = os.getenv("EXPENSE_PARTITIONING", "0") == "1"
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+PARTITION_LOCK_TIMEOUT = os.getenv("PARTITION_LOCK_TIMEOUT", "5s")
+
+_PARTITION_NAME_RE = re.compile(r"^expenses_y(\d{4})m(\d{2})$")
+# Serializes the conversion and partition creation between workers starting together
+_DDL_LOCK = "expense_partitioning"
+
+leader = LeaderElection("expense_partitions")
+
+
+def _shift_month(year: int, month: int, months: int):
+    index = year * 12 + month - 1 + months
+    return index // 12, index % 12 + 1
+
+
+def partition_name(year: int, month: int) -> str:
+    return f"expenses_y{year:04d}m{month:02d}"
+
+
+def _month_bounds(year: int, month: int):
+    next_year, next_month = _shift_month(year, month, 1)
+    return f"{year:04d}-{month:02d}-01", f"{next_year:04d}-{next_month:02d}-01"
+
+
+def _create_partition_sql(year: int, month: int) -> str:
+    start, end = _month_bounds(year, month)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(year, month)} PARTITION OF expenses "
+        f"FOR VALUES FROM ('{start}') TO ('{end}')"
+    )
+
+
+def enabled() -> bool:
+    return EXPENSE_PARTITIONING and engine.dialect.name == "postgresql"
+
+
+def is_partitioned(conn) -> bool:
+    return conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = 'expenses' AND c.relnamespace = 'public'::regnamespace"
+    )).first() is not None
+
+
+def setup():
+    """Convert expenses to a partitioned table if needed and create upcoming partitions"""
+    if not enabled():
+        return
+    with engine.begin() as conn:
+        advisory_xact_lock(conn, _DDL_LOCK)
+        if not is_partitioned(conn):
+            _migrate(conn)
+    upgrade_schema()
+    ensure_future_partitions()
+
+
+def _migrate(conn):
+    """Swap the plain expenses heap for a partitioned copy in one transaction"""
+    logger.info("Converting expenses to a monthly partitioned table")
+    conn.execute(text("LOCK TABLE expenses IN ACCESS EXCLUSIVE MODE"))
+    conn.execute(text("ALTER TABLE expenses RENAME TO expenses_unpartitioned"))
+    conn.execute(text("ALTER INDEX IF EXISTS expenses_pkey RENAME TO expenses_unpartitioned_pkey"))
+    # The partition key has to be part of the primary key
+    conn.execute(text(
+        "CREATE TABLE expenses (LIKE expenses_unpartitioned INCLUDING DEFAULTS, PRIMARY KEY (id, date)) "
+        "PARTITION BY RANGE (date)"
+    ))
+    conn.execute(text("CREATE TABLE expenses_default PARTITION OF expenses DEFAULT"))
+
+    bounds = conn.execute(text(
+        "SELECT min(date), max(date) FROM expenses_unpartitioned WHERE date ~ '^\\d{4}-\\d{2}-\\d{2}$'"
+    )).one()
+    today = date.today()
+    first = date.fromisoformat(bounds[0]) if bounds[0] else today
+    last = max(date.fromisoformat(bounds[1]) if bounds[1] else today, today)
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        conn.execute(text(_create_partition_sql(year, month)))
+        year, month = _shift_month(year, month, 1)
+
+    conn.execute(text("INSERT INTO expenses SELECT * FROM expenses_unpartitioned"))
+    # Foreign keys to expenses.id (anomaly flags) cannot point at a partitioned table
+    conn.execute(text("DROP TABLE expenses_unpartitioned CASCADE"))
+
+
+def scheduled_ensure_future_partitions():
+    """Daily job - only the elected worker runs DDL"""
+    if not leader.check():
+        return
+    ensure_future_partitions()
+
+
+def ensure_future_partitions(months_ahead: int = PARTITION_MONTHS_AHEAD):
+    """Create partitions for the current month and ``months_ahead`` after it"""
+    if not enabled():
+        return
+    today = date.today()
+    with engine.begin() as conn:
+        advisory_xact_lock(conn, _DDL_LOCK)
+        if not is_partitioned(conn):
+            return
+        for offset in range(months_ahead + 1):
+            year, month = _shift_month(today.year, today.month, offset)
+            try:
+                with conn.begin_nested():
+                    _create_partition(conn, year, month)
+            except Exception as e:
+                logger.error(f"Failed to create partition {partition_name(year, month)}, skipping it: {e}")
+
+
+def _create_partition(conn, year: int, month: int):
+    """Create a monthly partition, moving rows of that month out of the default partition first
+
+    CREATE TABLE ... PARTITION OF fails while the default partition holds
+    rows in the new range, so such rows go into a standalone table that is
+    then attached.
+    """
+    name = partition_name(year, month)
+    start, end = _month_bounds(year, month)
+    exists = conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar()
+    in_default = conn.execute(
+        text("SELECT count(*) FROM expenses_default WHERE date >= :start AND date < :end"),
+        {"start": start, "end": end},
+    ).scalar()
+    if exists or not in_default:
+        conn.execute(text(_create_partition_sql(year, month)))
+        return
+
+    # ATTACH locks the default partition exclusively - don't queue every query behind it
+    conn.execute(text(f"SET LOCAL lock_timeout = '{PARTITION_LOCK_TIMEOUT}'"))
+    conn.execute(text(f"CREATE TABLE {name} (LIKE expenses INCLUDING DEFAULTS)"))
+    conn.execute(
+        text(
+            f"WITH moved AS (DELETE FROM expenses_default WHERE date >= :start AND date < :end RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ),
+        {"start": start, "end": end},
+    )
+    conn.execute(text(f"ALTER TABLE expenses ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"))
+    logger.info(f"Moved {in_default} expenses from the default partition into {name}")
+
+
+def list_partitions() -> List[Dict[str, Any]]:
+    """Attached partitions with their bounds and estimated row counts"""
+    if engine.dialect.name != "postgresql":
+        return []
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples::bigint, "
+            "pg_total_relation_size(c.oid) "
+            "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = 'expenses' ORDER BY c.relname"
+        )).all()
+    return [
+        {"name": name, "bounds": bounds, "estimated_rows": max(int(rows_estimate), 0), "size_bytes": size}
+        for name, bounds, rows_estimate, size in rows
+    ]
+
+
+def is_empty(name: str) -> bool:
+    if not _PARTITION_NAME_RE.match(name):
+        raise ValueError(f"Not a monthly expenses partition: {name}")
+    with engine.connect() as conn:
+        if conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is None:
+            raise ValueError(f"Partition {name} does not exist")
+        return conn.execute(text(f"SELECT 1 FROM {name} LIMIT 1")).first() is None
+
+
+def detach_partition(name: str, drop: bool = False) -> Optional[str]:
+    """Detach an empty monthly partition from the live table (and optionally drop it)
+
+    Returns the name of the standalone table left behind, or None when dropped.
+    A partition that still holds rows is refused with ValueError.
+    """
+    match = _PARTITION_NAME_RE.match(name)
+    if not match:
+        raise ValueError(f"Not a monthly expenses partition: {name}")
+    year, month = int(match.group(1)), int(match.group(2))
+    today = date.today()
+    if (year, month) >= (today.year, today.month):
+        raise ValueError("Only past months can be detached")
+
+    with engine.begin() as conn:
+        if name not in {p["name"] for p in list_partitions()}:
+            raise ValueError(f"Partition {name} is not attached")
+        # DETACH needs an exclusive lock on expenses - give up rather than queue every query behind it
+        conn.execute(text(f"SET LOCAL lock_timeout = '{PARTITION_LOCK_TIMEOUT}'"))
+        conn.execute(text(f"ALTER TABLE expenses DETACH PARTITION {name}"))
+        # Checked under the DETACH lock, so no row can arrive in between; raising re-attaches it
+        if conn.execute(text(f"SELECT 1 FROM {name} LIMIT 1")).first() is not None:
+            raise ValueError(f"Partition {name} still holds expenses - archive the month first")
+        if drop:
+            conn.execute(text(f"DROP TABLE {name}"))
+            logger.info(f"Dropped expenses partition {name}")
+            return None
+        logger.info(f"Detached expenses partition {name}")
+        return name
@@ -0,0 +1,163 @@
+"""
+Correlation and diversification analytics of the investment portfolio
+
+From the covariance of the held symbols' daily log returns we derive the
+correlation matrix, each position's share of portfolio risk and the effective
+number of bets - the entropy of the risk spread across uncorrelated principal
+components. Concentration (HHI) is taken from position values. Results are
+cached per (holdings, latest price date), so dashboard reloads only run a
+few small queries.
+
+Returns are measured in each symbol's quote currency; currency moves against
+the base currency are not part of the risk figures.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import Investment
+from services.price_history import price_history
+from services.valuation import value_portfolio
+from startup import lazy_import
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_MIN_OBSERVATIONS = int(os.getenv("ANALYTICS_MIN_OBSERVATIONS", "30"))
+ANALYTICS_CACHE_SIZE = 32
+TRADING_DAYS = 252
+HIGH_CORRELATION = 0.8
+MAX_CORRELATED_PAIRS = 10
+
+
+def diversification_metrics(weights, returns, symbols: Sequence[str]) -> Dict[str, Any]:
+    """Risk decomposition of ``weights`` (summing to 1) over daily ``returns`` (days x symbols)"""
+    np = lazy_import("numpy")
+    cov = np.atleast_2d(np.cov(returns, rowvar=False)) * TRADING_DAYS
+    vol = np.sqrt(np.diag(cov))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        corr = np.nan_to_num(cov / np.outer(vol, vol))
+    np.fill_diagonal(corr, 1.0)
+
+    marginal = cov @ weights
+    variance = float(weights @ marginal)
+    if variance <= 0:
+        return {}
+    portfolio_vol = variance ** 0.5
+    risk_contribution = weights * marginal / variance
+
+    # Share of variance carried by each principal component
+    eigenvalues, eigenvectors = np.linalg.eigh(cov)
+    shares = (eigenvectors.T @ weights) ** 2 * np.clip(eigenvalues, 0, None) / variance
+    shares = shares[shares > 1e-12]
+    effective_bets = float(np.exp(-(shares * np.log(shares)).sum()))
+
+    pair_weights = np.outer(weights, weights)
+    off_diagonal = ~np.eye(len(symbols), dtype=bool)
+    pair_total = pair_weights[off_diagonal].sum()
+    avg_correlation = float((pair_weights * corr)[off_diagonal].sum() / pair_total) if pair_total > 0 else 0.0
+
+    upper = np.triu_indices(len(symbols), 1)
+    pair_corr = corr[upper]
+    strongest = np.argsort(-pair_corr)[:MAX_CORRELATED_PAIRS]
+    strongest = strongest[pair_corr[strongest] >= HIGH_CORRELATION]
+
+    return {
+        "symbols": list(symbols),
+        "observations": len(returns),
+        "portfolio_volatility": portfolio_vol,
+        "effective_bets": effective_bets,
+        "diversification_ratio": float(weights @ vol) / portfolio_vol,
+        "avg_correlation": avg_correlation,
+        "volatility": dict(zip(symbols, vol.round(4).tolist())),
+        "weights": dict(zip(symbols, weights.round(4).tolist())),
+        "risk_contribution": dict(zip(symbols, risk_contribution.round(4).tolist())),
+        "correlation": corr.round(4).tolist(),
+        "correlated_pairs": [
+            {"symbols": [symbols[upper[0][k]], symbols[upper[1][k]]], "correlation": round(float(pair_corr[k]), 4)}
+            for k in strongest
+        ],
+    }
+
+
+def held_symbols(db: Session):
+    """Sorted (symbol, total quantity) pairs of the current holdings"""
+    return tuple(sorted(
+        (symbol, float(quantity))
+        for symbol, quantity in db.query(Investment.symbol, func.sum(Investment.quantity))
+        .group_by(Investment.symbol).all()
+    ))
+
+
+def symbol_values(db: Session, symbols: Sequence[str], base: str = "PLN"):
+    """Value held in each of ``symbols`` in ``base`` currency, lots of one symbol summed"""
+    np = lazy_import("numpy")
+    positions = value_portfolio(db, base)["positions"]
+    column = {s: i for i, s in enumerate(symbols)}
+    return np.bincount(
+        [column[p["symbol"]] for p in positions if p["symbol"] in column],
+        weights=[p["value"] for p in positions if p["symbol"] in column],
+        minlength=len(symbols),
+    )
+
+
+class PortfolioAnalytics:
+    def __init__(self, cache_size: int = ANALYTICS_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def analyze(self, db: Session, base: str = "PLN") -> Optional[Dict[str, Any]]:
+        """Diversification metrics of the current holdings, None without investments"""
+        holdings = held_symbols(db)
+        if not holdings:
+            return None
+        symbols = [symbol for symbol, _ in holdings]
+        # History is backfilled by the leader's price_history_backfill job, never here
+        key = (base.upper(), holdings, price_history.latest_date(db, symbols))
+
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.stats["hits"] += 1
+                return cached
+            self.stats["misses"] += 1
+
+        result = self._compute(db, base, symbols)
+        result["price_date"] = key[2]
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def _compute(self, db: Session, base: str, symbols: Sequence[str]) -> Dict[str, Any]:
+        values = symbol_values(db, symbols, base)
+        column = {s: i for i, s in enumerate(symbols)}
+        total = values.sum()
+        result: Dict[str, Any] = {"base": base.upper(), "total_value": float(total)}
+        if total <= 0:
+            return result
+
+        weights = values / total
+        hhi = float((weights ** 2).sum())
+        result.update(hhi=hhi, effective_positions=1 / hhi, largest_weight=float(weights.max()))
+
+        covered, returns = price_history.daily_returns(db, symbols, ANALYTICS_MIN_OBSERVATIONS)
+        covered_values = values[[column[s] for s in covered]]
+        result["history_coverage"] = float(covered_values.sum() / total) if covered else 0.0
+        if len(covered) >= 2 and covered_values.sum() > 0:
+            result.update(diversification_metrics(covered_values / covered_values.sum(), returns, covered))
+        return result
+
+    def status(self) -> Dict[str, Any]:
+        return {"cached": len(self._cache), **self.stats}
+
+
+portfolio_analytics = PortfolioAnalytics()
@@ -0,0 +1,168 @@
+"""
+Daily close history of held symbols
+
+Each symbol is backfilled once from Yahoo by a leader job and then extended
+by the price refresher, so portfolio analytics only read their returns from
+the database and never download or write on a request.
+"""
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Date, cast, func, literal, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import Investment, PriceHistory
+from services.upstream import UpstreamUnavailable, yahoo
+from startup import lazy_import
+
+logger = logging.getLogger(__name__)
+
+PRICE_HISTORY_DAYS = int(os.getenv("PRICE_HISTORY_DAYS", "365"))
+# How often the leader looks for held symbols without history
+PRICE_HISTORY_BACKFILL_MINUTES = int(os.getenv("PRICE_HISTORY_BACKFILL_MINUTES", "60"))
+# A symbol is backfilled when its stored history starts later than this after the window start
+BACKFILL_SLACK_DAYS = 7
+
+
+class PriceHistoryService:
+    def __init__(self, days: int = PRICE_HISTORY_DAYS):
+        self.days = days
+        # symbol -> day of the last backfill attempt, so a failing symbol is retried once a day
+        self._attempted: Dict[str, date] = {}
+
+    def window_start(self, today: Optional[date] = None) -> str:
+        return ((today or date.today()) - timedelta(days=self.days)).isoformat()
+
+    def store(self, db: Session, rows: Iterable[Tuple[str, str, float]]) -> int:
+        """Upsert (symbol, date, close) rows without committing"""
+        values = [
+            {"symbol": symbol, "date": day, "close": close, "updated_at": datetime.utcnow()}
+            for symbol, day, close in rows
+            if close and close > 0
+        ]
+        if not values:
+            return 0
+        stmt = pg_insert(PriceHistory)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[PriceHistory.symbol, PriceHistory.date],
+            set_={"close": stmt.excluded.close, "updated_at": stmt.excluded.updated_at},
+        )
+        db.execute(stmt, values)
+        return len(values)
+
+    def record_closes(self, db: Session, closes: Dict[str, Tuple[float, str]]) -> int:
+        """Store symbol -> (latest quote, exchange session date) as the closes of those sessions"""
+        return self.store(db, ((symbol, day, close) for symbol, (close, day) in closes.items()))
+
+    def backfill_held(self) -> int:
+        """Backfill the history of every held symbol (a leader job, not a request path)"""
+        db = SessionLocal()
+        try:
+            symbols = [symbol for (symbol,) in db.query(Investment.symbol).distinct()]
+            return self.backfill(db, symbols) if symbols else 0
+        except Exception as e:
+            logger.error(f"Price history backfill failed: {e}")
+            db.rollback()
+            return 0
+        finally:
+            db.close()
+
+    def backfill(self, db: Session, symbols: Sequence[str]) -> int:
+        """Download missing history for ``symbols`` and commit it"""
+        today = date.today()
+        start = self.window_start(today)
+        first_dates = dict(
+            db.query(PriceHistory.symbol, func.min(PriceHistory.date))
+            .filter(PriceHistory.symbol.in_(symbols))
+            .group_by(PriceHistory.symbol)
+            .all()
+        )
+        due_before = (date.fromisoformat(start) + timedelta(days=BACKFILL_SLACK_DAYS)).isoformat()
+        missing = [
+            s for s in symbols
+            if (first_dates.get(s) is None or first_dates[s] > due_before) and self._attempted.get(s) != today
+        ]
+
+        stored = 0
+        for symbol in missing:
+            self._attempted[symbol] = today
+            try:
+                rows = self._download(symbol, start)
+            except UpstreamUnavailable as e:
+                logger.warning(f"No price history for {symbol}: {e}")
+                continue
+            stored += self.store(db, ((symbol, day, close) for day, close in rows or ()))
+        if stored:
+            db.commit()
+            logger.info(f"Backfilled {stored} daily closes for {len(missing)} symbols")
+        return stored
+
+    def _download(self, symbol: str, start: str) -> List[Tuple[str, float]]:
+        def fetch():
+            hist = lazy_import("yfinance").Ticker(symbol).history(start=start, interval="1d")
+            if hist.empty:
+                return []
+            return [(ts.strftime("%Y-%m-%d"), float(close)) for ts, close in hist["Close"].dropna().items()]
+
+        return yahoo.call(f"history:{symbol.upper()}:{start}", fetch, ttl=3600)
+
+    def latest_date(self, db: Session, symbols: Sequence[str]) -> Optional[str]:
+        return db.query(func.max(PriceHistory.date)).filter(PriceHistory.symbol.in_(symbols)).scalar()
+
+    def close_matrix(self, db: Session, symbols: Sequence[str], since: Optional[str] = None):
+        """(dates, closes) with one column per symbol, forward-filled over market holidays
+
+        Dates on which fewer than half of the symbols traded (weekends with
+        only crypto quotes) are dropped, so stock returns are not diluted by
+        zero-return days and crypto weekend moves roll into Monday.
+        """
+        np = lazy_import("numpy")
+        since = since or self.window_start()
+        # One row of arrays per symbol instead of a row per close, dates as day numbers
+        epoch_day = cast(PriceHistory.date, Date) - cast(literal("1970-01-01"), Date)
+        rows = db.connection().execute(
+            select(PriceHistory.symbol, func.array_agg(epoch_day), func.array_agg(PriceHistory.close))
+            .where(PriceHistory.symbol.in_(symbols), PriceHistory.date >= since)
+            .group_by(PriceHistory.symbol)
+        ).all()
+        if not rows:
+            return [], np.empty((0, len(symbols)))
+
+        column = {s: i for i, s in enumerate(symbols)}
+        dates = np.unique(np.concatenate([r[1] for r in rows]))
+        closes = np.full((len(dates), len(symbols)), np.nan)
+        for symbol, days, values in rows:
+            closes[np.searchsorted(dates, days), column[symbol]] = values
+
+        observed = ~np.isnan(closes)
+        active = observed.any(axis=0).sum()
+        keep = observed.sum(axis=1) * 2 >= active
+        dates, closes, observed = dates[keep], closes[keep], observed[keep]
+
+        # Forward fill: index of the last observed row per column
+        last = np.maximum.accumulate(np.where(observed, np.arange(len(dates))[:, None], 0), axis=0)
+        closes = closes[last, np.arange(len(symbols))]
+        return [str(d) for d in dates.astype("datetime64[D]")], closes
+
+    def daily_returns(self, db: Session, symbols: Sequence[str], min_observations: int):
+        """(symbols, log returns) over the longest window where every kept symbol has prices
+
+        Symbols with fewer than ``min_observations`` returns are left out.
+        """
+        np = lazy_import("numpy")
+        _, closes = self.close_matrix(db, symbols)
+        if len(closes) <= min_observations:
+            return [], np.empty((0, 0))
+        first_valid = np.where(np.isnan(closes).all(axis=0), len(closes), np.argmax(~np.isnan(closes), axis=0))
+        kept = np.flatnonzero(first_valid < len(closes) - min_observations)
+        if not len(kept):
+            return [], np.empty((0, 0))
+        window = closes[first_valid[kept].max():, kept]
+        return [symbols[i] for i in kept], np.diff(np.log(window), axis=0)
+
+
+price_history = PriceHistoryService()
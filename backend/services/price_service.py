@@ -1,31 +1,132 @@
 """
 Price Service for fetching real-time stock prices using Yahoo Finance
 """
-import yfinance as yf
 import asyncio
 import logging
-from typing import List, Dict, Any, Optional
+import math
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple
+import requests
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MISSED
 from apscheduler.schedulers.background import BackgroundScheduler
 from sqlalchemy.orm import Session
 from database import SessionLocal
+from startup import lazy_import
+from tracing import tracer
 from models import Investment
+from services.broadcaster import broadcaster
+from services import partitioning
+from services.archive import ARCHIVE_ENABLED, archive_service
+from services.leader_election import LeaderElection
+from services.market_hours import (
+    currency_for_symbol, exchange_for_symbol, is_market_open, last_session_close, normalize_currency,
+)
+from services.price_history import PRICE_HISTORY_BACKFILL_MINUTES, price_history
+from services.symbol_index import SYMBOL_LISTING_URL, symbol_index
+from services.sync_service import prune_tombstones
+from services.upstream import UpstreamNotFound, yahoo
 
 logger = logging.getLogger(__name__)
 
+# How often the scheduler wakes up to look for stale symbols
+PRICE_TICK_MINUTES = int(os.getenv("PRICE_TICK_MINUTES", "5"))
+# Minimum age of a quote before it is refreshed while its market is open
+PRICE_MAX_AGE_MINUTES = int(os.getenv("PRICE_MAX_AGE_MINUTES", "15"))
+# Upper bound of upstream calls made by a single scheduled run
+PRICE_MAX_SYMBOLS_PER_RUN = int(os.getenv("PRICE_MAX_SYMBOLS_PER_RUN", "25"))
+PRICE_JITTER_SECONDS = int(os.getenv("PRICE_JITTER_SECONDS", "30"))
+
 class PriceService:
     def __init__(self):
         self.scheduler = BackgroundScheduler()
+        self.leader = LeaderElection("price_refresher")
+        self._refresh_lock = threading.Lock()
+        self._last_refreshed: Dict[str, datetime] = {}
+        self._run_started_at: Optional[datetime] = None
+        self._stats: Dict[str, Any] = {
+            "runs": 0,
+            "failed_runs": 0,
+            "missed_runs": 0,
+            "skipped_overlapping": 0,
+            "skipped_not_leader": 0,
+            "last_run_started_at": None,
+            "last_run_duration_seconds": None,
+            "last_lag_seconds": None,
+            "max_lag_seconds": 0.0,
+            "last_refreshed_count": 0,
+            "last_due_count": 0,
+            "last_closed_count": 0,
+        }
         
     def start_scheduler(self):
         """Start the price update scheduler"""
-        # Update prices every 15 minutes during trading hours
+        # Wake up regularly, but only refresh symbols that are due - see _select_due_symbols
         self.scheduler.add_job(
             func=self._scheduled_price_update,
             trigger="interval",
-            minutes=15,
+            minutes=PRICE_TICK_MINUTES,
+            jitter=PRICE_JITTER_SECONDS,
+            coalesce=True,
+            max_instances=1,
+            misfire_grace_time=PRICE_TICK_MINUTES * 60,
             id='price_update',
             replace_existing=True
         )
+        self.scheduler.add_job(
+            func=tracer.traced("job.price_history_backfill", kind="job")(self._scheduled_history_backfill),
+            trigger="interval",
+            minutes=PRICE_HISTORY_BACKFILL_MINUTES,
+            next_run_time=datetime.now(),
+            coalesce=True,
+            max_instances=1,
+            id='price_history_backfill',
+            replace_existing=True
+        )
+        if SYMBOL_LISTING_URL:
+            self.scheduler.add_job(
+                func=tracer.traced("job.symbol_listing_refresh", kind="job")(symbol_index.refresh),
+                trigger="interval",
+                hours=24,
+                coalesce=True,
+                max_instances=1,
+                id='symbol_listing_refresh',
+                replace_existing=True
+            )
+        if ARCHIVE_ENABLED:
+            self.scheduler.add_job(
+                func=tracer.traced("job.history_archive", kind="job")(archive_service.scheduled_archive),
+                trigger="interval",
+                hours=24,
+                coalesce=True,
+                max_instances=1,
+                id='history_archive',
+                replace_existing=True
+            )
+        self.scheduler.add_job(
+            func=tracer.traced("job.sync_tombstone_prune", kind="job")(prune_tombstones),
+            trigger="interval",
+            hours=24,
+            coalesce=True,
+            max_instances=1,
+            id='sync_tombstone_prune',
+            replace_existing=True
+        )
+        if partitioning.enabled():
+            self.scheduler.add_job(
+                func=tracer.traced("job.expense_partitions", kind="job")(partitioning.scheduled_ensure_future_partitions),
+                trigger="interval",
+                hours=24,
+                coalesce=True,
+                max_instances=1,
+                id='expense_partitions',
+                replace_existing=True
+            )
+        self.scheduler.add_listener(
+            self._on_job_event, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED
+        )
         self.scheduler.start()
         logger.info("Price update scheduler started")
     
@@ -34,110 +135,239 @@ class PriceService:
         if self.scheduler.running:
             self.scheduler.shutdown()
             logger.info("Price update scheduler stopped")
+        self.leader.release()
     
+    def _scheduled_history_backfill(self):
+        """Download missing daily closes of held symbols - only on the elected worker"""
+        if self.leader.check():
+            price_history.backfill_held()
+
+    @tracer.traced("job.price_update", kind="job")
     def _scheduled_price_update(self):
         """Scheduled price update task"""
-        asyncio.run(self.update_investment_prices())
+        self._run_started_at = datetime.now(timezone.utc)
+        # Only the elected worker talks to the market data providers
+        if not self.leader.check():
+            self._stats["skipped_not_leader"] += 1
+            tracer.current_span().set_attribute("leader", False)
+            return
+        self.refresh_prices(force=False)
+
+    def _on_job_event(self, event):
+        """Record run time and lag of the scheduled job"""
+        if event.job_id != 'price_update':
+            return
+        if event.code == EVENT_JOB_MISSED:
+            self._stats["missed_runs"] += 1
+            return
+        if event.code == EVENT_JOB_ERROR:
+            self._stats["failed_runs"] += 1
+        if self._run_started_at and event.scheduled_run_time:
+            lag = (self._run_started_at - event.scheduled_run_time).total_seconds()
+            self._stats["last_lag_seconds"] = round(lag, 3)
+            self._stats["max_lag_seconds"] = max(self._stats["max_lag_seconds"], round(lag, 3))
+
+    def get_scheduler_stats(self) -> Dict[str, Any]:
+        """Return scheduler run statistics"""
+        job = self.scheduler.get_job('price_update') if self.scheduler.running else None
+        return {
+            **self._stats,
+            "running": self.scheduler.running,
+            "is_leader": self.leader.is_leader,
+            "next_run_time": job.next_run_time.isoformat() if job and job.next_run_time else None,
+            "tracked_symbols": len(self._last_refreshed),
+        }
     
-    async def update_investment_prices(self):
+    async def update_investment_prices(self, force: bool = True):
         """Update prices for all investments in the database"""
+        await asyncio.to_thread(self.refresh_prices, force)
+
+    @tracer.traced("price_service.refresh_prices")
+    def refresh_prices(self, force: bool = False) -> int:
+        """Refresh due symbols, most stale and most valuable first
+
+        With ``force`` every symbol is refreshed regardless of market hours.
+        Concurrent calls are coalesced - a run that finds another one in
+        progress returns immediately.
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            self._stats["skipped_overlapping"] += 1
+            tracer.current_span().set_attribute("skipped_overlapping", True)
+            logger.info("Price refresh already in progress, skipping")
+            return 0
+
+        started = time.perf_counter()
         db = SessionLocal()
         try:
-            investments = db.query(Investment).all()
-            if not investments:
+            positions = self._position_values(db)
+            if not positions:
                 logger.info("No investments found to update")
-                return
-            
-            logger.info(f"Updating prices for {len(investments)} investments...")
-            
+                return 0
+
+            now = datetime.now(timezone.utc)
+            if force:
+                symbols = sorted(positions, key=lambda s: -positions[s])
+                closed = 0
+            else:
+                symbols, closed = self._select_due_symbols(positions, now)
+                symbols = symbols[:PRICE_MAX_SYMBOLS_PER_RUN]
+
+            tracer.current_span().set_attributes(
+                force=force, symbol_count=len(symbols), position_count=len(positions), closed_market_count=closed
+            )
+            logger.info(
+                f"Updating prices for {len(symbols)} of {len(positions)} symbols "
+                f"({closed} in closed markets)..."
+            )
+
             updated_count = 0
-            for investment in investments:
-                try:
-                    ticker = yf.Ticker(investment.symbol)
-                    hist = ticker.history(period="1d")
-                    
-                    if not hist.empty:
-                        current_price = hist['Close'].iloc[-1]
-                        investment.current_price = round(float(current_price), 2)
-                        updated_count += 1
-                        logger.info(f"Updated {investment.symbol}: ${investment.current_price}")
-                    else:
-                        logger.warning(f"No price data found for {investment.symbol}")
-                        
-                except Exception as e:
-                    logger.error(f"Failed to update price for {investment.symbol}: {e}")
-            
+            closes: Dict[str, Tuple[float, str]] = {}
+            for symbol in symbols:
+                quote = self._fetch_price(symbol)
+                if quote is None:
+                    continue
+                price, currency, session_day = quote
+                values = {Investment.current_price: price}
+                if currency:
+                    values[Investment.currency] = currency
+                db.query(Investment).filter(Investment.symbol == symbol).update(
+                    values, synchronize_session=False
+                )
+                self._last_refreshed[symbol] = datetime.now(timezone.utc)
+                closes[symbol] = (price, session_day)
+                updated_count += 1
+                logger.info(f"Updated {symbol}: ${price}")
+
+            # The last quote of a session ends up as that session's close in the history
+            price_history.record_closes(db, closes)
             db.commit()
+            # Stream clients only see prices that are in the database
+            for symbol, (price, _) in closes.items():
+                broadcaster.share(symbol, price, source="yahoo")
+            tracer.current_span().set_attribute("updated_count", updated_count)
+            self._stats.update(
+                runs=self._stats["runs"] + 1,
+                last_run_started_at=now.isoformat(),
+                last_refreshed_count=updated_count,
+                last_due_count=len(symbols),
+                last_closed_count=closed,
+            )
             logger.info(f"Successfully updated {updated_count} investment prices")
-            
+            return updated_count
+
         except Exception as e:
             logger.error(f"Error updating investment prices: {e}")
             db.rollback()
+            return 0
         finally:
             db.close()
+            self._stats["last_run_duration_seconds"] = round(time.perf_counter() - started, 3)
+            self._refresh_lock.release()
+
+    def _position_values(self, db: Session) -> Dict[str, float]:
+        """Return total position value per symbol"""
+        values: Dict[str, float] = {}
+        rows = db.query(
+            Investment.symbol, Investment.quantity, Investment.current_price, Investment.purchase_price
+        ).all()
+        for symbol, quantity, current_price, purchase_price in rows:
+            price = current_price if current_price is not None else purchase_price
+            values[symbol] = values.get(symbol, 0.0) + float(quantity or 0) * float(price or 0)
+        return values
+
+    def _select_due_symbols(self, positions: Dict[str, float], now: datetime):
+        """Pick symbols needing a refresh, ordered by staleness weighted by position value
+
+        Symbols of open markets are due once their quote is older than
+        PRICE_MAX_AGE_MINUTES. Symbols of closed markets are refreshed once
+        after the session close to pick up the closing price, then skipped.
+        """
+        due = []
+        closed = 0
+        for symbol, value in positions.items():
+            exchange = exchange_for_symbol(symbol)
+            last = self._last_refreshed.get(symbol)
+            if is_market_open(exchange, now):
+                if last and (now - last).total_seconds() < PRICE_MAX_AGE_MINUTES * 60:
+                    continue
+            else:
+                closed += 1
+                session_close = last_session_close(exchange, now)
+                if last and (session_close is None or last >= session_close):
+                    continue
+            staleness = (now - last).total_seconds() / 60 if last else math.inf
+            due.append((staleness * math.log10(10 + value), value, symbol))
+
+        due.sort(reverse=True)
+        return [symbol for _, _, symbol in due], closed
+
+    def _fetch_price(self, symbol: str) -> Optional[Tuple[float, Optional[str], str]]:
+        """Fetch the latest close, quote currency and session date of a symbol"""
+        try:
+            # Never write a stale quote back - retry on the next run instead
+            quote = self._latest_quote(symbol, stale=False)
+
+            if quote is None:
+                logger.warning(f"No price data found for {symbol}")
+                return None
+            return round(quote[0], 2), quote[1], quote[2]
+
+        except Exception as e:
+            logger.error(f"Failed to update price for {symbol}: {e}")
+            return None
+
+    def _latest_quote(self, symbol: str, stale: bool = True) -> Optional[Tuple[float, Optional[str], str]]:
+        """Latest close, its currency and the exchange date of its session through the shared Yahoo client"""
+        def fetch():
+            ticker = lazy_import("yfinance").Ticker(symbol)
+            hist = ticker.history(period="1d")
+            if hist.empty:
+                return None
+            currency = normalize_currency((ticker.history_metadata or {}).get("currency")) or currency_for_symbol(symbol)
+            # The bar's own date (exchange time), not today: no weekend or after-midnight closes
+            return float(hist['Close'].iloc[-1]), currency, hist.index[-1].strftime("%Y-%m-%d")
+
+        return yahoo.call(f"quote:{symbol.upper()}", fetch, ttl=60, stale=stale)
+
+    def _latest_close(self, symbol: str) -> Optional[float]:
+        quote = self._latest_quote(symbol)
+        return quote[0] if quote else None
+
+    def _ticker_info(self, symbol: str) -> Dict[str, Any]:
+        """Ticker metadata through the shared Yahoo client"""
+        def fetch():
+            try:
+                info = lazy_import("yfinance").Ticker(symbol).info
+            except requests.HTTPError as e:
+                if e.response is not None and e.response.status_code == 404:
+                    raise UpstreamNotFound(symbol)
+                raise
+            # Unknown symbols come back as (nearly) empty metadata
+            if not info or not (info.get("quoteType") or info.get("shortName") or info.get("longName")):
+                raise UpstreamNotFound(symbol)
+            return info
+
+        return yahoo.call(f"info:{symbol.upper()}", fetch, ttl=3600)
     
-    async def search_symbols(self, query: str) -> List[Dict[str, Any]]:
+    def search_symbols(self, query: str) -> List[Dict[str, Any]]:
         """Search for stock symbols based on query"""
         try:
-            # Use yfinance search functionality
-            # This is a simplified implementation - you might want to use a more robust search API
-            results = []
-            
-            # Try to get ticker info directly
-            try:
-                ticker = yf.Ticker(query.upper())
-                info = ticker.info
-                
-                if info and 'symbol' in info:
-                    results.append({
-                        'symbol': info.get('symbol', query.upper()),
-                        'name': info.get('longName', info.get('shortName', 'Unknown')),
-                        'type': 'stock'
-                    })
-            except:
-                pass
-            
-            # Add some common tickers if query matches
-            common_tickers = {
-                'AAPL': 'Apple Inc.',
-                'GOOGL': 'Alphabet Inc.',
-                'MSFT': 'Microsoft Corporation',
-                'TSLA': 'Tesla, Inc.',
-                'AMZN': 'Amazon.com, Inc.',
-                'META': 'Meta Platforms, Inc.',
-                'NVDA': 'NVIDIA Corporation',
-                'NFLX': 'Netflix, Inc.'
-            }
-            
-            query_upper = query.upper()
-            for symbol, name in common_tickers.items():
-                if query_upper in symbol or query.lower() in name.lower():
-                    if not any(r['symbol'] == symbol for r in results):
-                        results.append({
-                            'symbol': symbol,
-                            'name': name,
-                            'type': 'stock'
-                        })
-            
-            return results[:10]  # Limit to 10 results
+            # Served from the local listing index - no network call per keystroke
+            return [
+                {'symbol': entry['symbol'], 'name': entry['name'], 'type': entry['type']}
+                for entry in symbol_index.search(query, limit=10)
+            ]
             
         except Exception as e:
             logger.error(f"Error searching symbols: {e}")
             return []
     
-    async def get_stock_info(self, symbol: str) -> Optional[Dict[str, Any]]:
+    def get_stock_info(self, symbol: str) -> Optional[Dict[str, Any]]:
         """Get detailed information about a stock"""
         try:
-            ticker = yf.Ticker(symbol)
-            info = ticker.info
-            hist = ticker.history(period="1d")
-            
-            if not info:
-                return None
+            info = self._ticker_info(symbol)
             
-            current_price = None
-            if not hist.empty:
-                current_price = float(hist['Close'].iloc[-1])
+            current_price = self._latest_close(symbol)
             
             return {
                 'symbol': symbol.upper(),
@@ -151,6 +381,11 @@ class PriceService:
                 'industry': info.get('industry')
             }
             
+        except UpstreamNotFound:
+            return None
         except Exception as e:
             logger.error(f"Error getting stock info for {symbol}: {e}")
-            return None
\ No newline at end of file
+            return None
+
+
+price_service = PriceService()
@@ -0,0 +1,382 @@
+"""
+Intent-to-SQL engine for custom questions about the budget
+
+A question such as "ile wydałem na transport w marcu vs luty" is parsed into
+an Intent (entity, metric, periods, category, grouping). Each intent shape is
+compiled once into a parameterized aggregate SELECT and cached; executing it
+binds the period and category parameters, so answering never loads whole
+tables into memory.
+"""
+import re
+import threading
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, case, func, select
+from sqlalchemy.orm import Session
+
+from models import Category, Expense, Income, Investment, SavingsGoal, SavingsTransaction
+from services.archive import archive_service
+from services.symbol_index import normalize
+
+# Longest inflection ending accepted after a category name ("transport" -> "transportem")
+MAX_INFLECTION_SUFFIX = 3
+
+# Word stems (diacritics stripped) -> month number
+MONTH_STEMS = [
+    ("stycz", 1), ("lut", 2), ("marz", 3), ("marc", 3), ("kwie", 4), ("maj", 5),
+    ("czerw", 6), ("lipi", 7), ("lipc", 7), ("sierp", 8), ("wrze", 9),
+    ("pazdzier", 10), ("listopad", 11), ("grud", 12),
+]
+MONTH_LOCATIVE = {
+    1: "w styczniu", 2: "w lutym", 3: "w marcu", 4: "w kwietniu", 5: "w maju", 6: "w czerwcu",
+    7: "w lipcu", 8: "w sierpniu", 9: "we wrześniu", 10: "w październiku", 11: "w listopadzie",
+    12: "w grudniu",
+}
+
+ENTITY_PATTERNS = [
+    ("incomes", r"zarob|przychod|dochod|pensj|wyplat|wplyw"),
+    ("goals", r"\bcel|\boszczednosci\b"),
+    ("savings", r"zaoszcz|oszczedzil|odloz|odklad|wplat\w* na oszcz"),
+    ("investments", r"inwestyc|portfel|akcj|zainwest"),
+    ("expenses", r"wydal|wydat|wydan|wydaj|koszt|zaplac|budzet|przeznacz"),
+]
+METRIC_PATTERNS = [
+    ("count", r"ile razy|ile transakcji|liczb|ilosc|ile wydatkow|ile przychodow|ile pozycji|ile inwestycji"),
+    ("avg", r"sredni|przecietn"),
+    ("max", r"najwiek|najwyz|najdrozs|maksym"),
+    ("min", r"najmniej|najniz|najtans|minim"),
+]
+GROUP_BY_CATEGORY_PATTERN = r"na co\b|kategori|w podziale"
+
+
+@dataclass(frozen=True)
+class Period:
+    start: Optional[str]  # inclusive YYYY-MM-DD
+    end: Optional[str]  # exclusive YYYY-MM-DD
+    label: str
+
+
+@dataclass(frozen=True)
+class Intent:
+    entity: str
+    metric: str
+    periods: Tuple[Period, ...]
+    category_id: Optional[Any] = None
+    category_name: Optional[str] = None
+    group_by_category: bool = False
+
+    @property
+    def plan_key(self) -> Tuple:
+        return (self.entity, self.metric, self.category_id is not None, self.group_by_category)
+
+
+def _month_period(year: int, month: int) -> Period:
+    start = date(year, month, 1)
+    end = date(year + (month == 12), month % 12 + 1, 1)
+    return Period(start.isoformat(), end.isoformat(), f"{MONTH_LOCATIVE[month]} {year}")
+
+
+def _year_period(year: int) -> Period:
+    return Period(f"{year:04d}-01-01", f"{year + 1:04d}-01-01", f"w {year} roku")
+
+
+class QueryEngine:
+    def __init__(self):
+        self._plans: Dict[Tuple, Any] = {}
+        self._plans_lock = threading.Lock()
+        self._categories: List[Tuple[str, Any, str]] = []
+        self._categories_version: Optional[Tuple] = None
+        self._categories_lock = threading.Lock()
+
+    # Parsing
+
+    def parse(self, query: str, db: Session, today: Optional[date] = None) -> Optional[Intent]:
+        """Turn a free-text question into an Intent, or None when not understood"""
+        today = today or date.today()
+        text = normalize(query)
+
+        entity = next((name for name, pattern in ENTITY_PATTERNS if re.search(pattern, text)), None)
+        category = self._match_category(text, db)
+        if entity is None:
+            if category is None:
+                return None
+            entity = "expenses"
+
+        metric = next((name for name, pattern in METRIC_PATTERNS if re.search(pattern, text)), "sum")
+        periods = self._parse_periods(text, today)
+        if not periods:
+            periods = [Period(None, None, "łącznie")]
+
+        use_category = category is not None and entity == "expenses"
+        return Intent(
+            entity=entity,
+            metric=metric,
+            periods=tuple(periods[:2]),
+            category_id=category[1] if use_category else None,
+            category_name=category[2] if use_category else None,
+            group_by_category=entity == "expenses" and not use_category
+            and bool(re.search(GROUP_BY_CATEGORY_PATTERN, text)),
+        )
+
+    def _parse_periods(self, text: str, today: date) -> List[Period]:
+        periods: List[Period] = []
+        this_month = date(today.year, today.month, 1)
+
+        if re.search(r"(w )?(tym|biezacym) miesiac", text):
+            periods.append(_month_period(today.year, today.month))
+        if re.search(r"(zeszl|poprzedni|ubiegl)\w* miesiac", text):
+            prev = this_month - timedelta(days=1)
+            periods.append(_month_period(prev.year, prev.month))
+        if re.search(r"(w )?(tym|biezacym) roku", text):
+            periods.append(_year_period(today.year))
+        if re.search(r"(zeszl|poprzedni|ubiegl)\w* roku", text):
+            periods.append(_year_period(today.year - 1))
+
+        days = re.search(r"ostatni\w* (\d+) dni", text)
+        if days:
+            start = today - timedelta(days=int(days.group(1)))
+            end = today + timedelta(days=1)
+            periods.append(Period(start.isoformat(), end.isoformat(), f"w ostatnich {days.group(1)} dniach"))
+        elif re.search(r"\bdzis|\bdzisiaj", text):
+            periods.append(Period(today.isoformat(), (today + timedelta(days=1)).isoformat(), "dzisiaj"))
+
+        years = [int(y) for y in re.findall(r"\b(20\d\d)\b", text)]
+        months: List[int] = []
+        for word in re.findall(r"[a-z]+", text):
+            for stem, month in MONTH_STEMS:
+                if word.startswith(stem) and (stem != "maj" or word in ("maj", "maja", "maju")):
+                    months.append(month)
+                    break
+
+        month_periods = []
+        for i, month in enumerate(months):
+            if i < len(years):
+                year = years[i]
+            elif years:
+                year = years[-1]
+            else:
+                # Most recent such month that is not in the future
+                year = today.year if month <= today.month else today.year - 1
+            month_periods.append(_month_period(year, month))
+        if len(month_periods) >= 2 and re.search(r"\bod\b.*\bdo\b", text):
+            # "od stycznia do marca" is one range; otherwise two periods are compared
+            first, last = month_periods[0], month_periods[-1]
+            last_day = date.fromisoformat(last.end) - timedelta(days=1)
+            month_periods = [Period(first.start, last.end, f"od {first.start} do {last_day.isoformat()}")]
+        periods.extend(month_periods)
+        if not months:
+            periods.extend(_year_period(year) for year in years)
+
+        return periods
+
+    def _load_categories(self, db: Session) -> List[Tuple[str, Any, str]]:
+        """Normalized category names, reloaded when a category is added, edited or removed"""
+        version = tuple(db.execute(select(func.count(Category.id), func.max(Category.updated_at))).one())
+        with self._categories_lock:
+            if version != self._categories_version:
+                rows = db.execute(select(Category.id, Category.name)).all()
+                # Most specific first: "jedzenie na miescie" before "jedzenie"
+                self._categories = sorted(
+                    ((normalize(name), id_, name) for id_, name in rows), key=lambda c: -len(c[0])
+                )
+                self._categories_version = version
+            return self._categories
+
+    @staticmethod
+    def _inflection_of(word: str, name: str) -> bool:
+        """Whether ``word`` is ``name`` or an inflected form of it ("transportu", "zdrowiu")
+
+        The stem is the name without its last two letters, and the word may
+        only add a short ending, so "Dom" does not match "domowe".
+        """
+        if word == name:
+            return True
+        stem = name[:len(name) - 2]
+        return (
+            len(stem) >= 4
+            and word.startswith(stem)
+            and len(word) - len(name) <= MAX_INFLECTION_SUFFIX
+            and len(word) >= len(stem) + 1
+        )
+
+    def _match_category(self, text: str, db: Session) -> Optional[Tuple[str, Any, str]]:
+        words = re.findall(r"[a-z0-9]+", text)
+        for name_norm, id_, name in self._load_categories(db):
+            name_words = re.findall(r"[a-z0-9]+", name_norm)
+            if not name_words:
+                continue
+            # Every word of the name in order, inflected ones included
+            n = len(name_words)
+            for start in range(len(words) - n + 1):
+                if all(self._inflection_of(words[start + k], name_words[k]) for k in range(n)):
+                    return name_norm, id_, name
+        return None
+
+    # Compilation
+
+    def compile(self, intent: Intent):
+        """Build (or reuse) the parameterized aggregate statement for an intent shape"""
+        key = intent.plan_key
+        plan = self._plans.get(key)
+        if plan is None:
+            with self._plans_lock:
+                plan = self._plans.get(key) or self._build_plan(intent)
+                self._plans[key] = plan
+        return plan
+
+    def _build_plan(self, intent: Intent):
+        start, end = bindparam("start"), bindparam("end")
+
+        if intent.entity == "goals":
+            return select(
+                func.count(SavingsGoal.id),
+                func.coalesce(func.sum(case((SavingsGoal.is_completed.is_(True), 1), else_=0)), 0),
+            )
+
+        if intent.entity == "investments":
+            model = Investment
+            value = Investment.quantity * Investment.purchase_price
+            date_column = Investment.purchase_date
+        else:
+            model = {"expenses": Expense, "incomes": Income, "savings": SavingsTransaction}[intent.entity]
+            value = model.amount
+            date_column = model.date
+
+        aggregate = {
+            "sum": func.coalesce(func.sum(value), 0),
+            "count": func.coalesce(func.sum(value), 0),  # the row count is always selected
+            "avg": func.avg(value),
+            "max": func.max(value),
+            "min": func.min(value),
+        }[intent.metric]
+
+        if intent.group_by_category:
+            stmt = (
+                select(Category.name, aggregate, func.count())
+                .select_from(Expense)
+                .join(Category, Category.id == Expense.category_id)
+                .group_by(Category.name)
+                .order_by(aggregate.desc())
+            )
+        else:
+            stmt = select(aggregate, func.count()).select_from(model)
+
+        stmt = stmt.where(
+            (start.is_(None)) | (date_column >= start),
+            (end.is_(None)) | (date_column < end),
+        )
+        if intent.category_id is not None:
+            stmt = stmt.where(Expense.category_id == bindparam("category_id"))
+        return stmt
+
+    # Execution
+
+    def execute(self, intent: Intent, db: Session) -> List[Any]:
+        plan = self.compile(intent)
+        results = []
+        for period in intent.periods:
+            params = {"start": period.start, "end": period.end}
+            if intent.category_id is not None:
+                params["category_id"] = intent.category_id
+            if intent.entity == "goals":
+                results.append(db.execute(plan).one())
+            elif intent.group_by_category:
+                results.append(db.execute(plan, params).all())
+            else:
+                results.append(self._with_archive(intent, period, db.execute(plan, params).one()))
+        return results
+
+    @staticmethod
+    def _with_archive(intent: Intent, period: Period, row):
+        """Add expenses that were moved to the Parquet archive"""
+        if intent.entity != "expenses" or intent.metric not in ("sum", "count"):
+            return row
+        if period.start is not None and period.start >= archive_service.cutoff():
+            return row
+        date_to = None
+        if period.end is not None:
+            date_to = (date.fromisoformat(period.end) - timedelta(days=1)).isoformat()
+        archived_sum, archived_count = archive_service.aggregate(
+            "expenses", period.start, date_to, category_id=intent.category_id
+        )
+        if not archived_count:
+            return row
+        value, count = row
+        return float(value or 0) + archived_sum, count + archived_count
+
+    def answer(self, query: str, db: Session) -> Optional[str]:
+        """Answer a question in Polish, or None when it is not understood"""
+        intent = self.parse(query, db)
+        if intent is None:
+            return None
+        return self._render(intent, self.execute(intent, db))
+
+    # Rendering
+
+    def _render(self, intent: Intent, results: List[Any]) -> str:
+        if intent.entity == "goals":
+            total, completed = results[0]
+            if not total:
+                return "Nie masz jeszcze celów oszczędnościowych. Rozważ ich utworzenie."
+            return f"Masz {total} celów oszczędnościowych, z czego {completed} zostało osiągniętych."
+
+        subject = {
+            "expenses": "Wydatki",
+            "incomes": "Przychody",
+            "savings": "Wpłaty na oszczędności",
+            "investments": "Zakupy inwestycji",
+        }[intent.entity]
+        if intent.category_name:
+            subject += f" na {intent.category_name}"
+
+        if intent.group_by_category:
+            lines = []
+            for period, rows in zip(intent.periods, results):
+                if not rows:
+                    lines.append(f"Brak wydatków {period.label}.")
+                    continue
+                parts = ", ".join(f"{name}: {self._format(intent, value, count)}" for name, value, count in rows)
+                lines.append(f"{subject} {period.label} według kategorii: {parts}.")
+            return " ".join(lines)
+
+        if intent.periods[0].start is None and intent.category_id is None and intent.metric == "sum":
+            # Plain "portfel" / "wydatki" questions keep their overview answers
+            total, count = results[0]
+            if intent.entity == "investments":
+                if not count:
+                    return "Nie masz jeszcze żadnych inwestycji. Rozważ rozpoczęcie inwestowania."
+                return f"Masz {count} pozycji inwestycyjnych w portfelu. Czy chcesz przeprowadzić szczegółową analizę?"
+            if intent.entity == "expenses" and not count:
+                return "Nie masz jeszcze żadnych wydatków do analizy."
+
+        values = []
+        lines = []
+        for period, (value, count) in zip(intent.periods, results):
+            values.append(count if intent.metric == "count" else float(value or 0))
+            lines.append(f"{period.label}: {self._format(intent, value, count)}")
+
+        answer = f"{subject} " + ", ".join(lines) + "."
+        if len(values) == 2:
+            diff = values[0] - values[1]
+            change = f" ({diff / values[1] * 100:+.1f}%)" if values[1] else ""
+            if intent.metric == "count":
+                answer += f" Różnica: {diff:+d}{change}."
+            else:
+                answer += f" Różnica: {diff:+,.2f} zł{change}.".replace(",", " ")
+        return answer
+
+    @staticmethod
+    def _format(intent: Intent, value: Any, count: int) -> str:
+        if intent.metric == "count":
+            return f"{count} pozycji"
+        if value is None:
+            return "brak danych"
+        amount = f"{float(value):,.2f} zł".replace(",", " ")
+        if intent.metric == "sum":
+            return f"{amount} ({count} pozycji)"
+        return amount
+
+
+query_engine = QueryEngine()
@@ -0,0 +1,229 @@
+"""
+Local in-memory symbol search index (prefix trie + trigram fuzzy matching)
+"""
+import csv
+import logging
+import os
+import re
+import tempfile
+import threading
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from services.leader_election import LeaderElection
+
+logger = logging.getLogger(__name__)
+
+SYMBOL_LISTING_FILE = os.getenv(
+    "SYMBOL_LISTING_FILE",
+    str(Path(__file__).resolve().parent.parent / "data" / "symbols.csv"),
+)
+# Optional CSV (symbol,name,type,exchange) downloaded daily into SYMBOL_LISTING_DIR
+SYMBOL_LISTING_URL = os.getenv("SYMBOL_LISTING_URL")
+# Runtime copy of the downloaded listing; the bundled SYMBOL_LISTING_FILE is never overwritten
+SYMBOL_LISTING_DIR = os.getenv(
+    "SYMBOL_LISTING_DIR",
+    str(Path(__file__).resolve().parent.parent / "data" / "listings"),
+)
+
+MAX_IDS_PER_NODE = 64
+MIN_FUZZY_SIMILARITY = 0.5
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase and strip diacritics (Żabka -> zabka)"""
+    text = unicodedata.normalize("NFKD", text.replace("ł", "l").replace("Ł", "L"))
+    return "".join(ch for ch in text if not unicodedata.combining(ch)).lower().strip()
+
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _TrieNode:
+    __slots__ = ("children", "ids")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.ids: List[int] = []
+
+
+class _IndexState:
+    """Immutable snapshot swapped in atomically on reload"""
+
+    def __init__(self, entries: List[Dict[str, Any]]):
+        self.entries = entries
+        self.symbol_trie = _TrieNode()
+        self.name_trie = _TrieNode()
+        self.grams: Dict[str, List[int]] = {}
+
+        for idx, entry in enumerate(entries):
+            symbol = normalize(entry["symbol"])
+            base = symbol.split(".")[0]
+            name = normalize(entry["name"])
+            for key in {symbol, base}:
+                self._insert(self.symbol_trie, key, idx)
+            for word in set(_WORD_RE.findall(name)):
+                self._insert(self.name_trie, word, idx)
+
+            entry_grams = trigrams(symbol) | trigrams(name)
+            for word in _WORD_RE.findall(name):
+                entry_grams |= trigrams(word)
+            for gram in entry_grams:
+                self.grams.setdefault(gram, []).append(idx)
+
+        # Keep the most relevant ids per node - short symbols first
+        rank = [(len(e["symbol"]), e["symbol"]) for e in entries]
+        for root in (self.symbol_trie, self.name_trie):
+            stack = [root]
+            while stack:
+                node = stack.pop()
+                node.ids = sorted(set(node.ids), key=rank.__getitem__)[:MAX_IDS_PER_NODE]
+                stack.extend(node.children.values())
+
+    @staticmethod
+    def _insert(root: _TrieNode, key: str, idx: int):
+        node = root
+        for ch in key:
+            node = node.children.setdefault(ch, _TrieNode())
+            node.ids.append(idx)
+
+    @staticmethod
+    def prefix(root: _TrieNode, key: str) -> List[int]:
+        node = root
+        for ch in key:
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        return node.ids
+
+
+class SymbolIndex:
+    def __init__(self, path: str = SYMBOL_LISTING_FILE, download_dir: str = SYMBOL_LISTING_DIR):
+        self.path = path
+        self.downloaded_path = os.path.join(download_dir, "symbols.csv")
+        self.leader = LeaderElection("symbol_listing")
+        self._state: Optional[_IndexState] = None
+        self._loaded_mtime: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._state is not None
+
+    def _default_path(self) -> str:
+        if SYMBOL_LISTING_URL and os.path.exists(self.downloaded_path):
+            return self.downloaded_path
+        return self.path
+
+    def load(self, path: Optional[str] = None):
+        """(Re)build the index from a listing CSV, the last download if there is one"""
+        path = path or self._default_path()
+        with open(path, newline="", encoding="utf-8") as f:
+            entries = [
+                {
+                    "symbol": row["symbol"].strip().upper(),
+                    "name": row["name"].strip(),
+                    "type": (row.get("type") or "stock").strip(),
+                    "exchange": (row.get("exchange") or "").strip(),
+                }
+                for row in csv.DictReader(f)
+                if row.get("symbol")
+            ]
+        self._state = _IndexState(entries)
+        self._loaded_mtime = os.path.getmtime(path)
+        logger.info(f"Symbol index loaded with {len(entries)} symbols")
+
+    def refresh(self):
+        """Download the listing from SYMBOL_LISTING_URL and reload
+
+        Only the leader downloads; other workers pick up its file once it
+        changes.
+        """
+        if not SYMBOL_LISTING_URL:
+            return
+        if not self.leader.check():
+            self._reload_if_changed()
+            return
+        import requests
+
+        with self._lock:
+            tmp_path = None
+            try:
+                res = requests.get(SYMBOL_LISTING_URL, timeout=30)
+                res.raise_for_status()
+                os.makedirs(os.path.dirname(self.downloaded_path), exist_ok=True)
+                with tempfile.NamedTemporaryFile(
+                    dir=os.path.dirname(self.downloaded_path), suffix=".csv", delete=False
+                ) as f:
+                    tmp_path = f.name
+                    f.write(res.content)
+                self.load(tmp_path)
+                os.replace(tmp_path, self.downloaded_path)
+                tmp_path = None
+            except Exception as e:
+                logger.error(f"Failed to refresh symbol listing: {e}")
+            finally:
+                if tmp_path is not None:
+                    os.unlink(tmp_path)
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.path.getmtime(self.downloaded_path)
+        except OSError:
+            return
+        if mtime != self._loaded_mtime:
+            with self._lock:
+                self.load(self.downloaded_path)
+
+    def search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Rank symbols by exact, prefix, company-name and fuzzy matches"""
+        if self._state is None:
+            self.load()
+        state = self._state
+        q = normalize(query)
+        if not q:
+            return []
+
+        scores: Dict[int, float] = {}
+
+        def score(idx: int, value: float):
+            if value > scores.get(idx, 0):
+                scores[idx] = value
+
+        for idx in state.prefix(state.symbol_trie, q):
+            symbol = normalize(state.entries[idx]["symbol"])
+            exact = symbol == q or symbol.split(".")[0] == q
+            score(idx, 1000 if exact else 800 - len(symbol))
+
+        words = _WORD_RE.findall(q)
+        if words:
+            matched = None
+            for word in words:
+                ids = set(state.prefix(state.name_trie, word))
+                matched = ids if matched is None else matched & ids
+            for idx in matched or ():
+                name = normalize(state.entries[idx]["name"])
+                score(idx, 600 if name.startswith(q) else 500)
+
+        if len(scores) < limit:
+            query_grams = trigrams(q)
+            common = Counter()
+            for gram in query_grams:
+                common.update(state.grams.get(gram, ()))
+            for idx, shared in common.items():
+                # Share of the query found in the entry, so long names aren't penalised
+                similarity = shared / len(query_grams)
+                if similarity >= MIN_FUZZY_SIMILARITY:
+                    score(idx, 300 * similarity)
+
+        ranked = sorted(scores, key=lambda i: (-scores[i], len(state.entries[i]["symbol"])))
+        return [dict(state.entries[i]) for i in ranked[:limit]]
+
+
+symbol_index = SymbolIndex()
@@ -0,0 +1,128 @@
+"""
+Delta sync: rows changed or deleted since a client's cursor
+
+Every synced table has an indexed ``updated_at`` and deletions leave a row in
+``tombstones``, so a sync is one indexed range scan per table. The cursor is
+a commit horizon taken before the scan: the start of the oldest transaction
+that was writing on the primary at that moment (rows it commits later carry
+an ``updated_at`` after it), capped at the last replayed commit when reading
+from a replica, and moved back by a small overlap for clock skew between
+app and database. Clients upsert by id, so seeing a row twice is harmless.
+"""
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import String, cast, delete, select, text
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, engine
+from models import Category, Expense, Income, Investment, SavingsGoal, Tombstone
+from projection import fetch_rows
+from schemas import (
+    Category as CategorySchema,
+    Expense as ExpenseSchema,
+    Income as IncomeSchema,
+    Investment as InvestmentSchema,
+    SavingsGoal as SavingsGoalSchema,
+    SyncResponse,
+)
+
+logger = logging.getLogger(__name__)
+
+SYNC_OVERLAP_SECONDS = float(os.getenv("SYNC_OVERLAP_SECONDS", "5"))
+# Clients whose cursor is older than this get a full snapshot instead of a delta
+SYNC_TOMBSTONE_DAYS = int(os.getenv("SYNC_TOMBSTONE_DAYS", "90"))
+
+# Response field -> (model, schema)
+SYNC_RESOURCES = {
+    "categories": (Category, CategorySchema),
+    "incomes": (Income, IncomeSchema),
+    "expenses": (Expense, ExpenseSchema),
+    "investments": (Investment, InvestmentSchema),
+    "savings_goals": (SavingsGoal, SavingsGoalSchema),
+}
+
+
+def encode_cursor(moment: datetime) -> str:
+    return moment.isoformat()
+
+
+def decode_cursor(cursor: str) -> datetime:
+    try:
+        moment = datetime.fromisoformat(cursor)
+    except ValueError:
+        raise ValueError(f"Invalid sync cursor: {cursor}")
+    # Cursors are naive UTC like updated_at - an offset means it was not issued by us
+    if moment.tzinfo is not None:
+        raise ValueError(f"Invalid sync cursor: {cursor}")
+    return moment
+
+
+# Start of the oldest transaction holding a write on this database, or now (naive UTC)
+_PRIMARY_HORIZON_SQL = text(
+    "SELECT least(now(), min(xact_start)) AT TIME ZONE 'UTC' FROM pg_stat_activity "
+    "WHERE datname = current_database() AND backend_xid IS NOT NULL"
+)
+# Commit time of the last replayed transaction on a replica, NULL on the primary
+_REPLAY_HORIZON_SQL = text(
+    "SELECT CASE WHEN pg_is_in_recovery() THEN pg_last_xact_replay_timestamp() AT TIME ZONE 'UTC' END"
+)
+
+
+def commit_horizon(db: Session) -> datetime:
+    """Moment before which every change visible to ``db`` is committed"""
+    if engine.dialect.name != "postgresql":
+        return datetime.utcnow()
+    # Writers run on the primary even when this sync reads from a replica
+    with engine.connect() as conn:
+        horizon = conn.execute(_PRIMARY_HORIZON_SQL).scalar()
+    replayed = db.execute(_REPLAY_HORIZON_SQL).scalar()
+    if replayed is not None:
+        horizon = min(horizon, replayed)
+    return horizon
+
+
+def changes_since(db: Session, since: Optional[str] = None, now: Optional[datetime] = None) -> bytes:
+    """SyncResponse JSON with rows changed and ids deleted since ``since`` (a full snapshot when None)"""
+    after = decode_cursor(since) if since else None
+    # Taken before the scan - anything committed after it is picked up by the next sync
+    now = now or commit_horizon(db)
+    reset = after is not None and after < now - timedelta(days=SYNC_TOMBSTONE_DAYS)
+    if reset:
+        # Tombstones this old may have been pruned - start over from a snapshot
+        after = None
+
+    changes, deleted = {}, {}
+    for name, (model, schema) in SYNC_RESOURCES.items():
+        criteria = [model.updated_at >= after] if after is not None else []
+        changes[name] = fetch_rows(db, model, list(schema.model_fields), *criteria)
+        if after is None:
+            deleted[name] = []
+        else:
+            deleted[name] = db.connection().execute(
+                select(cast(Tombstone.record_id, String)).distinct()
+                .where(Tombstone.resource == model.__tablename__, Tombstone.deleted_at >= after)
+            ).scalars().all()
+
+    cursor = encode_cursor(now - timedelta(seconds=SYNC_OVERLAP_SECONDS))
+    response = SyncResponse.model_validate({"cursor": cursor, "reset": reset, "changes": changes, "deleted": deleted})
+    counts = {name: len(rows) for name, rows in changes.items()}
+    logger.info(f"Sync since {since or 'start'}: {counts}, {sum(len(d) for d in deleted.values())} deletions")
+    return response.model_dump_json(by_alias=True).encode()
+
+
+def prune_tombstones():
+    """Drop tombstones older than the sync horizon"""
+    db = SessionLocal()
+    try:
+        horizon = datetime.utcnow() - timedelta(days=SYNC_TOMBSTONE_DAYS)
+        removed = db.execute(delete(Tombstone).where(Tombstone.deleted_at < horizon)).rowcount
+        db.commit()
+        if removed:
+            logger.info(f"Pruned {removed} sync tombstones")
+    except Exception as e:
+        logger.error(f"Tombstone pruning failed: {e}")
+    finally:
+        db.close()
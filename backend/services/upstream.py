@@ -0,0 +1,235 @@
+"""
+Shared client layer for upstream market data providers (Yahoo Finance, Binance)
+
+Every provider call goes through an UpstreamClient which
+- coalesces identical in-flight calls (singleflight),
+- enforces a token-bucket rate limit per provider,
+- fails fast through a circuit breaker while the provider is down,
+- serves the last good (stale) value when the provider cannot be reached.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamUnavailable(Exception):
+    """Raised when a provider cannot be called and no stale value exists"""
+
+
+class UpstreamNotFound(Exception):
+    """Raised by a call function when the provider answered but has nothing for the key
+
+    (e.g. an unknown symbol). It reaches the caller as is and does not count
+    against the provider's circuit breaker.
+    """
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float) -> bool:
+        """Take a token, waiting at most ``timeout`` seconds"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go through - only one trial call while half open"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def cancel_trial(self):
+        """Give back the trial slot of a call that was allowed but never made"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        # Why the result is a stale cached value, None when it is fresh
+        self.stale_reason: Optional[str] = None
+
+
+class UpstreamClient:
+    def __init__(self, name: str, rate: float, burst: float, failure_threshold: int = 5,
+                 reset_timeout: float = 30.0, rate_limit_wait: float = 5.0, cache_size: int = 4096):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.rate_limit_wait = rate_limit_wait
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._in_flight: Dict[str, _InFlight] = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            "calls": 0,
+            "cache_hits": 0,
+            "coalesced": 0,
+            "stale_served": 0,
+            "rate_limited": 0,
+            "short_circuited": 0,
+            "failures": 0,
+        }
+
+    def call(self, key: str, fn: Callable[[], Any], ttl: float = 0, stale: bool = True) -> Any:
+        """Return ``fn()`` for ``key``, reusing a cached value younger than ``ttl`` seconds
+
+        Exceptions raised by ``fn`` count as provider failures, except
+        UpstreamNotFound which is passed on. If the call cannot be made or
+        fails, the last good value for ``key`` is returned (unless ``stale``
+        is False), or UpstreamUnavailable is raised.
+        """
+        # Only the endpoint part of the key ("quote", "account", ...) - keys may name accounts
+        attributes = {"upstream.provider": self.name, "upstream.endpoint": key.split(":", 1)[0]}
+        with tracer.span(f"upstream.{self.name}", kind="client", root=False, **attributes) as span:
+            with self._lock:
+                cached = self._cache.get(key)
+                if cached is not None and ttl > 0 and time.monotonic() - cached[1] < ttl:
+                    self.stats["cache_hits"] += 1
+                    span.set_attribute("cache_hit", True)
+                    return cached[0]
+                flight = self._in_flight.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._in_flight[key] = _InFlight()
+                else:
+                    self.stats["coalesced"] += 1
+            span.set_attributes(cache_hit=False, coalesced=not leader)
+
+            if not leader:
+                flight.done.wait()
+                if isinstance(flight.error, UpstreamUnavailable) and stale:
+                    # The leader refused stale values, this caller accepts them
+                    return self._stale(key, str(flight.error), stale)
+                if flight.error is not None:
+                    raise flight.error
+                if flight.stale_reason is not None and not stale:
+                    raise UpstreamUnavailable(f"{self.name} unavailable ({flight.stale_reason})")
+                return flight.result
+
+            try:
+                flight.result = self._execute(key, fn, stale, flight)
+            except BaseException as e:
+                flight.error = e
+                raise
+            finally:
+                with self._lock:
+                    self._in_flight.pop(key, None)
+                flight.done.set()
+            return flight.result
+
+    def _execute(self, key: str, fn: Callable[[], Any], stale: bool, flight: _InFlight) -> Any:
+        if not self.breaker.allow():
+            self.stats["short_circuited"] += 1
+            flight.stale_reason = "circuit open"
+            return self._stale(key, flight.stale_reason, stale)
+        if not self.bucket.acquire(self.rate_limit_wait):
+            self.breaker.cancel_trial()
+            self.stats["rate_limited"] += 1
+            flight.stale_reason = "rate limited"
+            return self._stale(key, flight.stale_reason, stale)
+
+        self.stats["calls"] += 1
+        try:
+            result = fn()
+        except UpstreamNotFound:
+            self.breaker.record_success()
+            raise
+        except Exception as e:
+            self.stats["failures"] += 1
+            self.breaker.record_failure()
+            logger.warning(f"{self.name} call {key} failed: {e}")
+            flight.stale_reason = str(e)
+            return self._stale(key, flight.stale_reason, stale)
+
+        self.breaker.record_success()
+        with self._lock:
+            self._cache[key] = (result, time.monotonic())
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def _stale(self, key: str, reason: str, allowed: bool) -> Any:
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached is None or not allowed:
+            raise UpstreamUnavailable(f"{self.name} unavailable ({reason})")
+        self.stats["stale_served"] += 1
+        tracer.current_span().set_attributes(stale=True, stale_reason=reason)
+        return cached[0]
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "circuit": self.breaker.state,
+            "cached_keys": len(self._cache),
+            **self.stats,
+        }
+
+
+yahoo = UpstreamClient(
+    "yahoo",
+    rate=float(os.getenv("YAHOO_RATE_PER_SECOND", "2")),
+    burst=float(os.getenv("YAHOO_BURST", "5")),
+)
+binance = UpstreamClient(
+    "binance",
+    rate=float(os.getenv("BINANCE_RATE_PER_SECOND", "10")),
+    burst=float(os.getenv("BINANCE_BURST", "20")),
+)
@@ -0,0 +1,77 @@
+"""
+Vectorized multi-currency portfolio valuation
+"""
+from typing import Any, Dict
+
+from sqlalchemy.orm import Session
+
+from models import Investment
+from services.fx_service import fx_service
+from services.market_hours import currency_for_symbol
+from startup import lazy_import
+
+
+def value_portfolio(db: Session, base: str = "PLN") -> Dict[str, Any]:
+    """Value every position in ``base`` currency with one conversion pass"""
+    np = lazy_import("numpy")
+    base = base.upper()
+    rows = db.query(
+        Investment.id,
+        Investment.symbol,
+        Investment.name,
+        Investment.type,
+        Investment.quantity,
+        Investment.purchase_price,
+        Investment.current_price,
+        Investment.currency,
+    ).all()
+
+    if not rows:
+        return {
+            "base": base,
+            "total_value": 0.0,
+            "total_cost": 0.0,
+            "total_profit_loss": 0.0,
+            "return_percentage": 0.0,
+            "by_currency": {},
+            "positions": [],
+        }
+
+    quantity = np.array([float(r.quantity) for r in rows])
+    purchase = np.array([float(r.purchase_price) for r in rows])
+    current = np.array([np.nan if r.current_price is None else float(r.current_price) for r in rows])
+    price = np.where(np.isnan(current), purchase, current)
+    currencies = [r.currency or currency_for_symbol(r.symbol) or "USD" for r in rows]
+
+    fx = fx_service.conversion_vector(currencies, base)
+    value = quantity * price * fx
+    cost = quantity * purchase * fx
+    profit_loss = value - cost
+
+    codes, inverse = np.unique(currencies, return_inverse=True)
+    value_by_currency = np.bincount(inverse, weights=value, minlength=len(codes))
+
+    total_value = float(value.sum())
+    total_cost = float(cost.sum())
+    return {
+        "base": base,
+        "total_value": total_value,
+        "total_cost": total_cost,
+        "total_profit_loss": total_value - total_cost,
+        "return_percentage": (total_value - total_cost) / total_cost * 100 if total_cost > 0 else 0.0,
+        "by_currency": {str(c): float(v) for c, v in zip(codes, value_by_currency)},
+        "positions": [
+            {
+                "id": str(r.id),
+                "symbol": r.symbol,
+                "name": r.name,
+                "type": r.type,
+                "currency": currencies[i],
+                "fx_rate": float(fx[i]),
+                "value": float(value[i]),
+                "cost": float(cost[i]),
+                "profit_loss": float(profit_loss[i]),
+            }
+            for i, r in enumerate(rows)
+        ],
+    }
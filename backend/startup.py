@@ -0,0 +1,40 @@
+"""
+Startup phase timings, readiness state and deferred heavy imports
+"""
+import importlib
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+# Accept traffic before the first price refresh has finished
+FAST_STARTUP = os.getenv("FAST_STARTUP", "0") == "1"
+
+timings: Dict[str, float] = {}
+state: Dict[str, Any] = {"ready": False, "first_price_refresh": "pending"}
+
+
+@contextmanager
+def phase(name: str):
+    """Time a startup phase"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round(time.perf_counter() - started, 4)
+        logger.info(f"Startup phase {name} took {timings[name]:.3f}s")
+
+
+def lazy_import(module_name: str):
+    """Import a heavy module on first use and record how long it took"""
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    timings[f"import:{module_name}"] = round(time.perf_counter() - started, 4)
+    return module
@@ -0,0 +1,296 @@
+"""
+Lightweight structured tracing: request, SQL, upstream and scheduler job spans
+
+With TRACING_ENABLED=1 every HTTP request is a root span (or continues the
+trace of an incoming W3C ``traceparent`` header), SQL statements executed
+while a span is active become child spans through SQLAlchemy cursor events,
+and upstream calls and scheduler jobs open their own spans. The current span
+lives in a context variable, so it follows handlers into the threadpool.
+
+Finished spans are batched by a background thread and appended as JSON lines
+to TRACE_FILE, or POSTed to TRACE_COLLECTOR_URL when one is set. When tracing is off,
+``tracer.span`` hands out a shared no-op span.
+"""
+import functools
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "0") == "1"
+TRACE_FILE = os.getenv("TRACE_FILE", str(Path(__file__).resolve().parent / "data" / "traces" / "spans.jsonl"))
+# Optional HTTP endpoint receiving {"spans": [...]} batches
+TRACE_COLLECTOR_URL = os.getenv("TRACE_COLLECTOR_URL", "")
+# The span file is rotated to <file>.1 past this size
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(50 * 1024 * 1024)))
+TRACE_SQL_MAX_LENGTH = 1000
+TRACE_FLUSH_SECONDS = 1.0
+TRACE_QUEUE_SIZE = 10000
+
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns",
+                 "attributes", "status", "error")
+
+    def __init__(self, name: str, kind: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes: Any):
+        self.attributes.update(attributes)
+
+    def record_error(self, error: BaseException):
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}"[:500]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    trace_id = None
+    span_id = None
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, **attributes: Any):
+        pass
+
+    def record_error(self, error: BaseException):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    def __init__(self, enabled: bool = TRACING_ENABLED):
+        self.enabled = enabled
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+        self._exporter: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.stats = {"exported": 0, "dropped": 0, "export_errors": 0}
+
+    def current_span(self):
+        return _current_span.get() or NOOP_SPAN
+
+    def start_span(self, name: str, kind: str = "internal", parent: Optional[Span] = None,
+                   trace_id: Optional[str] = None, parent_id: Optional[str] = None, **attributes: Any) -> Span:
+        """A started span that is not made current - finish it with ``end_span``"""
+        parent = parent or _current_span.get()
+        if parent is not None:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        return Span(name, kind, trace_id or os.urandom(16).hex(), parent_id, attributes)
+
+    def end_span(self, span: Span):
+        span.end_ns = time.time_ns()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", root: bool = True, **attributes: Any):
+        """Run a block inside a child of the current span
+
+        With ``root=False`` nothing is recorded unless a span is already active,
+        so frequent background work does not start traces of its own.
+        """
+        if not self.enabled or (not root and _current_span.get() is None):
+            yield NOOP_SPAN
+            return
+        span = self.start_span(name, kind, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end_span(span)
+
+    def traced(self, name: str, kind: str = "internal"):
+        """Decorator running the function inside a span"""
+        def decorator(fn: Callable):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name, kind):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def start(self):
+        """Start the exporter thread"""
+        if not self.enabled or self._exporter is not None:
+            return
+        self._stop.clear()
+        self._exporter = threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True)
+        self._exporter.start()
+        logger.info(f"Tracing enabled, exporting to {TRACE_COLLECTOR_URL or TRACE_FILE}")
+
+    def stop(self):
+        if self._exporter is None:
+            return
+        self._stop.set()
+        self._exporter.join(timeout=5)
+        self._exporter = None
+
+    def _export_loop(self):
+        while True:
+            stopping = self._stop.wait(TRACE_FLUSH_SECONDS)
+            batch: List[Dict[str, Any]] = []
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait().to_dict())
+                except queue.Empty:
+                    break
+            if batch:
+                self._export(batch)
+            if stopping:
+                return
+
+    def _export(self, batch: List[Dict[str, Any]]):
+        try:
+            if TRACE_COLLECTOR_URL:
+                requests.post(TRACE_COLLECTOR_URL, json={"spans": batch}, timeout=5).raise_for_status()
+            else:
+                path = Path(TRACE_FILE)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                if path.exists() and path.stat().st_size > TRACE_MAX_BYTES:
+                    os.replace(path, path.with_name(path.name + ".1"))
+                with open(path, "a") as f:
+                    f.writelines(json.dumps(span, default=str) + "\n" for span in batch)
+            self.stats["exported"] += len(batch)
+        except Exception as e:
+            self.stats["export_errors"] += 1
+            logger.warning(f"Failed to export {len(batch)} spans: {e}")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "destination": TRACE_COLLECTOR_URL or TRACE_FILE,
+            "queued": self._queue.qsize(),
+            **self.stats,
+        }
+
+
+tracer = Tracer()
+
+
+def instrument_sqlalchemy():
+    """Child span per SQL statement executed while a span is active"""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    @event.listens_for(Engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _current_span.get() is None:
+            return
+        context._trace_span = tracer.start_span(
+            "db.query",
+            kind="client",
+            **{
+                "db.system": conn.dialect.name,
+                "db.operation": statement.lstrip().split(" ", 1)[0].upper(),
+                "db.statement": statement[:TRACE_SQL_MAX_LENGTH],
+                "db.executemany": executemany,
+            },
+        )
+
+    @event.listens_for(Engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        span = getattr(context, "_trace_span", None)
+        if span is not None:
+            span.set_attribute("db.rows", cursor.rowcount)
+            tracer.end_span(span)
+            context._trace_span = None
+
+    @event.listens_for(Engine, "handle_error")
+    def _error(exception_context):
+        context = exception_context.execution_context
+        span = getattr(context, "_trace_span", None) if context is not None else None
+        if span is not None:
+            span.record_error(exception_context.original_exception)
+            tracer.end_span(span)
+            context._trace_span = None
+
+
+class TracingMiddleware:
+    """ASGI middleware opening the root span of every HTTP request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not tracer.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace_id = parent_id = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                match = _TRACEPARENT_RE.match(value.decode("latin-1"))
+                if match:
+                    trace_id, parent_id = match.groups()
+                break
+
+        with tracer.span(
+            f"{scope['method']} {scope['path']}",
+            kind="server",
+            trace_id=trace_id,
+            parent_id=parent_id,
+            **{"http.method": scope["method"], "http.target": scope["path"]},
+        ) as span:
+            async def send_with_trace(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"traceparent", f"00-{span.trace_id}-{span.span_id}-01".encode())
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_with_trace)
+            # Name the span after the matched route template rather than the raw path
+            route = scope.get("route")
+            if route is not None and getattr(route, "path", None):
+                span.name = f"{scope['method']} {route.path}"
+                span.set_attribute("http.route", route.path)
@@ -0,0 +1,65 @@
+import { useEffect } from "react";
+import { useQueryClient } from "@tanstack/react-query";
+import { apiUrl } from "@/lib/api";
+import type { Investment } from "../types";
+
+export interface PriceEvent {
+  symbol: string;
+  price: number;
+  source: string;
+  ts: number;
+  change_24h?: number;
+}
+
+interface CryptoBalance {
+  asset: string;
+  quantity: number;
+  price: number;
+  value: number;
+  pnl_24h: number;
+  price_pln: number;
+  value_pln: number;
+  pnl_24h_pln: number;
+}
+
+// Subskrypcja strumienia cen (SSE) – aktualizuje dane w cache React Query zamiast odpytywania
+export function usePriceStream(symbols?: string[]) {
+  const queryClient = useQueryClient();
+  const key = symbols?.join(",") ?? "";
+
+  useEffect(() => {
+    const query = key ? `?symbols=${encodeURIComponent(key)}` : "";
+    const source = new EventSource(apiUrl(`/api/stream/prices${query}`));
+
+    source.addEventListener("price", (message) => {
+      const event: PriceEvent = JSON.parse((message as MessageEvent).data);
+
+      queryClient.setQueryData<Investment[]>(["/api/investments"], (investments) =>
+        investments?.map((inv) =>
+          inv.symbol.toUpperCase() === event.symbol ? { ...inv, currentPrice: event.price.toFixed(2) } : inv,
+        ),
+      );
+
+      queryClient.setQueryData<{ balances: CryptoBalance[]; usdt_pln: number }>(["/api/crypto/binance"], (data) => {
+        if (!data) return data;
+        const balances = data.balances.map((b) => {
+          if (`${b.asset}USDT` !== event.symbol) return b;
+          const value = b.quantity * event.price;
+          const pnl24h = event.change_24h !== undefined ? event.change_24h * b.quantity : b.pnl_24h;
+          return {
+            ...b,
+            price: event.price,
+            value,
+            pnl_24h: pnl24h,
+            price_pln: event.price * data.usdt_pln,
+            value_pln: value * data.usdt_pln,
+            pnl_24h_pln: pnl24h * data.usdt_pln,
+          };
+        });
+        return { ...data, balances };
+      });
+    });
+
+    return () => source.close();
+  }, [key, queryClient]);
+}
@@ -6,3 +6,22 @@ export function apiUrl(path: string) {
   }
   return `${API_BASE}${path}`;
 }
+
+// Czas ostatniego zapisu podany przez serwer (nagłówek X-Last-Write).
+// Odsyłany przy kolejnych żądaniach, aby odczyty tuż po zapisie trafiały
+// do bazy głównej zamiast do repliki, która może być jeszcze opóźniona.
+const LAST_WRITE_HEADER = 'X-Last-Write';
+let lastWrite: string | null = null;
+
+export async function apiFetch(path: string, init: RequestInit = {}): Promise<Response> {
+  const headers = new Headers(init.headers);
+  if (lastWrite) {
+    headers.set(LAST_WRITE_HEADER, lastWrite);
+  }
+  const res = await fetch(apiUrl(path), { ...init, headers });
+  const written = res.headers.get(LAST_WRITE_HEADER);
+  if (written) {
+    lastWrite = written;
+  }
+  return res;
+}
@@ -1,5 +1,5 @@
 import { QueryClient, QueryFunction } from '@tanstack/react-query';
-import { apiUrl } from './api';
+import { apiFetch } from './api';
 
 async function throwIfNotOk(res: Response) {
   if (!res.ok) {
@@ -10,11 +10,12 @@ async function throwIfNotOk(res: Response) {
 
 // Pomocniczy klient API – opakowanie fetch z rzucaniem błędów
 export async function apiRequest(method: string, url: string, data?: unknown): Promise<Response> {
-  const res = await fetch(apiUrl(url), {
+  const res = await apiFetch(url, {
     method,
     headers: data ? { 'Content-Type': 'application/json' } : {},
     body: data ? JSON.stringify(data) : undefined,
     // Nie dołączaj ciasteczek domyślnie – umożliwia to działanie przy CORS z "*"
+    // (odczyt po zapisie zapewnia nagłówek X-Last-Write, zob. apiFetch).
     // Jeśli w przyszłości potrzebne będzie uwierzytelnianie przez cookies,
     // można dodać "credentials: 'include'" lub przekazać opcje jako parametr.
   });
@@ -24,7 +25,7 @@ export async function apiRequest(method: string, url: string, data?: unknown): P
 
 // Domyślna funkcja zapytania dla React Query (GET)
 const defaultQueryFn: QueryFunction = async ({ queryKey }) => {
-  const res = await fetch(apiUrl(queryKey.join('/') as string));
+  const res = await apiFetch(queryKey.join('/') as string);
   if (res.status === 401) {
     // Obsługa braku autoryzacji - można rozszerzyć
     return Promise.reject(new Error('Unauthorized'));
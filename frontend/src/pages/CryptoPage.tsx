@@ -3,6 +3,7 @@ import { useQuery } from '@tanstack/react-query';
 import { Card, CardHeader, CardTitle, CardContent } from '@/components/ui/card';
 import CandlestickChart from '@/components/crypto/candlestick-chart';
 import ProfitLossHistoryChart from '@/components/crypto/pnl-chart';
+import { usePriceStream } from '@/hooks/usePriceStream';
 
 interface BinanceBalance {
   asset: string;
@@ -29,6 +30,8 @@ export default function CryptoPage() {
   });
 
   const [selectedAsset, setSelectedAsset] = useState<string | undefined>();
+  // USDT is the quote asset itself - there is no USDTUSDT pair to stream
+  usePriceStream(data?.balances.filter(b => b.asset !== 'USDT').map(b => `${b.asset}USDT`));
 
   const { data: klinesData } = useQuery<{ klines: Kline[] }>({
     queryKey: ['/api/crypto/binance/klines', selectedAsset ? `${selectedAsset}USDT` : ''],
@@ -1,7 +1,8 @@
 import { useState } from 'react';
 import { useQuery, useMutation } from '@tanstack/react-query';
-import { apiUrl } from '@/lib/api';
+import { apiFetch } from '@/lib/api';
 import { useBudget } from '../hooks/useBudget';
+import { usePriceStream } from '../hooks/usePriceStream';
 import { Card, CardHeader, CardTitle, CardContent } from '../components/ui/card';
 import { Button } from '../components/ui/button';
 import { Dialog, DialogTrigger, DialogContent, DialogHeader, DialogTitle } from '../components/ui/dialog';
@@ -28,11 +29,12 @@ export default function InvestmentsPage() {
   const { data: profitLossData } = useQuery<{ totalProfitLoss: number }>({ queryKey: ['/api/portfolio/profit-loss'] });
   const { data: investmentSales = [] } = useQuery<InvestmentSale[]>({ queryKey: ['/api/investment-sales'] });
   const { deleteInvestment } = useBudget();
+  usePriceStream(investments.map((inv) => inv.symbol));
 
   // Mutacja sprzedaży inwestycji
   const sellInvestmentMutation = useMutation({
     mutationFn: async ({ id, quantitySold, salePrice }: { id: string; quantitySold: number; salePrice: number }) => {
-      await fetch(apiUrl(`/api/investments/${id}/sell`), {
+      await apiFetch(`/api/investments/${id}/sell`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ quantitySold, salePrice }),
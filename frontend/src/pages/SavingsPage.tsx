@@ -2,7 +2,7 @@ import { useState } from 'react';
 import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query';
 import { useForm } from 'react-hook-form';
 import { zodResolver } from '@hookform/resolvers/zod';
-import { apiUrl } from '@/lib/api';
+import { apiFetch } from '@/lib/api';
 import { Card, CardHeader, CardTitle, CardContent } from '../components/ui/card';
 import { Progress } from '../components/ui/progress';
 import { Button } from '../components/ui/button';
@@ -49,7 +49,7 @@ export default function SavingsPage() {
         category: data.category,
         color: data.color,
       };
-      await fetch(apiUrl('/api/savings-goals'), {
+      await apiFetch('/api/savings-goals', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(payload),
@@ -65,7 +65,7 @@ export default function SavingsPage() {
   // Mutacja dodawania oszczędności do wybranego celu
   const addSavingsMutation = useMutation({
     mutationFn: async ({ id, amount }: { id: string; amount: number }) => {
-      await fetch(apiUrl(`/api/savings-goals/${id}/add`), {
+      await apiFetch(`/api/savings-goals/${id}/add`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ amount }),
@@ -83,7 +83,7 @@ export default function SavingsPage() {
   // Mutacja usuwania celu
   const deleteGoalMutation = useMutation({
     mutationFn: async (id: string) => {
-      await fetch(apiUrl(`/api/savings-goals/${id}`), { method: 'DELETE' });
+      await apiFetch(`/api/savings-goals/${id}`, { method: 'DELETE' });
     },
     onSuccess: () => {
       queryClient.invalidateQueries(['/api/savings-goals']);